@@ -3,14 +3,24 @@ FastAPI web service for the GenBI system.
 Provides REST API endpoints for schema indexing and SQL generation.
 """
 
-import json
+import asyncio
+import base64
+import gzip
+import hashlib
 import logging
+import time
 from contextlib import asynccontextmanager
-from typing import Dict
+from datetime import timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Set
 
+import orjson
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from pydantic_core import to_jsonable_python
 
 from models import (
     IndexingRequest, 
@@ -23,7 +33,6 @@ from models import (
     MySQLDiscoveryResponse,
     AskRequest,
     AskResponse,
-    QueryExecutionResult,
     DatabaseListResponse,
     AddInstructionRequest,
     AddSQLPairRequest,
@@ -31,10 +40,14 @@ from models import (
 )
 from pipelines.indexing import SchemaIndexer
 from pipelines.generation import SQLGenerator
+from pipelines.ask import AskPipeline, AskError
 from services.mysql_discovery import MySQLSchemaDiscovery
 from services.query_executor import MySQLQueryExecutor
 from services.credentials_store import credentials_store
 from services.knowledge_base import knowledge_base_store
+from services.semantic_cache import SemanticCache
+from services.reasoning_cache import ReasoningCache
+from services import llm_http
 from config import settings
 
 # Configure logging
@@ -44,30 +57,294 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def _orjson_default(obj: Any) -> Any:
+    """
+    Serialize values orjson doesn't handle natively: pydantic models and the
+    MySQL result types the executor leaves as they are (TIME, SET, Decimal...).
+    
+    Anything else raises TypeError, so serialization bugs surface instead of
+    reaching clients as repr-like strings.
+    """
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, timedelta):
+        # ISO 8601 duration, as pydantic renders it
+        return to_jsonable_python(obj)
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode('utf-8', errors='replace')
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response serialized with orjson (C implementation, renders bytes directly)."""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
 # Global instances
 indexer: SchemaIndexer = None
 generator: SQLGenerator = None
 mysql_discovery: MySQLSchemaDiscovery = None
 query_executor: MySQLQueryExecutor = None
+semantic_cache: SemanticCache = None
+reasoning_cache: ReasoningCache = None
+ask_pipeline: AskPipeline = None
+
+# Pre-encoded SSE framing for the streaming endpoint
+_SSE_EVENT_TYPES = (
+    "status", "reasoning_start", "reasoning_chunk", "reasoning_complete",
+    "sql_chunk", "sql_generated", "sql_fixed", "sql_success", "sql_error",
+    "explanation_chunk", "explanation_complete", "answer_chunk", "answer_complete", "complete", "complete_z", "error"
+)
+_SSE_PREFIXES = {event_type: f"event: {event_type}\ndata: ".encode() for event_type in _SSE_EVENT_TYPES}
+_SSE_SUFFIX = b"\n\n"
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # Disable nginx buffering
+    "Content-Encoding": "identity"  # Keep GZip from buffering SSE chunks
+}
+
+
+def _sse_event(event_type: str, data: dict) -> bytes:
+    """Frame a server-sent event."""
+    return _SSE_PREFIXES[event_type] + orjson.dumps(data, default=_orjson_default) + _SSE_SUFFIX
+
+
+def _error_frame(message: str) -> bytes:
+    """Frame an SSE error event."""
+    return _SSE_PREFIXES["error"] + orjson.dumps({"message": message}) + _SSE_SUFFIX
+
+
+# Complete events larger than this are sent gzipped (SSE bypasses the GZip middleware)
+_SSE_COMPRESS_MIN_BYTES = 4096
+
+
+def _complete_frame(payload: dict) -> bytes:
+    """
+    Frame the final ask result.
+    
+    Result rows are sent column by column ("rows_by_col", in "columns" order)
+    instead of as one dict per row. Large payloads are gzipped and sent
+    base64-encoded as a JSON string in a "complete_z" event.
+    """
+    execution_result = payload.get("execution_result")
+    if execution_result and execution_result.get("rows") is not None:
+        rows = execution_result["rows"]
+        execution_result = {k: v for k, v in execution_result.items() if k != "rows"}
+        execution_result["rows_by_col"] = [
+            [row.get(column) for row in rows] for column in execution_result.get("columns") or []
+        ]
+        payload = {**payload, "execution_result": execution_result}
+    
+    body = orjson.dumps(payload, default=_orjson_default)
+    if len(body) < _SSE_COMPRESS_MIN_BYTES:
+        return _SSE_PREFIXES["complete"] + body + _SSE_SUFFIX
+    
+    compressed = base64.b64encode(gzip.compress(body, compresslevel=5))
+    return _SSE_PREFIXES["complete_z"] + b'"' + compressed + b'"' + _SSE_SUFFIX
+
+
+# Frames buffered per SSE client; when full the producer waits for the client to catch up
+_SSE_QUEUE_SIZE = 64
+
+
+async def _coalesce_frames(frames):
+    """
+    Batch SSE frames that are produced back-to-back into a single write.
+    
+    The frames are produced in a separate task; whenever it blocks (waiting on
+    the LLM or the database) everything produced so far is sent as one chunk.
+    The queue between them is bounded, so a slow client pauses the producer
+    instead of letting frames pile up.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=_SSE_QUEUE_SIZE)
+    
+    async def produce():
+        try:
+            async for frame in frames:
+                if queue.full():
+                    logger.debug("SSE client is not keeping up, %s frames queued", queue.qsize())
+                await queue.put(frame)
+        except asyncio.CancelledError:
+            raise  # The consumer is gone, nobody waits for the end marker
+        except Exception:
+            await queue.put(None)
+            raise
+        await queue.put(None)
+    
+    task = asyncio.create_task(produce())
+    try:
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            
+            finished = batch[-1] is None
+            if finished:
+                batch.pop()
+            if batch:
+                yield b"".join(batch)
+            if finished:
+                break
+        
+        await task
+    finally:
+        task.cancel()
+
+
+# Frames a shared stream keeps for subscribers joining late; a run that
+# produced more is no longer joined, identical requests start their own
+_SSE_REPLAY_FRAMES = 256
+
+
+class _SharedStream:
+    """
+    One /ask/stream pipeline run shared by identical concurrent requests.
+    
+    The run is driven by its own task, so it finishes even if every client
+    disconnects. Each subscriber reads from its own bounded queue and the run
+    waits for the slowest one, so a slow client applies backpressure instead of
+    frames piling up. The first frames are also kept, so subscribers joining
+    early replay the stream from the start.
+    """
+    
+    def __init__(self, frames):
+        self.history: Optional[List[bytes]] = []
+        self.finished = False
+        self._subscribers: Set[asyncio.Queue] = set()
+        self.task = asyncio.create_task(self._run(frames))
+    
+    @property
+    def joinable(self) -> bool:
+        """Whether a new subscriber can still replay the whole stream."""
+        return self.history is not None
+    
+    async def _run(self, frames):
+        try:
+            async for frame in frames:
+                if self.history is not None:
+                    self.history.append(frame)
+                    if len(self.history) > _SSE_REPLAY_FRAMES:
+                        self.history = None
+                await self._publish(frame)
+        finally:
+            self.finished = True
+            await self._publish(None)
+    
+    async def _publish(self, frame: Optional[bytes]):
+        """Hand a frame (None: end of stream) to every subscriber, waiting while one's queue is full."""
+        for queue in list(self._subscribers):
+            if queue in self._subscribers:
+                await queue.put(frame)
+    
+    async def subscribe(self):
+        """Yield every frame of the run, waiting for new ones until it finishes."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=_SSE_QUEUE_SIZE)
+        # Registered together with the replay snapshot, so no frame is missed or repeated
+        replay = list(self.history or ())
+        finished = self.finished
+        self._subscribers.add(queue)
+        try:
+            for frame in replay:
+                yield frame
+            if finished:
+                return
+            while True:
+                frame = await queue.get()
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            self._subscribers.discard(queue)
+            # Wake the run if it is waiting to put into this queue
+            while not queue.empty():
+                queue.get_nowait()
+
+
+# In-flight /ask pipelines, keyed on request, so identical concurrent requests share one run
+_inflight_asks: Dict[str, asyncio.Task] = {}
+_inflight_streams: Dict[str, _SharedStream] = {}
+
+
+def _ask_key(request: AskRequest) -> str:
+    """Key identical ask requests share their in-flight run on."""
+    question_hash = hashlib.blake2b(request.question.encode(), digest_size=16).hexdigest()
+    return f"{request.database_id}:{question_hash}:{request.max_rows}"
+
+
+async def _warm_up():
+    """
+    Open the LLM and embedding connections before the first request.
+    
+    Failures are logged but never prevent startup.
+    """
+    async def timed(name: str, coro):
+        start = time.perf_counter()
+        try:
+            await coro
+            logger.info("Warm-up %s took %.0fms", name, (time.perf_counter() - start) * 1000)
+        except Exception as e:
+            logger.warning("Warm-up %s failed: %s", name, e)
+    
+    await asyncio.gather(
+        timed("embeddings", indexer.embeddings.aembed_query("warmup")),
+        timed("llm", generator.llm.bind(max_tokens=1).ainvoke("ping"))
+    )
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize and cleanup resources."""
-    global indexer, generator, mysql_discovery, query_executor
+    global indexer, generator, mysql_discovery, query_executor, semantic_cache, reasoning_cache, ask_pipeline
     
     # Startup
     logger.info("Initializing GenBI service...")
     indexer = SchemaIndexer()
+    num_indexes = indexer.load_all_indexes()
+    logger.info("Loaded %s schema indexes", num_indexes)
     generator = SQLGenerator(indexer)
-    mysql_discovery = MySQLSchemaDiscovery(indexer)
-    query_executor = MySQLQueryExecutor()
+    query_executor = MySQLQueryExecutor(
+        pool_size=settings.mysql_pool_size,
+        max_pools=settings.mysql_max_pools,
+        pool_timeout=settings.mysql_pool_timeout
+    )
+    mysql_discovery = MySQLSchemaDiscovery(indexer, query_executor, cache_ttl=settings.schema_discovery_cache_ttl)
+    if settings.semantic_cache_enabled:
+        semantic_cache = SemanticCache(
+            indexer.embeddings,
+            threshold=settings.semantic_cache_threshold,
+            min_threshold=settings.semantic_cache_min_threshold,
+            target_hit_rate=settings.semantic_cache_target_hit_rate,
+            ttl=settings.semantic_cache_ttl,
+            max_entries=settings.semantic_cache_max_entries
+        )
+        # Plans are matched on the semantic cache's question embeddings
+        if settings.reasoning_cache_enabled:
+            reasoning_cache = ReasoningCache(
+                threshold=settings.reasoning_cache_threshold,
+                ttl=settings.reasoning_cache_ttl
+            )
+    ask_pipeline = AskPipeline(generator, query_executor, credentials_store, semantic_cache, reasoning_cache)
+    if settings.prefetch_credentials:
+        logger.info("Prefetched credentials for %s databases", credentials_store.prefetch())
+    if settings.startup_warmup:
+        await _warm_up()
+    generator.start_keepalive()
     logger.info("GenBI service initialized successfully")
     
     yield
     
     # Shutdown
     logger.info("Shutting down GenBI service...")
+    await generator.stop_keepalive()
+    query_executor.close()
+    await llm_http.close_clients()
 
 
 # Create FastAPI app
@@ -75,7 +352,8 @@ app = FastAPI(
     title="GenBI API",
     description="Simplified Text-to-SQL Backend",
     version="0.1.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -87,6 +365,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses (schemas, query results); small ones like /health are left as-is
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+
+async def _invalidate_caches(database_id: str):
+    """Drop cached schema context and SQL results after a database's index or knowledge base changed."""
+    await ask_pipeline.invalidate(database_id)
+
 
 @app.get("/")
 async def root():
@@ -107,6 +393,15 @@ async def health():
     }
 
 
+@app.get("/api/v1/cache/stats")
+async def cache_stats():
+    """Hit/miss counters of the semantic SQL cache and the reasoning cache (None when disabled)."""
+    return {
+        "semantic_cache": semantic_cache.stats() if semantic_cache else None,
+        "reasoning_cache": reasoning_cache.stats() if reasoning_cache else None
+    }
+
+
 @app.post("/api/v1/query", response_model=SQLResult)
 async def generate_sql(request: QueryRequest):
     """
@@ -118,16 +413,30 @@ async def generate_sql(request: QueryRequest):
     3. Provides an explanation of the generated query
     """
     try:
-        logger.info(f"Received query request: {request.query_id}")
-        result = await generator.generate_sql(request)
+        logger.info("Received query request: %s", request.query_id)
+        
+        question_embedding, cached_result = await ask_pipeline.get_cached_sql(request.database_id, request.question)
+        if cached_result:
+            cached_result.query_id = request.query_id
+            cached_result.metadata = {**(cached_result.metadata or {}), "cache_hit": True}
+            return ORJSONResponse(cached_result)
+        
+        cached_reasoning = ask_pipeline.get_cached_reasoning(request.database_id, question_embedding)
+        result = await generator.generate_sql(request, reasoning=cached_reasoning)
         
         if result.status == QueryStatus.FAILED:
             raise HTTPException(status_code=500, detail=result.error)
         
-        return result
+        if question_embedding is not None:
+            await asyncio.to_thread(semantic_cache.put, request.database_id, request.question, question_embedding, result)
+            if (result.metadata or {}).get("source") == "llm" and not cached_reasoning:
+                ask_pipeline.remember_reasoning(request.database_id, question_embedding, result.reasoning)
+        
+        # Results are built from validated values, so skip response model re-validation
+        return ORJSONResponse(result)
         
     except Exception as e:
-        logger.error(f"Error in generate_sql endpoint: {str(e)}")
+        logger.error("Error in generate_sql endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -142,7 +451,7 @@ async def list_databases():
         databases = credentials_store.list_databases()
         return DatabaseListResponse(databases=databases)
     except Exception as e:
-        logger.error(f"Error listing databases: {str(e)}")
+        logger.error("Error listing databases: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -156,7 +465,7 @@ async def delete_database(database_id: str):
     2. Delete the vector store index
     """
     try:
-        logger.info(f"Deleting database: {database_id}")
+        logger.info("Deleting database: %s", database_id)
         
         # Check if database exists
         if not credentials_store.database_exists(database_id):
@@ -165,14 +474,16 @@ async def delete_database(database_id: str):
         # Delete credentials
         creds_deleted = credentials_store.delete_credentials(database_id)
         if not creds_deleted:
-            logger.warning(f"Failed to delete credentials for {database_id}")
+            logger.warning("Failed to delete credentials for %s", database_id)
         
         # Delete vector store index
-        index_deleted = indexer.delete_index(database_id)
+        index_deleted = await indexer.delete_index(database_id)
         if not index_deleted:
-            logger.warning(f"Failed to delete index for {database_id}")
+            logger.warning("Failed to delete index for %s", database_id)
         
-        logger.info(f"Successfully deleted database: {database_id}")
+        await _invalidate_caches(database_id)
+        
+        logger.info("Successfully deleted database: %s", database_id)
         return {
             "success": True,
             "message": f"Database '{database_id}' deleted successfully",
@@ -183,7 +494,7 @@ async def delete_database(database_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error deleting database: {str(e)}")
+        logger.error("Error deleting database: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -200,8 +511,9 @@ async def discover_mysql_tables(credentials: MySQLCredentials):
     The user can then select which tables to index.
     """
     try:
-        logger.info(f"Discovering tables in MySQL database: {credentials.database}")
-        result = mysql_discovery.discover_tables(credentials)
+        logger.info("Discovering tables in MySQL database: %s", credentials.database)
+        # Schema discovery is blocking MySQL I/O - keep it off the event loop
+        result = await asyncio.to_thread(mysql_discovery.discover_tables, credentials)
         
         from models import TableInfo
         tables = [
@@ -221,7 +533,7 @@ async def discover_mysql_tables(credentials: MySQLCredentials):
         )
         
     except Exception as e:
-        logger.error(f"Error in discover_mysql_tables endpoint: {str(e)}")
+        logger.error("Error in discover_mysql_tables endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -239,12 +551,14 @@ async def auto_index_mysql(request: MySQLAutoIndexRequest):
     No need to manually provide schema - it's discovered automatically!
     """
     try:
-        logger.info(f"Auto-indexing MySQL database: {request.database_id}")
+        logger.info("Auto-indexing MySQL database: %s", request.database_id)
         result = await mysql_discovery.discover_and_index(request)
         
         if result.status == "failed":
             raise HTTPException(status_code=500, detail=result.error)
         
+        await _invalidate_caches(request.database_id)
+        
         # Store credentials and selected tables after successful indexing
         credentials_store.store_credentials(
             database_id=request.database_id,
@@ -256,17 +570,17 @@ async def auto_index_mysql(request: MySQLAutoIndexRequest):
             selected_tables=request.selected_tables
         )
         
-        logger.info(f"Successfully auto-indexed {result.num_tables} tables from MySQL and stored credentials")
+        logger.info("Successfully auto-indexed %s tables from MySQL and stored credentials", result.num_tables)
         return result
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error in auto_index_mysql endpoint: {str(e)}")
+        logger.error("Error in auto_index_mysql endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/v1/databases/{database_id}/schema")
+@app.get("/api/v1/databases/{database_id}/schema", response_model=None)
 async def get_database_schema(database_id: str):
     """
     Get complete database schema with tables, columns, comments, and relationships.
@@ -278,7 +592,7 @@ async def get_database_schema(database_id: str):
     - Primary keys
     """
     try:
-        logger.info(f"Fetching schema for database: {database_id}")
+        logger.info("Fetching schema for database: %s", database_id)
         
         # Retrieve credentials and selected tables
         credentials_dict = credentials_store.get_credentials(database_id)
@@ -300,17 +614,17 @@ async def get_database_schema(database_id: str):
         # Get selected tables (tables that were indexed)
         selected_tables = credentials_dict.get('selected_tables')
         
-        # Get schema from mysql_discovery
-        schema = mysql_discovery._extract_schema(credentials, include_views=False)
+        # Get schema from mysql_discovery (blocking MySQL I/O, run in a worker thread)
+        schema = await asyncio.to_thread(mysql_discovery._extract_schema, credentials, include_views=False)
         
         # Filter tables to only show indexed ones
         if selected_tables:
             filtered_tables = [table for table in schema.tables if table.name in selected_tables]
-            logger.info(f"Filtered to {len(filtered_tables)} indexed tables out of {len(schema.tables)} total")
+            logger.info("Filtered to %s indexed tables out of %s total", len(filtered_tables), len(schema.tables))
         else:
             # If no selected_tables info, show all (backward compatibility)
             filtered_tables = schema.tables
-            logger.info(f"No selected_tables info found, showing all {len(filtered_tables)} tables")
+            logger.info("No selected_tables info found, showing all %s tables", len(filtered_tables))
         
         # Filter relationships to only include those between indexed tables
         filtered_relationships = []
@@ -353,13 +667,14 @@ async def get_database_schema(database_id: str):
             ]
         }
         
-        logger.info(f"Retrieved schema with {len(filtered_tables)} indexed tables and {len(filtered_relationships)} relationships")
-        return response
+        logger.info("Retrieved schema with %s indexed tables and %s relationships", len(filtered_tables), len(filtered_relationships))
+        # Plain dict of JSON types: render it directly instead of running jsonable_encoder over it
+        return ORJSONResponse(response)
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error fetching database schema: {str(e)}")
+        logger.error("Error fetching database schema: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -374,7 +689,7 @@ async def reindex_database(database_id: str):
     3. Re-discovers and re-indexes the same tables
     """
     try:
-        logger.info(f"Re-indexing database: {database_id}")
+        logger.info("Re-indexing database: %s", database_id)
         
         # Retrieve credentials and selected tables
         credentials_dict = credentials_store.get_credentials(database_id)
@@ -395,11 +710,11 @@ async def reindex_database(database_id: str):
         
         selected_tables = credentials_dict.get('selected_tables')
         
-        logger.info(f"Found credentials for {database_id}, selected tables: {selected_tables}")
+        logger.info("Found credentials for %s, selected tables: %s", database_id, selected_tables)
         
         # Delete old index
-        indexer.delete_index(database_id)
-        logger.info(f"Deleted old index for {database_id}")
+        await indexer.delete_index(database_id)
+        logger.info("Deleted old index for %s", database_id)
         
         # Create re-index request
         reindex_request = MySQLAutoIndexRequest(
@@ -411,17 +726,19 @@ async def reindex_database(database_id: str):
         
         # Re-index
         result = await mysql_discovery.discover_and_index(reindex_request)
+        # After the new index is written, so nothing cached from the old one survives
+        await _invalidate_caches(database_id)
         
         if result.status == "failed":
             raise HTTPException(status_code=500, detail=result.error)
         
-        logger.info(f"Successfully re-indexed {result.num_tables} tables for {database_id}")
+        logger.info("Successfully re-indexed %s tables for %s", result.num_tables, database_id)
         return result
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error re-indexing database: {str(e)}")
+        logger.error("Error re-indexing database: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -437,188 +754,40 @@ async def ask_question(request: AskRequest):
     4. Formats results as a table
     5. Generates natural language explanation of the results
     
+    Identical requests arriving while one is already being processed wait for
+    that run instead of starting their own.
+    
     Returns everything in one response!
     """
+    key = _ask_key(request)
+    
+    task = _inflight_asks.get(key)
+    if task is None:
+        task = asyncio.create_task(_answer_question(request))
+        _inflight_asks[key] = task
+        task.add_done_callback(lambda _: _inflight_asks.pop(key, None))
+    else:
+        logger.info("Joining in-flight ask request for database: %s", request.database_id)
+    
+    # Shield the shared run so a disconnecting client doesn't cancel it for the others
+    return ORJSONResponse(await asyncio.shield(task))
+
+
+async def _answer_question(request: AskRequest) -> Dict[str, Any]:
+    """Run the ask pipeline and return the serialized AskResponse."""
     try:
-        logger.info(f"Processing ask request for database: {request.database_id}")
-        
-        # Step 1: Retrieve credentials from store
-        credentials_dict = credentials_store.get_credentials(request.database_id)
-        if not credentials_dict:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Database '{request.database_id}' not found. Please index it first using /api/v1/mysql/auto-index"
-            )
-        
-        # Convert dict to MySQLCredentials object
-        credentials = MySQLCredentials(
-            host=credentials_dict['host'],
-            port=credentials_dict['port'],
-            user=credentials_dict['user'],
-            password=credentials_dict['password'],
-            database=credentials_dict['database']
-        )
-        
-        # Step 2: Generate SQL
-        from models import QueryRequest
-        query_request = QueryRequest(
-            question=request.question,
-            database_id=request.database_id
-        )
-        
-        sql_result = await generator.generate_sql(query_request)
-        
-        if sql_result.status == QueryStatus.FAILED:
-            raise HTTPException(
-                status_code=500, 
-                detail=f"SQL generation failed: {sql_result.error}"
-            )
-        
-        logger.info(f"Generated SQL: {sql_result.sql}")
-        
-        # Step 3: Execute SQL query with auto-fix on error (max 5 attempts)
-        max_fix_attempts = 5
-        current_sql = sql_result.sql
-        execution_result = None
-        previous_attempts = []
-        
-        for attempt in range(1, max_fix_attempts + 1):
-            logger.info(f"Executing SQL (attempt {attempt}/{max_fix_attempts})")
-            
-            execution_result = query_executor.execute_query(
-                credentials=credentials,
-                sql=current_sql or "",
-                max_rows=request.max_rows
-            )
-            
-            # Success! Break the loop
-            if execution_result.success:
-                if attempt > 1:
-                    logger.info(f"✅ SQL fixed successfully after {attempt} attempts")
-                    # Update the sql_result with the fixed SQL
-                    sql_result.sql = current_sql
-                break
-            
-            # Error occurred
-            logger.warning(f"❌ Attempt {attempt} failed: {execution_result.error}")
-            
-            # If this was the last attempt, stop trying
-            if attempt >= max_fix_attempts:
-                logger.error(f"Max fix attempts ({max_fix_attempts}) reached. Giving up.")
-                break
-            
-            # Record this failed attempt
-            previous_attempts.append({
-                "sql": current_sql or "",
-                "error": execution_result.error or "Unknown error"
-            })
-            
-            # Try to fix the SQL
-            logger.info(f"🔧 Attempting to fix SQL (attempt {attempt + 1}/{max_fix_attempts})...")
-            
-            try:
-                # Get schema context for fixing
-                schema_docs = generator.indexer.retrieve_context(
-                    request.database_id,
-                    request.question,
-                    k=10
-                )
-                schema_context = generator._format_schema_context(schema_docs)
-                
-                # Generate fixed SQL
-                fixed_sql = await generator.fix_sql(
-                    question=request.question,
-                    failed_sql=current_sql or "",
-                    error_message=execution_result.error or "Unknown error",
-                    schema_context=schema_context,
-                    reasoning=sql_result.reasoning or "",
-                    attempt_number=attempt + 1,
-                    previous_attempts=previous_attempts
-                )
-                
-                current_sql = fixed_sql
-                logger.info(f"Generated fix: {current_sql[:100]}...")
-                
-            except Exception as fix_error:
-                logger.error(f"Error generating fix: {str(fix_error)}")
-                break
-        
-        # Type assertion for type checker
-        assert execution_result is not None, "execution_result should be set by now"
-        
-        # Check final result
-        if not execution_result.success:
-            logger.error(f"Query execution failed after {len(previous_attempts) + 1} attempts")
-            error_details = f"Query execution failed after {len(previous_attempts) + 1} attempts.\n\nFinal error: {execution_result.error}"
-            
-            if previous_attempts:
-                error_details += f"\n\nAttempted {len(previous_attempts)} fixes, all failed."
-            
-            # Return partial response with error details
-            return AskResponse(
-                query_id=sql_result.query_id,
-                question=request.question,
-                sql=current_sql or "",
-                sql_explanation=sql_result.explanation or "",
-                reasoning=sql_result.reasoning,
-                execution_result=execution_result,
-                natural_language_answer=error_details,
-                metadata={
-                    "model": settings.llm_model,
-                    "max_rows": request.max_rows,
-                    "fix_attempts": len(previous_attempts) + 1,
-                    "auto_fixed": False
-                }
-            )
-        
-        logger.info(f"Query executed: {execution_result.row_count} rows returned")
-        
-        # If query was auto-fixed, regenerate explanation for the fixed SQL
-        was_auto_fixed = len(previous_attempts) > 0
-        if was_auto_fixed:
-            logger.info("Query was auto-fixed, regenerating explanation for corrected SQL...")
-            sql_result.explanation = await generator.explanation_chain.ainvoke({
-                "question": request.question,
-                "sql": current_sql
-            })
-            sql_result.explanation = sql_result.explanation.strip()
-        
-        # Step 4: Format results as table
-        formatted_table = query_executor.format_table(execution_result)
-        
-        # Step 5: Generate natural language answer
-        natural_language_answer = await generator.analyze_results(
-            question=request.question,
-            sql=sql_result.sql or current_sql or "",
-            results=execution_result.rows or [],
-            row_count=execution_result.row_count
-        )
-        
-        logger.info("Generated natural language answer")
+        async for event in ask_pipeline.run(request):
+            if event.response is not None:
+                return event.response
         
-        # Return complete response
-        return AskResponse(
-            query_id=sql_result.query_id,
-            question=request.question,
-            sql=current_sql or sql_result.sql or "",
-            sql_explanation=sql_result.explanation or "",
-            reasoning=sql_result.reasoning,
-            execution_result=execution_result,
-            natural_language_answer=natural_language_answer,
-            formatted_table=formatted_table,
-            metadata={
-                "model": settings.llm_model,
-                "max_rows": request.max_rows,
-                "execution_time_ms": execution_result.execution_time_ms,
-                "fix_attempts": len(previous_attempts) + 1,
-                "auto_fixed": was_auto_fixed
-            }
-        )
+        raise HTTPException(status_code=500, detail="Ask pipeline finished without a response")
         
+    except AskError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error in ask_question endpoint: {str(e)}")
+        logger.error("Error in ask_question endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -631,245 +800,53 @@ async def ask_question_stream(request: AskRequest):
     - event: reasoning_start
     - event: reasoning_chunk (streaming reasoning text)
     - event: reasoning_complete
+    - event: sql_chunk (streaming SQL text)
     - event: sql_generated
     - event: sql_executing
     - event: sql_success / sql_error
-    - event: complete (final answer)
+    - event: explanation_chunk (streaming query explanation)
+    - event: explanation_complete
+    - event: answer_chunk (streaming natural language answer)
+    - event: answer_complete
+    - event: complete (final answer, rows sent column by column as rows_by_col)
+    - event: complete_z (same as complete for large results: base64 gzipped JSON)
+    
+    Runs the same pipeline as /ask and forwards its progress events. Identical
+    requests arriving while one is already streaming share its run.
     """
     
     async def event_generator():
         try:
-            # Send event helper
-            def send_event(event_type: str, data: dict):
-                return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
-            
-            logger.info(f"Starting streaming ask for database: {request.database_id}")
-            
-            # Step 1: Retrieve credentials
-            yield send_event("status", {"step": "credentials", "message": "Retrieving database credentials..."})
-            
-            credentials_dict = credentials_store.get_credentials(request.database_id)
-            if not credentials_dict:
-                yield send_event("error", {"message": f"Database '{request.database_id}' not found"})
-                return
-            
-            credentials = MySQLCredentials(
-                host=credentials_dict['host'],
-                port=credentials_dict['port'],
-                user=credentials_dict['user'],
-                password=credentials_dict['password'],
-                database=credentials_dict['database']
-            )
-            
-            # Step 2: Retrieve schema context
-            yield send_event("status", {"step": "schema", "message": "Retrieving relevant schema..."})
-            
-            from models import QueryRequest
-            query_request = QueryRequest(
-                question=request.question,
-                database_id=request.database_id
-            )
-            
-            schema_docs = generator.indexer.retrieve_context(
-                request.database_id,
-                request.question,
-                k=10
-            )
-            
-            if not schema_docs:
-                yield send_event("error", {"message": "No schema found"})
-                return
-            
-            schema_context = generator._format_schema_context(schema_docs)
-            
-            # Step 3: Generate reasoning (stream it!)
-            yield send_event("reasoning_start", {"message": "Analyzing your question..."})
-            
-            reasoning_chunks = []
-            async for chunk in generator.reasoning_chain.astream({
-                "schema_context": schema_context,
-                "question": request.question
-            }):
-                reasoning_chunks.append(chunk)
-                yield send_event("reasoning_chunk", {"chunk": chunk})
-            
-            reasoning = "".join(reasoning_chunks).strip()
-            yield send_event("reasoning_complete", {"reasoning": reasoning})
-            
-            # Step 4: Generate SQL
-            yield send_event("status", {"step": "sql_generation", "message": "Generating SQL query..."})
-            
-            sql = await generator.sql_chain.ainvoke({
-                "schema_context": schema_context,
-                "question": request.question,
-                "reasoning": reasoning
-            })
-            
-            sql = generator._clean_sql(sql)
-            yield send_event("sql_generated", {"sql": sql})
-            
-            # Step 5: Execute SQL with auto-fix on error (max 5 attempts)
-            yield send_event("status", {"step": "sql_execution", "message": "Executing query..."})
-            
-            max_fix_attempts = 5
-            current_sql = sql
-            execution_result = None
-            previous_attempts = []
-            
-            for attempt in range(1, max_fix_attempts + 1):
-                logger.info(f"Executing SQL (attempt {attempt}/{max_fix_attempts})")
-                
-                execution_result = query_executor.execute_query(
-                    credentials=credentials,
-                    sql=current_sql,
-                    max_rows=request.max_rows
-                )
-                
-                # Success! Break the loop
-                if execution_result.success:
-                    if attempt > 1:
-                        logger.info(f"✅ SQL fixed successfully after {attempt} attempts")
-                        # Update the SQL
-                        sql = current_sql
-                        yield send_event("sql_fixed", {
-                            "sql": sql,
-                            "attempts": attempt
-                        })
-                    break
-                
-                # Error occurred
-                logger.warning(f"❌ Attempt {attempt} failed: {execution_result.error}")
-                
-                # If this was the last attempt, stop trying
-                if attempt >= max_fix_attempts:
-                    logger.error(f"Max fix attempts ({max_fix_attempts}) reached. Giving up.")
-                    yield send_event("sql_error", {
-                        "error": f"Query execution failed after {max_fix_attempts} attempts.\n\nFinal error: {execution_result.error}",
-                        "sql": current_sql,
-                        "attempts": attempt
-                    })
-                    return
-                
-                # Record this failed attempt
-                previous_attempts.append({
-                    "sql": current_sql,
-                    "error": execution_result.error or "Unknown error"
-                })
-                
-                # Try to fix the SQL
-                logger.info(f"🔧 Attempting to fix SQL (attempt {attempt + 1}/{max_fix_attempts})...")
-                yield send_event("status", {
-                    "step": "sql_fixing",
-                    "message": f"Fixing SQL query (attempt {attempt + 1}/{max_fix_attempts})..."
-                })
-                
-                try:
-                    # Generate fixed SQL
-                    fixed_sql = await generator.fix_sql(
-                        question=request.question,
-                        failed_sql=current_sql,
-                        error_message=execution_result.error or "Unknown error",
-                        schema_context=schema_context,
-                        reasoning=reasoning,
-                        attempt_number=attempt + 1,
-                        previous_attempts=previous_attempts
-                    )
-                    
-                    current_sql = fixed_sql
-                    logger.info(f"Generated fix: {current_sql[:100]}...")
-                    
-                except Exception as fix_error:
-                    logger.error(f"Error generating fix: {str(fix_error)}")
-                    yield send_event("sql_error", {
-                        "error": f"Error generating fix: {str(fix_error)}",
-                        "sql": current_sql
-                    })
-                    return
-            
-            # Type assertion for type checker
-            assert execution_result is not None, "execution_result should be set by now"
-            
-            if not execution_result.success:
-                # Already sent error event above
-                return
-            
-            yield send_event("sql_success", {
-                "row_count": execution_result.row_count,
-                "execution_time_ms": execution_result.execution_time_ms,
-                "auto_fixed": len(previous_attempts) > 0,
-                "fix_attempts": len(previous_attempts) + 1
-            })
-            
-            # If query was auto-fixed, regenerate explanation for the fixed SQL
-            was_auto_fixed = len(previous_attempts) > 0
-            if was_auto_fixed:
-                logger.info("Query was auto-fixed, regenerating explanation for corrected SQL...")
+            logger.info("Starting streaming ask for database: %s", request.database_id)
             
-            # Step 6: Generate explanation
-            yield send_event("status", {"step": "explanation", "message": "Generating explanation..."})
-            
-            explanation = await generator.explanation_chain.ainvoke({
-                "question": request.question,
-                "sql": sql
-            })
-            
-            yield send_event("explanation_complete", {
-                "explanation": explanation.strip()
-            })
-            
-            # Step 7: Generate natural language answer
-            yield send_event("status", {"step": "answer", "message": "Analyzing results..."})
-            
-            natural_language_answer = await generator.analyze_results(
-                question=request.question,
-                sql=sql,
-                results=execution_result.rows or [],
-                row_count=execution_result.row_count
-            )
-            
-            formatted_table = query_executor.format_table(execution_result)
-            
-            yield send_event("answer_complete", {
-                "natural_language_answer": natural_language_answer
-            })
-            
-            # Step 8: Send complete result
-            yield send_event("complete", {
-                "query_id": query_request.query_id,
-                "question": request.question,
-                "sql": sql,
-                "sql_explanation": explanation.strip(),
-                "reasoning": reasoning,
-                "execution_result": {
-                    "success": execution_result.success,
-                    "row_count": execution_result.row_count,
-                    "execution_time_ms": execution_result.execution_time_ms,
-                    "rows": execution_result.rows,
-                    "columns": execution_result.columns
-                },
-                "natural_language_answer": natural_language_answer,
-                "formatted_table": formatted_table,
-                "metadata": {
-                    "model": settings.llm_model,
-                    "max_rows": request.max_rows,
-                    "num_schema_docs": len(schema_docs),
-                    "fix_attempts": len(previous_attempts) + 1,
-                    "auto_fixed": was_auto_fixed
-                }
-            })
+            async for event in ask_pipeline.run(request):
+                if event.type == "complete":
+                    yield _complete_frame(event.data)
+                else:
+                    yield _sse_event(event.type, event.data)
             
+        except AskError as e:
+            yield _error_frame(e.message)
         except Exception as e:
-            logger.error(f"Error in streaming ask: {str(e)}")
-            yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+            logger.error("Error in streaming ask: %s", e)
+            yield _error_frame(str(e))
+    
+    key = _ask_key(request)
+    
+    shared = _inflight_streams.get(key)
+    if shared is None or not shared.joinable:
+        shared = _SharedStream(event_generator())
+        _inflight_streams[key] = shared
+        shared.task.add_done_callback(
+            lambda _, shared=shared: _inflight_streams.get(key) is shared and _inflight_streams.pop(key)
+        )
+    else:
+        logger.info("Joining in-flight streaming ask for database: %s", request.database_id)
     
     return StreamingResponse(
-        event_generator(),
+        _coalesce_frames(shared.subscribe()),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"  # Disable nginx buffering
-        }
+        headers=_SSE_HEADERS
     )
 
 
@@ -883,17 +860,22 @@ async def get_knowledge_base(database_id: str):
     Returns both instructions and SQL pairs.
     """
     try:
-        instructions = knowledge_base_store.get_instructions(database_id)
-        sql_pairs = knowledge_base_store.get_sql_pairs(database_id)
+        # SQLite reads are blocking - run both in worker threads concurrently
+        instructions, sql_pairs = await asyncio.gather(
+            asyncio.to_thread(knowledge_base_store.get_instructions, database_id),
+            asyncio.to_thread(knowledge_base_store.get_sql_pairs, database_id)
+        )
         
-        return KnowledgeBaseListResponse(
+        # Entries come from the store as validated models, so skip re-validation
+        response = KnowledgeBaseListResponse.model_construct(
             instructions=instructions,
             sql_pairs=sql_pairs,
             total_count=len(instructions) + len(sql_pairs)
         )
+        return ORJSONResponse(response)
         
     except Exception as e:
-        logger.error(f"Error getting knowledge base: {str(e)}")
+        logger.error("Error getting knowledge base: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -905,17 +887,18 @@ async def add_instruction(database_id: str, request: AddInstructionRequest):
     The instruction will be indexed and available for future queries.
     """
     try:
-        logger.info(f"Adding instruction to knowledge base for {database_id}")
+        logger.info("Adding instruction to knowledge base for %s", database_id)
         
         # Add to database
-        instruction = knowledge_base_store.add_instruction(
+        instruction = await asyncio.to_thread(
+            knowledge_base_store.add_instruction,
             database_id=database_id,
             title=request.title,
             content=request.content
         )
         
         # Index in vector store
-        success = indexer.index_knowledge_base_instruction(
+        success = await indexer.index_knowledge_base_instruction(
             database_id=database_id,
             instruction_id=instruction.id,
             title=instruction.title,
@@ -923,13 +906,55 @@ async def add_instruction(database_id: str, request: AddInstructionRequest):
         )
         
         if not success:
-            logger.warning(f"Failed to index instruction in vector store")
+            logger.warning("Failed to index instruction in vector store")
+        
+        await _invalidate_caches(database_id)
+        
+        logger.info("Added instruction %s", instruction.id)
+        return ORJSONResponse(instruction)
+        
+    except Exception as e:
+        logger.error("Error adding instruction: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/v1/databases/{database_id}/knowledge-base/instructions/bulk")
+async def add_instructions_bulk(database_id: str, requests: List[AddInstructionRequest]):
+    """
+    Add many instructions to the knowledge base at once.
+    
+    The instructions are stored in one transaction and embedded together.
+    """
+    try:
+        logger.info("Adding %s instructions to knowledge base for %s", len(requests), database_id)
+        
+        # Add to database
+        instructions = await asyncio.to_thread(
+            knowledge_base_store.add_instructions_bulk,
+            database_id=database_id,
+            entries=[{"title": request.title, "content": request.content} for request in requests]
+        )
+        
+        # Index in vector store (queued together, so embedded in as few requests as possible)
+        results = await asyncio.gather(*(
+            indexer.index_knowledge_base_instruction(
+                database_id=database_id,
+                instruction_id=instruction.id,
+                title=instruction.title,
+                content=instruction.content
+            )
+            for instruction in instructions
+        ))
+        
+        if not all(results):
+            logger.warning("Failed to index %s instructions in vector store", results.count(False))
         
-        logger.info(f"Added instruction {instruction.id}")
-        return instruction
+        await _invalidate_caches(database_id)
+        
+        return ORJSONResponse(instructions)
         
     except Exception as e:
-        logger.error(f"Error adding instruction: {str(e)}")
+        logger.error("Error adding instructions: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -941,10 +966,11 @@ async def add_sql_pair(database_id: str, request: AddSQLPairRequest):
     The SQL pair will be indexed and available as an example for future queries.
     """
     try:
-        logger.info(f"Adding SQL pair to knowledge base for {database_id}")
+        logger.info("Adding SQL pair to knowledge base for %s", database_id)
         
         # Add to database
-        sql_pair = knowledge_base_store.add_sql_pair(
+        sql_pair = await asyncio.to_thread(
+            knowledge_base_store.add_sql_pair,
             database_id=database_id,
             question=request.question,
             sql=request.sql,
@@ -952,7 +978,7 @@ async def add_sql_pair(database_id: str, request: AddSQLPairRequest):
         )
         
         # Index in vector store
-        success = indexer.index_knowledge_base_sql_pair(
+        success = await indexer.index_knowledge_base_sql_pair(
             database_id=database_id,
             pair_id=sql_pair.id,
             question=sql_pair.question,
@@ -961,13 +987,59 @@ async def add_sql_pair(database_id: str, request: AddSQLPairRequest):
         )
         
         if not success:
-            logger.warning(f"Failed to index SQL pair in vector store")
+            logger.warning("Failed to index SQL pair in vector store")
+        
+        await _invalidate_caches(database_id)
+        
+        logger.info("Added SQL pair %s", sql_pair.id)
+        return ORJSONResponse(sql_pair)
+        
+    except Exception as e:
+        logger.error("Error adding SQL pair: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/v1/databases/{database_id}/knowledge-base/sql-pairs/bulk")
+async def add_sql_pairs_bulk(database_id: str, requests: List[AddSQLPairRequest]):
+    """
+    Add many SQL pairs to the knowledge base at once.
+    
+    The pairs are stored in one transaction and embedded together.
+    """
+    try:
+        logger.info("Adding %s SQL pairs to knowledge base for %s", len(requests), database_id)
+        
+        # Add to database
+        sql_pairs = await asyncio.to_thread(
+            knowledge_base_store.add_sql_pairs_bulk,
+            database_id=database_id,
+            entries=[
+                {"question": request.question, "sql": request.sql, "description": request.description}
+                for request in requests
+            ]
+        )
         
-        logger.info(f"Added SQL pair {sql_pair.id}")
-        return sql_pair
+        # Index in vector store (queued together, so embedded in as few requests as possible)
+        results = await asyncio.gather(*(
+            indexer.index_knowledge_base_sql_pair(
+                database_id=database_id,
+                pair_id=sql_pair.id,
+                question=sql_pair.question,
+                sql=sql_pair.sql,
+                description=sql_pair.description
+            )
+            for sql_pair in sql_pairs
+        ))
+        
+        if not all(results):
+            logger.warning("Failed to index %s SQL pairs in vector store", results.count(False))
+        
+        await _invalidate_caches(database_id)
+        
+        return ORJSONResponse(sql_pairs)
         
     except Exception as e:
-        logger.error(f"Error adding SQL pair: {str(e)}")
+        logger.error("Error adding SQL pairs: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -975,7 +1047,7 @@ async def add_sql_pair(database_id: str, request: AddSQLPairRequest):
 async def delete_instruction(instruction_id: str):
     """Delete an instruction from the knowledge base."""
     try:
-        success = knowledge_base_store.delete_instruction(instruction_id)
+        success = await asyncio.to_thread(knowledge_base_store.delete_instruction, instruction_id)
         
         if not success:
             raise HTTPException(status_code=404, detail="Instruction not found")
@@ -988,7 +1060,7 @@ async def delete_instruction(instruction_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error deleting instruction: {str(e)}")
+        logger.error("Error deleting instruction: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -996,7 +1068,7 @@ async def delete_instruction(instruction_id: str):
 async def delete_sql_pair(pair_id: str):
     """Delete a SQL pair from the knowledge base."""
     try:
-        success = knowledge_base_store.delete_sql_pair(pair_id)
+        success = await asyncio.to_thread(knowledge_base_store.delete_sql_pair, pair_id)
         
         if not success:
             raise HTTPException(status_code=404, detail="SQL pair not found")
@@ -1009,29 +1081,30 @@ async def delete_sql_pair(pair_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error deleting SQL pair: {str(e)}")
+        logger.error("Error deleting SQL pair: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Body of every unhandled-error response outside debug mode
+_INTERNAL_ERROR_BODY = orjson.dumps({"error": "Internal server error", "detail": "An error occurred"})
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Global exception handler."""
-    logger.error(f"Unhandled exception: {str(exc)}", exc_info=True)
-    return JSONResponse(
+    logger.error("Unhandled exception: %s", exc, exc_info=True)
+    if not settings.debug:
+        return Response(content=_INTERNAL_ERROR_BODY, status_code=500, media_type="application/json")
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": "Internal server error",
-            "detail": str(exc) if settings.debug else "An error occurred"
+            "detail": str(exc)
         }
     )
 
 
 if __name__ == "__main__":
-    import uvicorn
+    from main import main
     
-    uvicorn.run(
-        "api:app",
-        host=settings.api_host,
-        port=settings.api_port,
-        reload=settings.debug
-    )
+    main()
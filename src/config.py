@@ -2,16 +2,27 @@
 Configuration management for the GenBI system.
 """
 
-from pydantic_settings import BaseSettings
-from typing import Optional
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import List, Literal, Optional
 
 
 class Settings(BaseSettings):
     """Application settings."""
     
+    # Settings are read once at startup and never change while the service runs
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        case_sensitive=False,
+        frozen=True
+    )
+    
     # API Settings
     api_host: str = "0.0.0.0"
     api_port: int = 5556
+    api_workers: int = 1  # 0 = half the CPU cores. Each worker keeps its own in-memory indexes, caches and pools
+    api_limit_concurrency: Optional[int] = 1000  # Max concurrent connections per worker before 503s
+    api_timeout_keep_alive: int = 30
     
     # LLM Provider Settings
     llm_provider: str = "openai"  # openai, anthropic, local, etc.
@@ -20,23 +31,76 @@ class Settings(BaseSettings):
     llm_base_url: Optional[str] = None  # For local LLMs (e.g., http://localhost:11434/v1)
     llm_temperature: float = 0.1
     llm_max_tokens: int = 2000
+    llm_max_concurrency: int = 16  # Max LLM requests in flight across all concurrent asks
+    llm_requests_per_second: Optional[float] = None  # Rate limit for LLM requests (None = unlimited)
+    llm_http_max_connections: int = 100  # Shared connection pool for LLM and embedding requests
+    llm_http_max_keepalive: int = 20
+    llm_http_keepalive_expiry: float = 60.0  # Seconds an idle connection stays open for reuse
+    llm_http2: bool = False  # Multiplex requests over one connection (needs the h2 package)
+    llm_keepalive_interval: float = 60.0  # Seconds; ping an idle llm_base_url endpoint so the model stays loaded (0 = off)
+    
+    # Compile simple structural questions (count / list / top N) to SQL without the LLM
+    sql_compiler_enabled: bool = True
+    
+    # Explain simple SELECT queries from their syntax tree instead of with the LLM
+    sql_explainer_enabled: bool = True
+    
+    # Approximate token budgets for the schema context (less relevant documents are dropped)
+    reasoning_context_tokens: Optional[int] = 2000
+    sql_context_tokens: Optional[int] = 4000  # Also used when fixing SQL
+    
+    # /query: also generate SQL without a plan, used if reasoning fails or exceeds reasoning_timeout
+    sql_speculative_direct: bool = False
+    reasoning_timeout: float = 30.0  # Seconds, only enforced with sql_speculative_direct
+    
+    # SQL Auto-Fix Settings
+    sql_fix_rounds: int = 2  # Rounds of fix candidates after the first execution fails
+    sql_fix_temperatures: List[float] = [0.0, 0.3, 0.7]  # One concurrent candidate per temperature
+    sql_autofix_enabled: bool = True  # Repair misspelled/ambiguous names by rules before asking the LLM
     
     # Embedding Settings
     embedding_provider: str = "openai"
     embedding_model: str = "text-embedding-3-small"
     embedding_api_key: Optional[str] = None
     embedding_base_url: Optional[str] = None  # For local embeddings
+    embedding_batch_size: Optional[int] = None  # Texts per embedding request (None = client default of 1000)
+    
+    # MySQL Query Execution Settings
+    credentials_encryption_key: Optional[str] = None  # Fernet key for stored passwords (default: data/.encryption_key)
+    mysql_pool_size: int = 8  # Connections per database pool
+    mysql_max_pools: int = 16  # Databases with an open pool before the least recently used is closed
+    mysql_pool_timeout: float = 10.0  # Seconds to wait for a free connection when a pool is exhausted
+    schema_discovery_cache_ttl: float = 300.0  # Seconds a discovered schema is reused while unchanged (0 = off)
     
     # Vector Store Settings
     vector_store_path: str = "./data/vector_store"
+    vector_store_int8: bool = True  # Store new indexes with 8-bit scalar quantization (4x smaller)
+    vector_store_index: Literal["flat", "hnsw", "ivfpq"] = "flat"  # exact scan, fast approximate or compressed
+    max_loaded_indexes: Optional[int] = 32  # Indexes kept in memory; least recently used are reloaded on demand (None = all)
+    indexed_dumps_enabled: bool = True  # Write a JSON dump of the indexed documents to data/indexed_dumps
+    indexed_dumps_gzip: bool = False  # Compress the dumps (.json.gz, read with zcat)
+    retrieval_cache_enabled: bool = True  # Persist retrieved schema documents per question and index version
+    retrieval_cache_path: str = "./data/retrieval_cache.db"
+    retrieval_cache_max_entries: int = 10000  # Oldest cached retrievals are dropped beyond this
+    
+    # Semantic Cache Settings
+    semantic_cache_enabled: bool = True
+    semantic_cache_threshold: float = 0.95  # Initial (and maximum) cosine similarity for a hit
+    semantic_cache_min_threshold: float = 0.85  # Lowest a database's threshold is tuned to, on near misses with the same SQL
+    semantic_cache_target_hit_rate: float = 0.8  # Thresholds are only lowered while a database's hit rate is below this
+    semantic_cache_ttl: Optional[int] = None  # Seconds; by default entries live until the database is re-indexed
+    semantic_cache_max_entries: int = 1000  # Per database; the oldest cached results are dropped beyond this
+    
+    # Reasoning Cache Settings (reuses query plans of similar questions, needs the semantic cache)
+    reasoning_cache_enabled: bool = True
+    reasoning_cache_threshold: float = 0.9  # Looser than the SQL cache: the SQL is still generated per question
+    reasoning_cache_ttl: int = 3600  # Seconds
     
     # System Settings
     debug: bool = False
     log_level: str = "INFO"
-    
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
+    startup_warmup: bool = True  # Ping the LLM and embedding endpoints at startup
+    prefetch_credentials: bool = True  # Decrypt stored credentials into the cache at startup
 
 
 # Global settings instance
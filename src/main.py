@@ -2,10 +2,20 @@
 Main entry point for the Tiny GenBI service.
 """
 
+import os
 import sys
 import uvicorn
 from config import settings
 
+# uvloop is not available on Windows, fall back to the default asyncio loop there
+EVENT_LOOP = "asyncio" if sys.platform == "win32" else "uvloop"
+
+def worker_count() -> int:
+    """Configured number of worker processes; 0 means half the CPU cores."""
+    if settings.api_workers > 0:
+        return settings.api_workers
+    return max(1, (os.cpu_count() or 2) // 2)
+
 def main():
     """Start the Tiny GenBI API service."""
     print("=" * 60)
@@ -13,6 +23,8 @@ def main():
     print("=" * 60)
     print(f"Host: {settings.api_host}")
     print(f"Port: {settings.api_port}")
+    workers = worker_count()
+    print(f"Workers: {workers}")
     print(f"LLM Model: {settings.llm_model}")
     print(f"Debug Mode: {settings.debug}")
     print("=" * 60)
@@ -27,7 +39,12 @@ def main():
         "api:app",
         host=settings.api_host,
         port=settings.api_port,
-        reload=settings.debug,
+        reload=settings.debug,  # Reload mode always runs a single worker
+        workers=workers,
+        loop=EVENT_LOOP,
+        http="httptools",
+        limit_concurrency=settings.api_limit_concurrency,
+        timeout_keep_alive=settings.api_timeout_keep_alive,
         log_level=settings.log_level.lower()
     )
 
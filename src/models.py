@@ -2,12 +2,25 @@
 Core domain models for the simplified GenBI system.
 """
 
+import itertools
+import os
+import time
 from enum import Enum
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel, Field
 from datetime import datetime
 
 
+# Query ids are a per-process prefix (start time + pid) plus a counter
+_QUERY_ID_PREFIX = f"q_{int(time.time())}_{os.getpid()}_"
+_query_id_counter = itertools.count(1)
+
+
+def new_query_id() -> str:
+    """Generate a query id, unique across worker processes."""
+    return f"{_QUERY_ID_PREFIX}{next(_query_id_counter)}"
+
+
 class TableSchema(BaseModel):
     """Represents a database table schema."""
     name: str
@@ -33,7 +46,7 @@ class QueryStatus(str, Enum):
 
 class QueryRequest(BaseModel):
     """Request to convert natural language to SQL."""
-    query_id: str = Field(default_factory=lambda: f"q_{datetime.now().timestamp()}")
+    query_id: str = Field(default_factory=new_query_id)
     question: str = Field(..., description="Natural language question")
     database_id: str = Field(..., description="ID of the database schema to query")
     
@@ -104,6 +117,7 @@ class QueryExecutionResult(BaseModel):
     columns: Optional[List[str]] = None
     error: Optional[str] = None
     execution_time_ms: Optional[float] = None
+    truncated: bool = False  # More rows matched than were returned
 
 
 class AskRequest(BaseModel):
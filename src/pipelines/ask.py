@@ -0,0 +1,762 @@
+"""
+Ask pipeline - the full question-to-answer workflow shared by /ask and /ask/stream.
+
+The pipeline yields progress events as it goes (status, streamed reasoning/SQL/answer
+chunks, execution results). The streaming endpoint forwards them as server-sent
+events; the non-streaming endpoint only keeps the final response.
+"""
+
+import asyncio
+import logging
+import re
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from models import (
+    AskRequest,
+    AskResponse,
+    MySQLCredentials,
+    QueryExecutionResult,
+    QueryStatus,
+    SQLResult,
+    new_query_id
+)
+from pipelines.generation import SQLGenerator
+from pipelines.sql_compiler import schema_from_documents
+from services import sql_autofix
+from services.mysql_errors import is_fixable_error
+from services.query_executor import MySQLQueryExecutor
+from services.reasoning_cache import ReasoningCache
+from services.semantic_cache import SemanticCache
+from services.sql_validator import SQLValidator, SQLValidationError
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# SQL tokens: quoted identifiers, words, numbers, string literals, single symbols
+_SQL_TOKEN = re.compile(r"`[^`]*`|[A-Za-z_][\w$]*|\d+(?:\.\d+)?|'(?:[^']|'')*'|\S")
+
+# Words that change what a query does; every other word is a table/column/alias name
+_SQL_KEYWORDS = frozenset({
+    "SELECT", "FROM", "WHERE", "AND", "OR", "NOT", "IN", "IS", "NULL", "LIKE", "BETWEEN",
+    "JOIN", "LEFT", "RIGHT", "INNER", "OUTER", "CROSS", "ON", "USING", "GROUP", "ORDER", "BY",
+    "HAVING", "LIMIT", "OFFSET", "ASC", "DESC", "DISTINCT", "AS", "UNION", "ALL", "EXISTS",
+    "CASE", "WHEN", "THEN", "ELSE", "END", "COUNT", "SUM", "AVG", "MIN", "MAX", "WITH"
+})
+
+
+def _renamed_identifiers(original_sql: str, fixed_sql: str) -> Optional[List[Tuple[str, str]]]:
+    """
+    Compare an auto-fixed query with the original.
+
+    Returns:
+        The (original, fixed) identifier pairs if the fix only renamed tables
+        or columns, otherwise None
+    """
+    original_tokens = _SQL_TOKEN.findall(original_sql)
+    fixed_tokens = _SQL_TOKEN.findall(fixed_sql)
+    if len(original_tokens) != len(fixed_tokens):
+        return None
+
+    def is_identifier(token: str) -> bool:
+        return token[0] == "`" or (token[0].isalpha() or token[0] == "_") and token.upper() not in _SQL_KEYWORDS
+
+    renamed = []
+    for original, fixed in zip(original_tokens, fixed_tokens):
+        if original == fixed:
+            continue
+        if not (is_identifier(original) and is_identifier(fixed)):
+            return None
+        renamed.append((original, fixed))
+    return renamed
+
+
+class AskEvent(NamedTuple):
+    """
+    A progress event emitted by the ask pipeline.
+
+    `response` is only set on the final event (`complete`, or `sql_error` when
+    the query could not be executed) and holds the serialized AskResponse.
+    """
+    type: str
+    data: Dict[str, Any]
+    response: Optional[Dict[str, Any]] = None
+
+
+class AskError(Exception):
+    """Raised when a question can't be answered at all (unknown database, no schema, invalid SQL)."""
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+async def _merge_streams(streams: Dict[str, AsyncIterator[str]]) -> AsyncIterator[Tuple[str, Optional[str]]]:
+    """
+    Consume several text streams concurrently.
+
+    Yields (name, chunk) as chunks arrive from any stream, and (name, None) once
+    a stream is exhausted. An error in any stream is re-raised immediately.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump(name: str, stream: AsyncIterator[str]):
+        try:
+            async for chunk in stream:
+                await queue.put((name, chunk))
+            await queue.put((name, None))
+        except Exception as e:
+            await queue.put((name, e))
+
+    tasks = [asyncio.create_task(pump(name, stream)) for name, stream in streams.items()]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            name, chunk = await queue.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if chunk is None:
+                remaining -= 1
+            yield name, chunk
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _response_payload(response: AskResponse) -> Dict[str, Any]:
+    """
+    Serialize an AskResponse for the client.
+
+    Result rows are already orjson-serializable (the query executor converts
+    them), so they are passed through by reference instead of being deep-copied.
+    """
+    payload = response.model_dump(mode="json", exclude={"execution_result": {"rows"}})
+    payload["execution_result"]["rows"] = response.execution_result.rows
+    return payload
+
+
+class AskPipeline:
+    """
+    Answers natural language questions end to end.
+
+    Retrieves credentials and schema context, generates SQL (semantic cache,
+    deterministic compiler or LLM), executes it with speculative auto-fix, then
+    explains the query and analyzes the results.
+    """
+
+    # Auto-fixed SQL at least this similar to the original keeps the original's explanation
+    EXPLANATION_REUSE_RATIO = 0.95
+
+    def __init__(
+        self,
+        generator: SQLGenerator,
+        query_executor: MySQLQueryExecutor,
+        credentials_store,
+        semantic_cache: Optional[SemanticCache] = None,
+        reasoning_cache: Optional[ReasoningCache] = None
+    ):
+        self.generator = generator
+        self.query_executor = query_executor
+        self.credentials_store = credentials_store
+        self.semantic_cache = semantic_cache
+        self.reasoning_cache = reasoning_cache
+
+        # Schema context retrievals per (database_id, question), cleared by invalidate()
+        self._schema_contexts: "OrderedDict[Tuple[str, str], asyncio.Task]" = OrderedDict()
+        self.max_schema_contexts = 1024
+
+        # LLM explanations per (question, sql), so re-asked and re-fixed queries aren't explained twice
+        self._explanations: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self.max_explanations = 1024
+
+    async def _retrieve_schema_context(self, database_id: str, question: str) -> Tuple[Tuple[Document, ...], str]:
+        """Retrieve and format schema context (cached, see get_schema_context)."""
+        schema_docs = await self.generator.indexer.aretrieve_context(database_id, question, k=10)
+        if not schema_docs:
+            return (), ""
+        return tuple(schema_docs), self.generator._format_schema_context(schema_docs, settings.sql_context_tokens)
+
+    def _schema_context_task(self, database_id: str, question: str) -> asyncio.Task:
+        """Start a schema context retrieval, or return the cached or in-flight one."""
+        key = (database_id, question)
+        task = self._schema_contexts.get(key)
+        # Failed and empty (possibly transient) results are retried
+        if task is None or (task.done() and (task.cancelled() or task.exception() or not task.result()[0])):
+            task = asyncio.create_task(self._retrieve_schema_context(database_id, question))
+            self._schema_contexts[key] = task
+        self._schema_contexts.move_to_end(key)
+        if len(self._schema_contexts) > self.max_schema_contexts:
+            self._schema_contexts.popitem(last=False)
+        return task
+
+    def _prefetch_schema_context(self, database_id: str, question: str) -> Optional[asyncio.Task]:
+        """Start a schema context retrieval; returns it if it was started here rather than reused."""
+        existing = self._schema_contexts.get((database_id, question))
+        task = self._schema_context_task(database_id, question)
+        return task if task is not existing else None
+
+    def _cancel_schema_context(self, database_id: str, question: str, task: asyncio.Task):
+        """Cancel a prefetched retrieval that turned out not to be needed."""
+        if not task.done():
+            task.cancel()
+            key = (database_id, question)
+            if self._schema_contexts.get(key) is task:
+                del self._schema_contexts[key]
+
+    async def get_schema_context(self, database_id: str, question: str) -> Tuple[Tuple[Document, ...], str]:
+        """
+        Get the relevant schema documents and formatted schema context for a question.
+
+        Results are cached so fix attempts and repeated questions don't repeat the
+        vector search, and concurrent asks share one retrieval. Returns ((), "")
+        when no schema is found.
+        """
+        # Shielded so a cancelled ask doesn't cancel a retrieval others may share
+        return await asyncio.shield(self._schema_context_task(database_id, question))
+
+    async def get_cached_sql(
+        self, database_id: str, question: str, prefetch_schema: bool = False
+    ) -> Tuple[Optional[np.ndarray], Optional[SQLResult]]:
+        """
+        Look up a cached SQL result for the same or a semantically similar question.
+
+        Returns a tuple of (question_embedding, cached_result). The embedding is
+        reused to store the result on a cache miss; it is None on an exact hit
+        (no embedding needed), and both are None when the cache is disabled or
+        unavailable.
+
+        With prefetch_schema, the schema context retrieval needed on a miss
+        starts once the exact lookup missed, overlapping the semantic lookup,
+        and is cancelled again on a semantic hit.
+        """
+        if self.semantic_cache is None:
+            return None, None
+
+        cached = await asyncio.to_thread(self.semantic_cache.get_exact, database_id, question)
+        if cached:
+            return None, cached
+
+        prefetch = self._prefetch_schema_context(database_id, question) if prefetch_schema else None
+        try:
+            embedding = await self.semantic_cache.embed(question)
+        except Exception as e:
+            logger.warning("Semantic cache lookup skipped: %s", e)
+            return None, None
+
+        cached = await asyncio.to_thread(self.semantic_cache.get, database_id, embedding)
+        if cached and prefetch is not None:
+            self._cancel_schema_context(database_id, question, prefetch)
+        return embedding, cached
+
+    def get_cached_reasoning(self, database_id: str, question_embedding: Optional[np.ndarray]) -> Optional[str]:
+        """Look up a cached query plan for a similar question (None without an embedding)."""
+        if self.reasoning_cache is None or question_embedding is None:
+            return None
+        return self.reasoning_cache.get(database_id, question_embedding)
+
+    def remember_reasoning(self, database_id: str, question_embedding: Optional[np.ndarray], reasoning: str):
+        """Cache an LLM query plan that led to a successful query."""
+        if self.reasoning_cache is not None and question_embedding is not None and reasoning:
+            self.reasoning_cache.put(database_id, question_embedding, reasoning)
+
+    async def invalidate(self, database_id: str):
+        """Drop cached schema context, plans and SQL results after a database's index or knowledge base changed."""
+        for key in [key for key in self._schema_contexts if key[0] == database_id]:
+            del self._schema_contexts[key]
+        if self.semantic_cache is not None:
+            await asyncio.to_thread(self.semantic_cache.invalidate, database_id)
+        if self.reasoning_cache is not None:
+            self.reasoning_cache.invalidate(database_id)
+
+    async def _speculative_fix(
+        self,
+        credentials: MySQLCredentials,
+        question: str,
+        failed_sql: str,
+        error_message: str,
+        schema_docs: Tuple[Document, ...],
+        schema_context: str,
+        reasoning: str,
+        attempt_number: int,
+        previous_attempts: List[Dict[str, str]],
+        max_rows: int,
+        fix_round: int = 1
+    ) -> Tuple[Optional[str], Optional[QueryExecutionResult], List[Dict[str, str]]]:
+        """
+        Generate several SQL fix candidates concurrently and execute each as soon as it is ready.
+
+        Shallow errors are first repaired by rules (see sql_autofix); the LLM is
+        only asked if that repair doesn't apply or fails. One LLM candidate is
+        generated per configured temperature to get diverse fixes. The first
+        candidate that executes successfully wins and the rest are cancelled.
+
+        Returns:
+            Tuple of (fixed_sql, execution_result, failed_attempts):
+            - On success, the winning SQL and its result plus the candidates that failed before it
+            - If every candidate failed, (None, last_result, failed_attempts)
+            - If no usable candidate was generated, (None, None, [])
+        """
+        async def try_candidate(temperature: float):
+            fixed_sql = await self.generator.fix_sql(
+                question=question,
+                failed_sql=failed_sql,
+                error_message=error_message,
+                schema_context=schema_context,
+                reasoning=reasoning,
+                attempt_number=attempt_number,
+                previous_attempts=previous_attempts,
+                temperature=temperature,
+                fix_round=fix_round
+            )
+
+            # fix_sql returns the failed SQL unchanged when it could not produce a fix,
+            # and a candidate identical to an earlier one needs no second execution
+            if fixed_sql == failed_sql or fixed_sql in executed:
+                return fixed_sql, None
+            executed.add(fixed_sql)
+
+            result = await self.query_executor.execute_query(
+                credentials=credentials,
+                sql=fixed_sql,
+                max_rows=max_rows
+            )
+            return fixed_sql, result
+
+        failed_attempts = []
+        last_result = None
+        executed = set()
+
+        repaired_sql = None
+        if settings.sql_autofix_enabled:
+            repaired_sql = sql_autofix.autofix(failed_sql, error_message, schema_from_documents(schema_docs))
+        if repaired_sql:
+            executed.add(repaired_sql)
+            result = await self.query_executor.execute_query(
+                credentials=credentials,
+                sql=repaired_sql,
+                max_rows=max_rows
+            )
+            if result.success:
+                return repaired_sql, result, failed_attempts
+
+            logger.warning("❌ Rule-based repair failed: %s", result.error)
+            failed_attempts.append({
+                "sql": repaired_sql,
+                "error": result.error or "Unknown error"
+            })
+            last_result = result
+
+        tasks = [asyncio.create_task(try_candidate(t)) for t in settings.sql_fix_temperatures]
+
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                # A candidate that raised counts as failed, the others keep going
+                try:
+                    fixed_sql, result = await next_done
+                except Exception as e:
+                    logger.warning("❌ Fix candidate raised: %s", e)
+                    continue
+                if result is None:
+                    continue
+                if result.success:
+                    return fixed_sql, result, failed_attempts
+
+                logger.warning("❌ Fix candidate failed: %s", result.error)
+                failed_attempts.append({
+                    "sql": fixed_sql,
+                    "error": result.error or "Unknown error"
+                })
+                last_result = result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        return None, last_result, failed_attempts
+
+    def _memoized_explanation(self, question: str, sql: str) -> Optional[str]:
+        """Get a remembered LLM explanation, or None."""
+        explanation = self._explanations.get((question, sql))
+        if explanation is not None:
+            self._explanations.move_to_end((question, sql))
+        return explanation
+
+    def _remember_explanation(self, question: str, sql: str, explanation: str):
+        """Store an LLM explanation, evicting the least recently used one when full."""
+        self._explanations[(question, sql)] = explanation
+        self._explanations.move_to_end((question, sql))
+        if len(self._explanations) > self.max_explanations:
+            self._explanations.popitem(last=False)
+
+    @staticmethod
+    async def _single(value: str) -> AsyncIterator[str]:
+        """Stream an already known text as a single chunk."""
+        yield value
+
+    @staticmethod
+    def _queued_event() -> AskEvent:
+        """Status event sent when every LLM slot is busy and the next call has to wait."""
+        return AskEvent("status", {"step": "queued", "message": "Waiting for a free LLM slot..."})
+
+    async def run(self, request: AskRequest) -> AsyncIterator[AskEvent]:
+        """
+        Answer a question, yielding progress events.
+
+        Args:
+            request: Question, database and row limit
+
+        Yields:
+            AskEvent for each step; the last event carries the response
+
+        Raises:
+            AskError: If the database is unknown, no schema is found, or the
+                generated SQL is not allowed
+        """
+        logger.info("Processing ask request for database: %s", request.database_id)
+        query_id = new_query_id()
+
+        # Step 1: Retrieve credentials
+        yield AskEvent("status", {"step": "credentials", "message": "Retrieving database credentials..."})
+
+        credentials_dict = self.credentials_store.get_credentials(request.database_id)
+        if not credentials_dict:
+            raise AskError(
+                f"Database '{request.database_id}' not found. Please index it first using /api/v1/mysql/auto-index",
+                status_code=404
+            )
+
+        credentials = MySQLCredentials(
+            host=credentials_dict['host'],
+            port=credentials_dict['port'],
+            user=credentials_dict['user'],
+            password=credentials_dict['password'],
+            database=credentials_dict['database']
+        )
+
+        # Step 2: Generate SQL - reuse SQL from a similar earlier question when
+        # possible (it's still executed below so results stay live), otherwise
+        # compile simple structural questions or ask the LLM
+        # The schema is needed on a cache miss, so its retrieval overlaps the semantic lookup
+        question_embedding, cached = await self.get_cached_sql(
+            request.database_id, request.question, prefetch_schema=True
+        )
+        compiled = None
+        cached_reasoning = None
+        num_schema_docs = 0
+
+        if cached:
+            source = (cached.metadata or {}).get("source", "llm")
+            reasoning = cached.reasoning or ""
+            sql = cached.sql or ""
+            yield AskEvent("reasoning_complete", {"reasoning": reasoning})
+        else:
+            yield AskEvent("status", {"step": "schema", "message": "Retrieving relevant schema..."})
+
+            schema_docs, schema_context = await self.get_schema_context(request.database_id, request.question)
+            if not schema_docs:
+                raise AskError(f"No schema found for database: {request.database_id}")
+            num_schema_docs = len(schema_docs)
+
+            compiled = self.generator.compile_sql(request.question, schema_docs)
+
+            if compiled:
+                source = "compiled"
+                reasoning = compiled.reasoning
+                yield AskEvent("reasoning_complete", {"reasoning": reasoning})
+                sql = compiled.sql
+            else:
+                source = "llm"
+                if self.generator.llm_saturated:
+                    yield self._queued_event()
+
+                # A similar question's plan is reused, the SQL is still generated for this one
+                cached_reasoning = self.get_cached_reasoning(request.database_id, question_embedding)
+                if cached_reasoning:
+                    reasoning = cached_reasoning
+                else:
+                    yield AskEvent("reasoning_start", {"message": "Analyzing your question..."})
+
+                    reasoning_chunks = []
+                    async for chunk in self.generator.astream_chain(self.generator.reasoning_chain, {
+                        "schema_context": self.generator._format_schema_context(
+                            schema_docs, settings.reasoning_context_tokens
+                        ),
+                        "question": request.question
+                    }):
+                        reasoning_chunks.append(chunk)
+                        yield AskEvent("reasoning_chunk", {"chunk": chunk})
+
+                    reasoning = "".join(reasoning_chunks).strip()
+                yield AskEvent("reasoning_complete", {"reasoning": reasoning})
+
+                yield AskEvent("status", {"step": "sql_generation", "message": "Generating SQL query..."})
+
+                sql_chunks = []
+                try:
+                    async for chunk in self.generator.astream_sql({
+                        "schema_context": schema_context,
+                        "question": request.question,
+                        "reasoning": reasoning
+                    }):
+                        sql_chunks.append(chunk)
+                        yield AskEvent("sql_chunk", {"chunk": chunk})
+                except SQLValidationError as e:
+                    raise AskError(
+                        f"SQL generation failed: Generated query is not allowed: {e}. "
+                        "Only SELECT and discovery queries are permitted."
+                    )
+
+                sql = self.generator._clean_sql("".join(sql_chunks))
+
+                # Validate SQL for security
+                is_valid, validation_error = SQLValidator.validate(sql)
+                if not is_valid:
+                    logger.error("Generated SQL failed validation: %s", validation_error)
+                    raise AskError(
+                        f"SQL generation failed: Generated query is not allowed: {validation_error}. "
+                        "Only SELECT and discovery queries are permitted."
+                    )
+
+        logger.info("Generated SQL: %s", sql)
+        yield AskEvent("sql_generated", {"sql": sql})
+
+        # Step 3: Execute SQL with auto-fix on error
+        # Each fix round generates several candidates concurrently and keeps the first that works
+        yield AskEvent("status", {"step": "sql_execution", "message": "Executing query..."})
+
+        max_fix_rounds = settings.sql_fix_rounds
+        current_sql = sql
+        previous_attempts = []
+
+        logger.info("Executing SQL (attempt 1)")
+        execution_result = await self.query_executor.execute_query(
+            credentials=credentials,
+            sql=current_sql,
+            max_rows=request.max_rows
+        )
+
+        for fix_round in range(1, max_fix_rounds + 1):
+            if execution_result.success:
+                break
+
+            logger.warning("❌ Attempt %s failed: %s", len(previous_attempts) + 1, execution_result.error)
+
+            # Don't spend LLM calls on errors a SQL rewrite can't fix
+            if not is_fixable_error(execution_result.error):
+                logger.error("Error is not fixable by rewriting the query. Giving up.")
+                break
+            if previous_attempts and execution_result.error == previous_attempts[-1]["error"]:
+                logger.error("Fix attempts keep failing with the same error. Giving up.")
+                break
+
+            # Record this failed attempt
+            previous_attempts.append({
+                "sql": current_sql,
+                "error": execution_result.error or "Unknown error"
+            })
+
+            logger.info(
+                "🔧 Generating %s fix candidates (round %s/%s)...",
+                len(settings.sql_fix_temperatures),
+                fix_round,
+                max_fix_rounds
+            )
+            yield AskEvent("status", {
+                "step": "sql_fixing",
+                "message": f"Fixing SQL query (round {fix_round}/{max_fix_rounds})..."
+            })
+
+            try:
+                # Schema context for fixing (cached across rounds)
+                schema_docs, schema_context = await self.get_schema_context(request.database_id, request.question)
+
+                fixed_sql, fix_result, failed_attempts = await self._speculative_fix(
+                    credentials=credentials,
+                    question=request.question,
+                    failed_sql=current_sql,
+                    error_message=execution_result.error or "Unknown error",
+                    schema_docs=schema_docs,
+                    schema_context=schema_context,
+                    reasoning=reasoning,
+                    attempt_number=len(previous_attempts) + 1,
+                    previous_attempts=previous_attempts,
+                    max_rows=request.max_rows,
+                    fix_round=fix_round
+                )
+
+            except Exception as fix_error:
+                logger.error("Error generating fix: %s", fix_error)
+                break
+
+            if fix_result is None:
+                logger.error("No usable fix candidates generated. Giving up.")
+                break
+
+            if fixed_sql:
+                previous_attempts.extend(failed_attempts)
+                current_sql = fixed_sql
+                execution_result = fix_result
+                logger.info("✅ SQL fixed successfully after %s attempts", len(previous_attempts) + 1)
+                yield AskEvent("sql_fixed", {
+                    "sql": current_sql,
+                    "attempts": len(previous_attempts) + 1
+                })
+                break
+
+            # All candidates failed: keep the last one as the SQL to fix next round
+            previous_attempts.extend(failed_attempts[:-1])
+            current_sql = failed_attempts[-1]["sql"]
+            execution_result = fix_result
+
+        fix_attempts = len(previous_attempts) + 1
+        was_auto_fixed = len(previous_attempts) > 0
+        metadata = {
+            "model": settings.llm_model,
+            "max_rows": request.max_rows,
+            "num_schema_docs": num_schema_docs,
+            "fix_attempts": fix_attempts,
+            "auto_fixed": was_auto_fixed,
+            "cache_hit": cached is not None,
+            "source": source
+        }
+
+        if not execution_result.success:
+            logger.error("Query execution failed after %s attempts. Giving up.", fix_attempts)
+            error_details = f"Query execution failed after {fix_attempts} attempts.\n\nFinal error: {execution_result.error}"
+            if previous_attempts:
+                error_details += f"\n\nAttempted {len(previous_attempts)} fixes, all failed."
+
+            # Partial response with error details (built from validated values, so skip validation)
+            response = AskResponse.model_construct(
+                query_id=query_id,
+                question=request.question,
+                sql=current_sql,
+                sql_explanation=(cached.explanation if cached else None) or "",
+                reasoning=reasoning,
+                execution_result=execution_result,
+                natural_language_answer=error_details,
+                metadata={**metadata, "auto_fixed": False}
+            )
+            yield AskEvent(
+                "sql_error",
+                {"error": error_details, "sql": current_sql, "attempts": fix_attempts},
+                response=_response_payload(response)
+            )
+            return
+
+        logger.info("Query executed: %s rows returned", execution_result.row_count)
+        yield AskEvent("sql_success", {
+            "row_count": execution_result.row_count,
+            "truncated": execution_result.truncated,
+            "execution_time_ms": execution_result.execution_time_ms,
+            "auto_fixed": was_auto_fixed,
+            "fix_attempts": fix_attempts
+        })
+
+        # Steps 4 and 5: explain the query and analyze the results. Both only
+        # depend on the executed SQL, so the explanation (regenerated for
+        # auto-fixed SQL) runs concurrently with the streamed answer
+        yield AskEvent("status", {"step": "explanation", "message": "Generating explanation..."})
+
+        if cached and cached.explanation:
+            original_explanation = cached.explanation
+        elif compiled:
+            original_explanation = compiled.explanation
+        else:
+            original_explanation = self._memoized_explanation(request.question, sql)
+
+        if not was_auto_fixed:
+            explanation = original_explanation
+        else:
+            explanation = self._memoized_explanation(request.question, current_sql)
+            # A near-identical fix that only corrects table/column names doesn't
+            # change what the query does, so its explanation still holds
+            renamed = None
+            if (
+                explanation is None
+                and original_explanation
+                and SequenceMatcher(None, sql, current_sql).ratio() >= self.EXPLANATION_REUSE_RATIO
+            ):
+                renamed = _renamed_identifiers(sql, current_sql)
+            if renamed:
+                logger.info("Query was auto-fixed by renaming identifiers, reusing its explanation")
+                corrections = ", ".join(f"{original} to {fixed}" for original, fixed in renamed)
+                explanation = f"{original_explanation} (Auto-corrected {corrections}.)"
+            elif explanation is None:
+                logger.info("Query was auto-fixed, explaining the corrected SQL...")
+
+        if not explanation:
+            explanation = self.generator.explain_sql(current_sql)
+
+        if explanation:
+            explanation_stream = self._single(explanation)
+        else:
+            explanation_stream = self.generator.astream_chain(self.generator.explanation_chain, {
+                "question": request.question,
+                "sql": current_sql
+            })
+
+        yield AskEvent("status", {"step": "answer", "message": "Analyzing results..."})
+        if self.generator.llm_saturated:
+            yield self._queued_event()
+
+        explanation_chunks = []
+        answer_chunks = []
+        async for event_type, chunk in _merge_streams({
+            "explanation_chunk": explanation_stream,
+            "answer_chunk": self.generator.astream_analyze_results(
+                question=request.question,
+                sql=current_sql,
+                results=execution_result.rows or [],
+                row_count=execution_result.row_count
+            )
+        }):
+            if chunk is None:
+                if event_type == "explanation_chunk":
+                    explanation = "".join(explanation_chunks).strip()
+                    self._remember_explanation(request.question, current_sql, explanation)
+                    yield AskEvent("explanation_complete", {"explanation": explanation})
+                continue
+
+            (explanation_chunks if event_type == "explanation_chunk" else answer_chunks).append(chunk)
+            yield AskEvent(event_type, {"chunk": chunk})
+
+        natural_language_answer = "".join(answer_chunks).strip()
+        logger.info("Generated natural language answer")
+
+        yield AskEvent("answer_complete", {"natural_language_answer": natural_language_answer})
+
+        # Cache the SQL that actually executed successfully
+        if question_embedding is not None and not cached:
+            await asyncio.to_thread(
+                self.semantic_cache.put, request.database_id, request.question, question_embedding,
+                SQLResult.model_construct(
+                    query_id=query_id,
+                    status=QueryStatus.COMPLETED,
+                    sql=current_sql,
+                    explanation=explanation,
+                    reasoning=reasoning,
+                    metadata={"model": settings.llm_model, "source": source}
+                )
+            )
+            if source == "llm" and not cached_reasoning:
+                self.remember_reasoning(request.database_id, question_embedding, reasoning)
+
+        # Step 6: Complete result (built from validated values, so skip validation)
+        response = AskResponse.model_construct(
+            query_id=query_id,
+            question=request.question,
+            sql=current_sql,
+            sql_explanation=explanation,
+            reasoning=reasoning,
+            execution_result=execution_result,
+            natural_language_answer=natural_language_answer,
+            formatted_table=self.query_executor.format_table(execution_result),
+            metadata={**metadata, "execution_time_ms": execution_result.execution_time_ms}
+        )
+        payload = _response_payload(response)
+        yield AskEvent("complete", payload, response=payload)
@@ -2,33 +2,41 @@
 SQL Generation pipeline - converts natural language to SQL.
 """
 
+import asyncio
 import logging
-from typing import Optional, Dict, Any, List
-
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+import time
+from collections import Counter, defaultdict
+from decimal import Decimal
+from difflib import unified_diff
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
+
+import orjson
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import Runnable
+from langchain_core.rate_limiters import InMemoryRateLimiter
 from langchain_openai import ChatOpenAI
 
 from models import QueryRequest, SQLResult, QueryStatus
 from pipelines.indexing import SchemaIndexer
+from pipelines import sql_compiler
 from services.sql_validator import SQLValidator, SQLValidationError
+from services.sql_explainer import explain_sql
+from services import llm_http
 from config import settings
 
 logger = logging.getLogger(__name__)
 
 
-SQL_GENERATION_PROMPT = """You are an expert SQL query generator. Given a natural language question and database schema context, generate a valid SQL query.
-
-Database Schema Context:
-{schema_context}
+# Prompts are split into a static system message (instructions) and a user
+# message with the dynamic inputs: schema context first (stable per database),
+# then the question and per-call details. The identical prefix lets providers
+# with prompt prefix caching reuse it across calls.
 
-User Question: {question}
-
-Query Plan:
-{reasoning}
+SQL_GENERATION_SYSTEM_PROMPT = """You are an expert SQL query generator. Given a natural language question and database schema context, generate a valid SQL query.
 
 Instructions:
-1. Follow the query plan provided above
+1. Follow the query plan provided
 2. Generate a syntactically correct SQL query that answers the user's question
 3. Use only the tables and columns provided in the schema context
 4. Be precise with column names and table names (case-sensitive)
@@ -36,17 +44,24 @@ Instructions:
 6. When joining tables, always use the relationships shown in the "DATABASE RELATIONSHIPS" section
 7. Add appropriate WHERE clauses, GROUP BY, ORDER BY as needed
 8. **SECURITY**: Generate ONLY read-only queries (SELECT, SHOW, DESCRIBE, EXPLAIN). DO NOT generate INSERT, UPDATE, DELETE, DROP, or any other data modification queries.
-9. Return ONLY the SQL query without any explanation or markdown formatting
+9. Return ONLY the SQL query without any explanation or markdown formatting"""
+
+SQL_GENERATION_PROMPT = """Database Schema Context:
+{schema_context}
+
+User Question: {question}
+
+Query Plan:
+{reasoning}
 
 SQL Query:"""
 
 
-REASONING_PROMPT = """You are an expert database analyst. Analyze the user's question and the available database schema, then create a detailed step-by-step plan for generating the SQL query.
+# Stand-in plan for the speculative SQL generation that runs without reasoning
+DIRECT_SQL_REASONING = "No plan available. Write the query directly from the question and schema."
 
-Database Schema Context:
-{schema_context}
 
-User Question: {question}
+REASONING_SYSTEM_PROMPT = """You are an expert database analyst. Analyze the user's question and the available database schema, then create a detailed step-by-step plan for generating the SQL query.
 
 **IMPORTANT**: Provide ONLY high-level analysis and planning. Do NOT write any SQL code in your response.
 
@@ -61,57 +76,48 @@ Please analyze:
 8. **Step-by-Step Plan**: Provide a clear conceptual plan for constructing the query, describing each step in plain language.
 9. **Output Columns**: What columns should be included in the final output to be relevant to the user's question? Prefer human-readable fields over IDs.
 
-Remember: This is a planning phase. Describe what needs to be done, but do NOT write SQL syntax. The actual SQL will be generated in the next step based on your analysis.
-
-Analysis and Plan:"""
-
+Remember: This is a planning phase. Describe what needs to be done, but do NOT write SQL syntax. The actual SQL will be generated in the next step based on your analysis."""
 
-EXPLANATION_PROMPT = """Given this SQL query and the user's question, provide a brief explanation of what the query does.
+REASONING_PROMPT = """Database Schema Context:
+{schema_context}
 
 User Question: {question}
-SQL Query: {sql}
 
-Provide a concise explanation in 2-3 sentences of what this query does and what results it will return.
+Analysis and Plan:"""
 
-Explanation:"""
 
+EXPLANATION_SYSTEM_PROMPT = """Given a SQL query and the user's question, provide a brief explanation of what the query does.
 
-RESULT_ANALYSIS_PROMPT = """Given a user's question, the SQL query that was executed, and the results, provide a clear and concise natural language answer.
+Provide a concise explanation in 2-3 sentences of what this query does and what results it will return."""
 
-User Question: {question}
+EXPLANATION_PROMPT = """User Question: {question}
+SQL Query: {sql}
 
-SQL Query:
-{sql}
+Explanation:"""
 
-Query Results:
-{results}
 
-Total Rows: {row_count}
+RESULT_ANALYSIS_SYSTEM_PROMPT = """Given a user's question, the SQL query that was executed, and the results, provide a clear and concise natural language answer.
 
 Please provide a natural language answer that:
 1. Directly answers the user's question based on the results
 2. Highlights key findings or patterns in the data
 3. Is concise but informative (2-4 sentences)
-4. Uses natural language, not technical jargon
-
-Natural Language Answer:"""
+4. Uses natural language, not technical jargon"""
 
+RESULT_ANALYSIS_PROMPT = """User Question: {question}
 
-SQL_FIX_PROMPT = """You are an expert SQL debugger. A SQL query has failed with an error. Analyze the error and fix the query.
+SQL Query:
+{sql}
 
-Database Schema Context:
-{schema_context}
+Query Results:
+{results}
 
-Original User Question: {question}
+Total Rows: {row_count}
 
-Previous Query (FAILED):
-{failed_sql}
+Natural Language Answer:"""
 
-Error Message:
-{error_message}
 
-Previous Fix Attempts: {attempt_number}/5
-{previous_attempts}
+SQL_FIX_SYSTEM_PROMPT = """You are an expert SQL debugger. A SQL query has failed with an error. Analyze the error and fix the query.
 
 Instructions:
 1. Carefully analyze the error message
@@ -125,11 +131,210 @@ Instructions:
    - Syntax errors (missing commas, parentheses, quotes)
    - Ambiguous column names (need table prefix)
    - Wrong aggregate functions or GROUP BY clauses
-6. Return ONLY the fixed SQL query without any explanation or markdown formatting
+6. Previous attempts after the first may be shown as unified diffs against the attempt before them
+7. Return ONLY the fixed SQL query without any explanation or markdown formatting"""
+
+SQL_FIX_PROMPT = """Database Schema Context:
+{schema_context}
+
+Original User Question: {question}
+
+Previous Query (FAILED):
+{failed_sql}
+
+Error Message:
+{error_message}
+
+Fix Round: {fix_round}/{max_fix_rounds} (attempt {attempt_number})
+{previous_attempts}
 
 Fixed SQL Query:"""
 
 
+# Result rows shown to the LLM, and the per-value character cap
+ANALYSIS_SAMPLE_ROWS = 10
+ANALYSIS_MAX_VALUE_CHARS = 80
+
+# Results with more rows than this also get per-column statistics
+ANALYSIS_SUMMARY_MIN_ROWS = 50
+
+EMPTY_RESULT_ANSWER = "The query returned no rows, so no data matches your question."
+
+
+def _truncate(value: Any) -> Any:
+    """Cap long strings so a single wide value can't dominate the prompt."""
+    if isinstance(value, str) and len(value) > ANALYSIS_MAX_VALUE_CHARS:
+        return value[:ANALYSIS_MAX_VALUE_CHARS - 3] + "..."
+    return value
+
+
+def _format_result_rows(rows: List[Dict[str, Any]]) -> str:
+    """Render rows as compact JSON lines."""
+    return "\n".join(
+        orjson.dumps(
+            {column: _truncate(value) for column, value in row.items()},
+            default=str,
+            option=orjson.OPT_NON_STR_KEYS
+        ).decode()
+        for row in rows
+    )
+
+
+def _summarize_columns(results: List[Dict[str, Any]]) -> str:
+    """Per-column statistics: min/max/mean for numeric columns, most common values otherwise."""
+    lines = []
+    for column in results[0]:
+        values = [row.get(column) for row in results if row.get(column) is not None]
+        numbers = [v for v in values if isinstance(v, (int, float, Decimal)) and not isinstance(v, bool)]
+        if values and len(numbers) == len(values):
+            mean = sum(float(v) for v in numbers) / len(numbers)
+            lines.append(f"- {column}: min {min(numbers)}, max {max(numbers)}, mean {mean:.4g}")
+        elif values:
+            top = Counter(str(_truncate(v)) for v in values).most_common(3)
+            top_text = ", ".join(f"{value} ({count})" for value, count in top)
+            lines.append(f"- {column}: {len(set(map(str, values)))} distinct, most common: {top_text}")
+        else:
+            lines.append(f"- {column}: all NULL")
+    return "\n".join(lines)
+
+
+# Previous fix attempts: diff lines shown per attempt, and error characters kept
+# from the start and end of long error messages
+FIX_DIFF_MAX_LINES = 20
+FIX_ERROR_HEAD_CHARS = 300
+FIX_ERROR_TAIL_CHARS = 100
+
+
+def _truncate_error(error: str) -> str:
+    """Keep the start and end of a long error message."""
+    if len(error) <= FIX_ERROR_HEAD_CHARS + FIX_ERROR_TAIL_CHARS:
+        return error
+    return error[:FIX_ERROR_HEAD_CHARS] + " ... " + error[-FIX_ERROR_TAIL_CHARS:]
+
+
+def _sql_diff(previous_sql: str, sql: str) -> str:
+    """Render a query as a diff against the previous one, or in full if that's shorter."""
+    diff = list(unified_diff(previous_sql.splitlines(), sql.splitlines(), n=1, lineterm=""))[2:]
+    diff_text = "\n".join(diff[:FIX_DIFF_MAX_LINES])
+    if not diff or len(diff) > FIX_DIFF_MAX_LINES or len(diff_text) >= len(sql):
+        return f"SQL: {sql}"
+    return f"SQL (diff against the previous attempt):\n{diff_text}"
+
+
+def _format_previous_attempts(previous_attempts: List[Dict[str, str]]) -> str:
+    """Format failed fix attempts; after the first, queries are shown as diffs when shorter."""
+    if not previous_attempts:
+        return ""
+    
+    parts = ["\n\nPrevious failed attempts:"]
+    previous_sql = None
+    for i, attempt in enumerate(previous_attempts, 1):
+        sql_text = f"SQL: {attempt['sql']}" if previous_sql is None else _sql_diff(previous_sql, attempt['sql'])
+        parts.append(f"\n\nAttempt {i}:\n{sql_text}\nError: {_truncate_error(attempt['error'])}")
+        previous_sql = attempt['sql']
+    return "".join(parts)
+
+
+class PromptChain:
+    """
+    Prompt -> LLM -> text, with ainvoke/astream like the equivalent LCEL chain.
+    
+    The system message is built once and shared by every call; a call only
+    formats the user message (plain str.format_map) and calls the LLM directly,
+    skipping prompt templating and the Runnable sequence overhead.
+    """
+    
+    def __init__(self, system_prompt: str, user_prompt: str, llm: Runnable):
+        self.system_message = SystemMessage(content=system_prompt)
+        self.user_prompt = user_prompt
+        self.llm = llm
+    
+    def bind(self, **kwargs) -> "PromptChain":
+        """Same prompt with LLM call options (e.g. temperature) bound."""
+        return PromptChain(self.system_message.content, self.user_prompt, self.llm.bind(**kwargs))
+    
+    def messages(self, inputs: Dict[str, Any]) -> List[BaseMessage]:
+        """Build the chat messages for a call."""
+        return [self.system_message, HumanMessage(content=self.user_prompt.format_map(inputs))]
+    
+    async def ainvoke(self, inputs: Dict[str, Any]) -> str:
+        """Call the LLM and return its text."""
+        message = await self.llm.ainvoke(self.messages(inputs))
+        return message.content
+    
+    async def astream(self, inputs: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream the LLM's text chunks."""
+        async for chunk in self.llm.astream(self.messages(inputs)):
+            if chunk.content:
+                yield chunk.content
+
+
+_RULE = "=" * 60
+
+# Context sections in output order: (document type, section header)
+_CONTEXT_SECTIONS = (
+    # Relationships first (important for JOINs)
+    ("relationships", (_RULE, "DATABASE RELATIONSHIPS", _RULE)),
+    ("instruction", ("\n" + _RULE, "DOMAIN KNOWLEDGE & INSTRUCTIONS", _RULE)),
+    ("sql_pair", ("\n" + _RULE, "EXAMPLE QUERIES (Similar to this question)", _RULE)),
+)
+_SECTION_TYPES = frozenset(doc_type for doc_type, _ in _CONTEXT_SECTIONS)
+_TABLE_TYPES = frozenset(("table", "column"))
+
+# Rough characters per token, for context budgets (no tokenizer for local models)
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=1024)
+def _render_schema_context(
+    entries: Tuple[Tuple[Optional[str], Optional[str], str], ...],
+    max_chars: Optional[int] = None
+) -> str:
+    """
+    Render (type, table_name, page_content) entries of retrieved documents as schema context.
+    
+    With max_chars, entries are kept in retrieval (relevance) order while they
+    fit; the most relevant entry is always kept.
+    """
+    if max_chars is not None:
+        kept, used = [], 0
+        for entry in entries:
+            if kept and used + len(entry[2]) > max_chars:
+                continue
+            kept.append(entry)
+            used += len(entry[2])
+        entries = kept
+    
+    # Bucket documents by section in one pass
+    sections = defaultdict(list)
+    tables = defaultdict(list)
+    for doc_type, table_name, content in entries:
+        if doc_type in _SECTION_TYPES:
+            sections[doc_type].append(content)
+        elif doc_type in _TABLE_TYPES and table_name:
+            tables[table_name].append(content)
+        else:
+            sections[None].append(content)
+    
+    context_parts = []
+    for doc_type, header in _CONTEXT_SECTIONS:
+        if doc_type in sections:
+            context_parts.extend(header)
+            context_parts.extend(sections[doc_type])
+    
+    # Format tables and columns
+    if tables:
+        context_parts.extend(("\n" + _RULE, "DATABASE SCHEMA", _RULE))
+        for table_name, table_contents in tables.items():
+            context_parts.append(f"\n--- Table: {table_name} ---")
+            context_parts.extend(table_contents)
+    
+    # Add any other documents
+    context_parts.extend(sections[None])
+    
+    return "\n".join(context_parts)
+
+
 class SQLGenerator:
     """
     Generates SQL queries from natural language questions.
@@ -144,6 +349,9 @@ class SQLGenerator:
             "model": settings.llm_model,
             "temperature": settings.llm_temperature,
             "max_tokens": settings.llm_max_tokens,
+            # Pooled keep-alive connections shared with the embeddings client
+            "http_async_client": llm_http.get_async_client(),
+            "http_client": llm_http.get_sync_client(),
         }
         
         # Add API key if provided (optional for local models)
@@ -153,89 +361,271 @@ class SQLGenerator:
         # Add base_url for local LLMs (e.g., Ollama, LM Studio, LocalAI)
         if settings.llm_base_url:
             llm_kwargs["base_url"] = settings.llm_base_url
-            logger.info(f"Using custom LLM endpoint: {settings.llm_base_url}")
+            logger.info("Using custom LLM endpoint: %s", settings.llm_base_url)
+        
+        # Token bucket for provider rate limits, bursts up to the concurrency limit
+        if settings.llm_requests_per_second:
+            llm_kwargs["rate_limiter"] = InMemoryRateLimiter(
+                requests_per_second=settings.llm_requests_per_second,
+                check_every_n_seconds=0.05,
+                max_bucket_size=settings.llm_max_concurrency
+            )
         
         self.llm = ChatOpenAI(**llm_kwargs)
         
-        # Create prompts
-        self.reasoning_prompt = ChatPromptTemplate.from_template(REASONING_PROMPT)
-        self.sql_prompt = ChatPromptTemplate.from_template(SQL_GENERATION_PROMPT)
-        self.explanation_prompt = ChatPromptTemplate.from_template(EXPLANATION_PROMPT)
-        self.result_analysis_prompt = ChatPromptTemplate.from_template(RESULT_ANALYSIS_PROMPT)
-        self.sql_fix_prompt = ChatPromptTemplate.from_template(SQL_FIX_PROMPT)
+        # Caps outstanding LLM requests across all concurrent asks
+        self.llm_slots = asyncio.Semaphore(settings.llm_max_concurrency)
         
         # Create chains
-        self.reasoning_chain = self.reasoning_prompt | self.llm | StrOutputParser()
-        self.sql_chain = self.sql_prompt | self.llm | StrOutputParser()
-        self.explanation_chain = self.explanation_prompt | self.llm | StrOutputParser()
-        self.result_analysis_chain = self.result_analysis_prompt | self.llm | StrOutputParser()
-        self.sql_fix_chain = self.sql_fix_prompt | self.llm | StrOutputParser()
-        
-    async def generate_sql(self, request: QueryRequest) -> SQLResult:
-        """Generate SQL from natural language question with step-by-step reasoning."""
+        self.reasoning_chain = PromptChain(REASONING_SYSTEM_PROMPT, REASONING_PROMPT, self.llm)
+        self.sql_chain = PromptChain(SQL_GENERATION_SYSTEM_PROMPT, SQL_GENERATION_PROMPT, self.llm)
+        self.explanation_chain = PromptChain(EXPLANATION_SYSTEM_PROMPT, EXPLANATION_PROMPT, self.llm)
+        self.result_analysis_chain = PromptChain(RESULT_ANALYSIS_SYSTEM_PROMPT, RESULT_ANALYSIS_PROMPT, self.llm)
+        self.sql_fix_chain = PromptChain(SQL_FIX_SYSTEM_PROMPT, SQL_FIX_PROMPT, self.llm)
+        
+        # Fix chains bound to a sampling temperature, built once per temperature
+        self._sql_fix_chains: Dict[float, Any] = {}
+        
+        # Heartbeat that keeps a local model loaded between requests
+        self._last_llm_call = time.monotonic()
+        self._keepalive_task: Optional[asyncio.Task] = None
+        
+    @property
+    def llm_saturated(self) -> bool:
+        """True when every LLM slot is taken and new calls will queue."""
+        return self.llm_slots.locked()
+    
+    async def ainvoke_chain(self, chain, inputs: Dict[str, Any]) -> str:
+        """
+        Invoke an LLM chain once an LLM slot is free.
+        
+        Args:
+            chain: Prompt chain to invoke
+            inputs: Prompt inputs
+            
+        Returns:
+            Chain output
+        """
+        async with self.llm_slots:
+            self._last_llm_call = time.monotonic()
+            return await chain.ainvoke(inputs)
+    
+    async def astream_chain(self, chain, inputs: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Stream an LLM chain, holding an LLM slot until the stream ends.
+        
+        Args:
+            chain: Prompt chain to stream
+            inputs: Prompt inputs
+            
+        Yields:
+            Output chunks
+        """
+        async with self.llm_slots:
+            self._last_llm_call = time.monotonic()
+            async for chunk in chain.astream(inputs):
+                yield chunk
+    
+    def start_keepalive(self):
+        """
+        Start pinging a custom LLM endpoint while it is idle.
+        
+        Local servers (Ollama, LM Studio) unload idle models, so the next user
+        request pays the model load. Only runs when llm_base_url is set.
+        """
+        if not settings.llm_base_url or not settings.llm_keepalive_interval or self._keepalive_task:
+            return
+        self._keepalive_task = asyncio.create_task(self._keepalive())
+        logger.info("LLM keep-alive every %.0fs", settings.llm_keepalive_interval)
+    
+    async def stop_keepalive(self):
+        """Stop the keep-alive heartbeat."""
+        task, self._keepalive_task = self._keepalive_task, None
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    
+    async def _keepalive(self):
+        """Send a one-token request whenever the LLM was idle for a full interval."""
+        interval = settings.llm_keepalive_interval
+        while True:
+            await asyncio.sleep(interval)
+            # Real traffic keeps the model loaded; never take a slot from it
+            if time.monotonic() - self._last_llm_call < interval or self.llm_saturated:
+                continue
+            try:
+                async with self.llm_slots:
+                    self._last_llm_call = time.monotonic()
+                    await self.llm.bind(max_tokens=1).ainvoke(".")
+            except Exception as e:
+                logger.debug("LLM keep-alive failed: %s", e)
+    
+    async def astream_sql(self, inputs: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Stream the SQL chain, aborting as soon as a write statement is generated.
+        
+        Args:
+            inputs: SQL prompt inputs
+            
+        Yields:
+            SQL chunks
+            
+        Raises:
+            SQLValidationError: If a forbidden statement appears in the output
+        """
+        chunks = []
+        stream = self.astream_chain(self.sql_chain, inputs)
         try:
-            logger.info(f"Generating SQL for query: {request.query_id}")
+            async for chunk in stream:
+                chunks.append(chunk)
+                keyword = SQLValidator.find_forbidden_keyword("".join(chunks))
+                if keyword:
+                    logger.error("Aborting SQL generation, forbidden statement generated: %s", keyword)
+                    raise SQLValidationError(f"Query contains forbidden statement: {keyword}")
+                yield chunk
+        finally:
+            # Closes the LLM response early when aborted
+            await stream.aclose()
+    
+    async def ainvoke_sql(self, inputs: Dict[str, Any]) -> str:
+        """
+        Generate SQL, aborting as soon as a write statement is generated.
+        
+        Args:
+            inputs: SQL prompt inputs
+            
+        Returns:
+            Raw SQL chain output
+        """
+        return "".join([chunk async for chunk in self.astream_sql(inputs)])
+    
+    async def generate_sql(self, request: QueryRequest, reasoning: Optional[str] = None) -> SQLResult:
+        """
+        Generate SQL from natural language question with step-by-step reasoning.
+        
+        Args:
+            request: Query request
+            reasoning: Cached query plan of a similar question; skips the reasoning step
+            
+        Returns:
+            SQLResult with the SQL, explanation and reasoning
+        """
+        direct_sql_task = None
+        explanation_task = None
+        try:
+            logger.info("Generating SQL for query: %s", request.query_id)
             
             # Step 1: Retrieve relevant schema context
-            schema_docs = self.indexer.retrieve_context(
+            schema_docs = await self.indexer.aretrieve_context(
                 request.database_id, 
                 request.question,
                 k=10
             )
             
             if not schema_docs:
-                return SQLResult(
+                return SQLResult.model_construct(
                     query_id=request.query_id,
                     status=QueryStatus.FAILED,
                     error=f"No schema found for database: {request.database_id}"
                 )
             
-            # Format schema context
-            schema_context = self._format_schema_context(schema_docs)
+            # Format schema context, planning gets a leaner budget than SQL generation
+            schema_context = self._format_schema_context(schema_docs, settings.sql_context_tokens)
+            reasoning_context = self._format_schema_context(schema_docs, settings.reasoning_context_tokens)
             
-            logger.info(f"Retrieved {len(schema_docs)} relevant schema documents")
+            logger.info("Retrieved %s relevant schema documents", len(schema_docs))
             
-            # Step 2: Generate reasoning/plan
-            logger.info("Generating query plan and reasoning...")
-            reasoning = await self.reasoning_chain.ainvoke({
-                "schema_context": schema_context,
-                "question": request.question
-            })
-            reasoning = reasoning.strip()
+            # Simple structural questions are compiled without calling the LLM
+            compiled = self.compile_sql(request.question, schema_docs)
+            if compiled:
+                return SQLResult.model_construct(
+                    query_id=request.query_id,
+                    status=QueryStatus.COMPLETED,
+                    sql=compiled.sql,
+                    explanation=compiled.explanation,
+                    reasoning=compiled.reasoning,
+                    metadata={
+                        "num_schema_docs": len(schema_docs),
+                        "model": settings.llm_model,
+                        "source": "compiled"
+                    }
+                )
             
-            logger.info(f"Generated reasoning: {reasoning[:200]}...")
+            # Step 2: Generate reasoning/plan, unless a cached one was passed in
+            if reasoning is not None:
+                logger.info("Reusing cached query plan")
+            else:
+                # Optionally a plan-less SQL generation runs alongside it and is
+                # used if the reasoning fails or times out
+                if settings.sql_speculative_direct:
+                    direct_sql_task = asyncio.create_task(self.ainvoke_sql({
+                        "schema_context": schema_context,
+                        "question": request.question,
+                        "reasoning": DIRECT_SQL_REASONING
+                    }))
+            
+                logger.info("Generating query plan and reasoning...")
+                try:
+                    reasoning = await asyncio.wait_for(
+                        self.ainvoke_chain(self.reasoning_chain, {
+                            "schema_context": reasoning_context,
+                            "question": request.question
+                        }),
+                        timeout=settings.reasoning_timeout if direct_sql_task else None
+                    )
+                    reasoning = reasoning.strip()
+                    logger.info("Generated reasoning: %.200s...", reasoning)
+                except Exception as e:
+                    if direct_sql_task is None:
+                        raise
+                    logger.warning("Reasoning failed (%r), using the SQL generated without a plan", e)
+                    reasoning = None
             
             # Step 3: Generate SQL using LLM with reasoning
-            logger.info("Generating SQL query based on plan...")
-            sql = await self.sql_chain.ainvoke({
-                "schema_context": schema_context,
-                "question": request.question,
-                "reasoning": reasoning
-            })
+            if reasoning is not None:
+                if direct_sql_task:
+                    direct_sql_task.cancel()
+                logger.info("Generating SQL query based on plan...")
+                sql = await self.ainvoke_sql({
+                    "schema_context": schema_context,
+                    "question": request.question,
+                    "reasoning": reasoning
+                })
+            else:
+                sql = await direct_sql_task
+                reasoning = ""
             
             # Clean up SQL (remove markdown, extra whitespace)
             sql = self._clean_sql(sql)
             
+            # Step 4: Explain simple queries from their syntax tree, others with the
+            # LLM (started before validation so it overlaps it)
+            explanation = self.explain_sql(sql)
+            if explanation is None:
+                explanation_task = asyncio.create_task(self.ainvoke_chain(self.explanation_chain, {
+                    "question": request.question,
+                    "sql": sql
+                }))
+            
             # Validate SQL for security
             is_valid, validation_error = SQLValidator.validate(sql)
             if not is_valid:
-                logger.error(f"Generated SQL failed validation: {validation_error}")
-                return SQLResult(
+                logger.error("Generated SQL failed validation: %s", validation_error)
+                return SQLResult.model_construct(
                     query_id=request.query_id,
                     status=QueryStatus.FAILED,
                     error=f"Generated query is not allowed: {validation_error}. Only SELECT and discovery queries are permitted."
                 )
             
-            logger.info(f"Generated SQL: {sql[:100]}...")
-
+            logger.info("Generated SQL: %.100s...", sql)
             
-            # Step 4: Generate explanation
-            explanation = await self.explanation_chain.ainvoke({
-                "question": request.question,
-                "sql": sql
-            })
+            if explanation_task:
+                explanation = await explanation_task
             
-            return SQLResult(
+            return SQLResult.model_construct(
                 query_id=request.query_id,
                 status=QueryStatus.COMPLETED,
                 sql=sql,
@@ -243,97 +633,92 @@ class SQLGenerator:
                 reasoning=reasoning,
                 metadata={
                     "num_schema_docs": len(schema_docs),
-                    "model": settings.llm_model
+                    "model": settings.llm_model,
+                    "source": "llm"
                 }
             )
             
+        except SQLValidationError as e:
+            return SQLResult.model_construct(
+                query_id=request.query_id,
+                status=QueryStatus.FAILED,
+                error=f"Generated query is not allowed: {e}. Only SELECT and discovery queries are permitted."
+            )
+        
         except Exception as e:
-            logger.error(f"Error generating SQL: {str(e)}")
-            return SQLResult(
+            logger.error("Error generating SQL: %s", e)
+            return SQLResult.model_construct(
                 query_id=request.query_id,
                 status=QueryStatus.FAILED,
                 error=str(e)
             )
+        
+        finally:
+            # Neither LLM call is needed once generate_sql returns
+            for task in (direct_sql_task, explanation_task):
+                if task:
+                    task.cancel()
     
-    def _format_schema_context(self, docs) -> str:
-        """Format retrieved documents into schema context."""
-        context_parts = []
-        
-        # Separate documents by type
-        tables = {}
-        relationships = []
-        instructions = []
-        sql_pairs = []
-        other = []
-        
-        for doc in docs:
-            doc_type = doc.metadata.get("type")
-            
-            if doc_type == "relationships":
-                relationships.append(doc)
-            elif doc_type == "instruction":
-                instructions.append(doc)
-            elif doc_type == "sql_pair":
-                sql_pairs.append(doc)
-            elif doc_type in ["table", "column"]:
-                table_name = doc.metadata.get("table_name")
-                if table_name:
-                    if table_name not in tables:
-                        tables[table_name] = []
-                    tables[table_name].append(doc)
-                else:
-                    other.append(doc)
-            else:
-                other.append(doc)
-        
-        # Format relationships first (important for JOINs)
-        if relationships:
-            context_parts.append("=" * 60)
-            context_parts.append("DATABASE RELATIONSHIPS")
-            context_parts.append("=" * 60)
-            for doc in relationships:
-                context_parts.append(doc.page_content)
-        
-        # Format instructions (domain knowledge)
-        if instructions:
-            context_parts.append("\n" + "=" * 60)
-            context_parts.append("DOMAIN KNOWLEDGE & INSTRUCTIONS")
-            context_parts.append("=" * 60)
-            for doc in instructions:
-                context_parts.append(doc.page_content)
-        
-        # Format SQL pairs (example queries)
-        if sql_pairs:
-            context_parts.append("\n" + "=" * 60)
-            context_parts.append("EXAMPLE QUERIES (Similar to this question)")
-            context_parts.append("=" * 60)
-            for doc in sql_pairs:
-                context_parts.append(doc.page_content)
-        
-        # Format tables and columns
-        if tables:
-            context_parts.append("\n" + "=" * 60)
-            context_parts.append("DATABASE SCHEMA")
-            context_parts.append("=" * 60)
-            for table_name, table_docs in tables.items():
-                context_parts.append(f"\n--- Table: {table_name} ---")
-                for doc in table_docs:
-                    context_parts.append(doc.page_content)
-        
-        # Add any other documents
-        if other:
-            for doc in other:
-                context_parts.append(doc.page_content)
-        
-        return "\n".join(context_parts)
+    def explain_sql(self, sql: str) -> Optional[str]:
+        """
+        Explain a simple query deterministically.
+        
+        Args:
+            sql: SQL query to explain
+            
+        Returns:
+            Explanation, or None if the LLM should explain the query
+        """
+        if not settings.sql_explainer_enabled:
+            return None
+        return explain_sql(sql)
+    
+    def compile_sql(self, question: str, schema_docs) -> Optional[sql_compiler.CompiledQuery]:
+        """
+        Try to compile the question to SQL deterministically.
+        
+        Returns None when the compiler is disabled, the question doesn't match a
+        known pattern, or the compiled SQL doesn't pass validation.
+        """
+        if not settings.sql_compiler_enabled:
+            return None
+        
+        compiled = sql_compiler.compile_question(question, schema_docs)
+        if not compiled:
+            return None
+        
+        is_valid, validation_error = SQLValidator.validate(compiled.sql)
+        if not is_valid:
+            logger.warning("Compiled SQL failed validation: %s", validation_error)
+            return None
+        
+        logger.info("Compiled SQL without LLM: %s", compiled.sql)
+        return compiled
+    
+    def _format_schema_context(self, docs, max_tokens: Optional[int] = None) -> str:
+        """
+        Format retrieved documents into schema context.
+        
+        Args:
+            docs: Retrieved documents, most relevant first
+            max_tokens: Approximate token budget; less relevant documents beyond it are dropped
+            
+        Returns:
+            Schema context for a prompt
+        """
+        # Only type, table and content matter, so identical retrievals reuse the rendered text
+        return _render_schema_context(tuple(
+            (doc.metadata.get("type"), doc.metadata.get("table_name"), doc.page_content)
+            for doc in docs
+        ), max_tokens * CHARS_PER_TOKEN if max_tokens else None)
+    
+    # Markdown code fences around generated SQL, removed in a single pass
+    _MARKDOWN_FENCE = SQLValidator.MARKDOWN_FENCE_PATTERN
     
     def _clean_sql(self, sql: str) -> str:
         """Clean up generated SQL."""
-        # Remove markdown code blocks
-        sql = sql.replace("```sql", "").replace("```", "")
-        
-        # Remove extra whitespace
-        sql = sql.strip()
+        # Remove markdown code blocks and extra whitespace
+        sql = self._MARKDOWN_FENCE.sub("", sql).strip()
         
         # Ensure it ends with semicolon
         if not sql.endswith(";"):
@@ -360,28 +745,74 @@ class SQLGenerator:
         Returns:
             Natural language answer
         """
+        if not results:
+            return EMPTY_RESULT_ANSWER
+        
         try:
-            # Format results for prompt (limit to first 10 rows for context)
-            sample_results = results[:10] if results else []
-            results_text = "\n".join([str(row) for row in sample_results])
-            
-            if len(results) > 10:
-                results_text += f"\n... (showing 10 of {len(results)} rows)"
-            
             # Generate natural language answer
-            answer = await self.result_analysis_chain.ainvoke({
-                "question": question,
-                "sql": sql,
-                "results": results_text,
-                "row_count": row_count
-            })
+            answer = await self.ainvoke_chain(
+                self.result_analysis_chain,
+                self._result_analysis_inputs(question, sql, results, row_count)
+            )
             
             return answer.strip()
             
         except Exception as e:
-            logger.error(f"Error analyzing results: {str(e)}")
+            logger.error("Error analyzing results: %s", e)
             return f"Query returned {row_count} rows. Unable to generate detailed analysis."
     
+    async def astream_analyze_results(
+        self, 
+        question: str, 
+        sql: str, 
+        results: List[Dict[str, Any]],
+        row_count: int
+    ) -> AsyncIterator[str]:
+        """
+        Stream the natural language explanation of query results token by token.
+        
+        Same inputs as analyze_results. On error the fallback answer is yielded instead.
+        """
+        if not results:
+            yield EMPTY_RESULT_ANSWER
+            return
+        
+        try:
+            async for chunk in self.astream_chain(
+                self.result_analysis_chain,
+                self._result_analysis_inputs(question, sql, results, row_count)
+            ):
+                yield chunk
+                
+        except Exception as e:
+            logger.error("Error analyzing results: %s", e)
+            yield f"Query returned {row_count} rows. Unable to generate detailed analysis."
+    
+    def _result_analysis_inputs(
+        self, 
+        question: str, 
+        sql: str, 
+        results: List[Dict[str, Any]],
+        row_count: int
+    ) -> Dict[str, Any]:
+        """Build the result analysis prompt inputs."""
+        # Format results for prompt as compact JSON lines, limited to a few rows
+        results_text = _format_result_rows(results[:ANALYSIS_SAMPLE_ROWS])
+        
+        if len(results) > ANALYSIS_SAMPLE_ROWS:
+            results_text += f"\n... (showing {ANALYSIS_SAMPLE_ROWS} of {len(results)} rows)"
+        
+        # Summarize larger results instead of showing more rows
+        if len(results) > ANALYSIS_SUMMARY_MIN_ROWS:
+            results_text += f"\n\nColumn summary (all {len(results)} rows):\n{_summarize_columns(results)}"
+        
+        return {
+            "question": question,
+            "sql": sql,
+            "results": results_text,
+            "row_count": row_count
+        }
+    
     async def fix_sql(
         self,
         question: str,
@@ -390,7 +821,9 @@ class SQLGenerator:
         schema_context: str,
         reasoning: str,
         attempt_number: int,
-        previous_attempts: List[Dict[str, str]]
+        previous_attempts: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        fix_round: int = 1
     ) -> str:
         """
         Attempt to fix a failed SQL query.
@@ -401,31 +834,42 @@ class SQLGenerator:
             error_message: The error message from the database
             schema_context: Database schema context
             reasoning: Original query plan/reasoning
-            attempt_number: Current attempt number (1-5)
+            attempt_number: Current attempt number (failed queries so far + 1)
             previous_attempts: List of previous fix attempts with errors
+            temperature: Optional sampling temperature override, used to get
+                diverse candidates when several fixes are generated concurrently
+            fix_round: Current fix round (1 to settings.sql_fix_rounds)
             
         Returns:
             Fixed SQL query
         """
         try:
-            logger.info(f"Attempting to fix SQL (attempt {attempt_number}/5)")
-            logger.info(f"Error: {error_message[:200]}")
+            logger.info(
+                "Attempting to fix SQL (round %s/%s, attempt %s)",
+                fix_round, settings.sql_fix_rounds, attempt_number
+            )
+            logger.info("Error: %.200s", error_message)
             
-            # Format previous attempts
-            previous_attempts_text = ""
-            if previous_attempts:
-                previous_attempts_text = "\n\nPrevious failed attempts:"
-                for i, attempt in enumerate(previous_attempts, 1):
-                    previous_attempts_text += f"\n\nAttempt {i}:\nSQL: {attempt['sql']}\nError: {attempt['error']}"
+            # Format previous attempts (later ones as diffs, errors truncated)
+            previous_attempts_text = _format_previous_attempts(previous_attempts)
             
             # Generate fixed SQL
-            fixed_sql = await self.sql_fix_chain.ainvoke({
+            fix_chain = self.sql_fix_chain
+            if temperature is not None:
+                fix_chain = self._sql_fix_chains.get(temperature)
+                if fix_chain is None:
+                    fix_chain = self.sql_fix_chain.bind(temperature=temperature)
+                    self._sql_fix_chains[temperature] = fix_chain
+            
+            fixed_sql = await self.ainvoke_chain(fix_chain, {
                 "schema_context": schema_context,
                 "question": question,
                 "failed_sql": failed_sql,
-                "error_message": error_message,
+                "error_message": _truncate_error(error_message),
                 "reasoning": reasoning,
                 "attempt_number": attempt_number,
+                "fix_round": fix_round,
+                "max_fix_rounds": settings.sql_fix_rounds,
                 "previous_attempts": previous_attempts_text
             })
             
@@ -435,17 +879,17 @@ class SQLGenerator:
             # Validate the fixed SQL
             is_valid, validation_error = SQLValidator.validate(fixed_sql)
             if not is_valid:
-                logger.warning(f"Fixed SQL failed validation: {validation_error}")
+                logger.warning("Fixed SQL failed validation: %s", validation_error)
                 # Return the failed SQL so the error can be reported properly
                 return failed_sql
             
-            logger.info(f"Generated fix: {fixed_sql[:100]}...")
+            logger.info("Generated fix: %.100s...", fixed_sql)
 
             
             return fixed_sql
             
         except Exception as e:
-            logger.error(f"Error in fix_sql: {str(e)}")
+            logger.error("Error in fix_sql: %s", e)
             # Return original SQL if fix fails
             return failed_sql
 
@@ -2,39 +2,67 @@
 Schema indexing pipeline - stores database schemas for retrieval.
 """
 
-import json
+import asyncio
+import gzip
 import re
-from typing import Dict, Any, List, Optional
+import uuid
+from collections import OrderedDict
+from functools import lru_cache, partial
+from typing import Dict, Any, List, Optional, Tuple
 from pathlib import Path
 import logging
 
+import faiss
+import numpy as np
+import orjson
 from langchain_core.documents import Document
 from langchain_openai import OpenAIEmbeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 
 from models import DatabaseSchema, TableSchema, IndexingRequest, IndexingResult
 from config import settings
+from services import llm_http
+from services.retrieval_cache import RetrievalCache
 
 logger = logging.getLogger(__name__)
 
 
+# Control characters deleted by clean_text, characters outside printable ASCII
+# replaced by a space and whitespace runs collapsed
+_CTRL_TABLE = str.maketrans(dict.fromkeys([*range(0x00, 0x20), *range(0x7f, 0xa0)]))
+_NON_ASCII_RE = re.compile(r'[^\x20-\x7e]')
+_WS_RE = re.compile(r'\s+')
+
+# Per-column and per-relationship lines of the schema documents
+_TABLE_COLUMN_TMPL = "  - %s (%s)\n"
+_TABLE_COLUMN_DESC_TMPL = "  - %s (%s): %s\n"
+_COLUMN_TMPL = "Column: %s\nTable: %s\nType: %s\n"
+_REL_TMPL = "- %s.%s → %s.%s\n  JOIN %s ON %s.%s = %s.%s\n\n"
+
+
 def clean_text(text: str, max_length: int = 1000) -> str:
     """Clean text to remove invalid tokens and limit length."""
     if not text:
         return ""
-    
-    # Convert to string and strip
-    text = str(text).strip()
+    return _clean_text(str(text), max_length)
+
+
+@lru_cache(maxsize=4096)
+def _clean_text(text: str, max_length: int) -> str:
+    """Clean a string; cached since column types and descriptions repeat across tables."""
+    text = text.strip()
     
     # Remove control characters and non-printable characters
-    text = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', text)
+    text = text.translate(_CTRL_TABLE)
     
     # Keep only ASCII printable characters (space to tilde)
     # This removes accented characters and special Unicode that might cause issues
-    text = ''.join(char if 32 <= ord(char) <= 126 else ' ' for char in text)
+    if not text.isascii():
+        text = _NON_ASCII_RE.sub(' ', text)
     
     # Replace multiple whitespaces with single space
-    text = re.sub(r'\s+', ' ', text)
+    text = _WS_RE.sub(' ', text)
     
     # Limit length
     if len(text) > max_length:
@@ -48,10 +76,26 @@ class SchemaIndexer:
     Indexes database schemas into a vector store for semantic retrieval.
     """
     
+    # Knowledge base documents added within this window (seconds) are indexed together
+    KB_BATCH_DELAY = 0.05
+    KB_BATCH_SIZE = 64
+    
+    # HNSW graph degree and search breadth (vector_store_index = "hnsw")
+    HNSW_M = 32
+    HNSW_EF_SEARCH = 64
+    # Product quantization (vector_store_index = "ivfpq"): up to PQ_SUBVECTORS
+    # one-byte codes per vector, IVF_NPROBE of the clusters searched per query
+    PQ_SUBVECTORS = 64
+    PQ_BITS = 8
+    IVF_NPROBE = 8
+    
     def __init__(self):
         # Initialize embeddings with optional base_url for local models
         embedding_kwargs = {
             "model": settings.embedding_model,
+            # Pooled keep-alive connections shared with the LLM client
+            "http_async_client": llm_http.get_async_client(),
+            "http_client": llm_http.get_sync_client(),
         }
         
         # Add API key if provided (optional for local models)
@@ -63,6 +107,10 @@ class SchemaIndexer:
             embedding_kwargs["openai_api_base"] = settings.embedding_base_url
             logger.info(f"Using custom embedding endpoint: {settings.embedding_base_url}")
         
+        # Texts per embedding request; a whole schema usually fits in one
+        if settings.embedding_batch_size:
+            embedding_kwargs["chunk_size"] = settings.embedding_batch_size
+        
         self.embeddings = OpenAIEmbeddings(**embedding_kwargs)
         self.vector_store_path = Path(settings.vector_store_path)
         self.vector_store_path.mkdir(parents=True, exist_ok=True)
@@ -71,111 +119,190 @@ class SchemaIndexer:
         self.dumps_path = Path("./data/indexed_dumps")
         self.dumps_path.mkdir(parents=True, exist_ok=True)
         
-        self.stores: Dict[str, FAISS] = {}
+        # Loaded indexes, least recently used first
+        self.stores: "OrderedDict[str, FAISS]" = OrderedDict()
+        
+        # Retrieved documents of earlier questions, persisted across restarts
+        self.retrieval_cache = RetrievalCache(
+            settings.retrieval_cache_path,
+            max_entries=settings.retrieval_cache_max_entries
+        ) if settings.retrieval_cache_enabled else None
+        # Changes made to indexes in memory here, on top of their files on disk
+        self._index_generations: Dict[str, int] = {}
+        self._instance_id = uuid.uuid4().hex
         
-    def _schema_to_documents(self, schema: DatabaseSchema, database_id: str) -> List[Document]:
-        """Convert database schema to documents for indexing."""
-        documents = []
+        # Knowledge base documents waiting to be indexed, per database
+        self._kb_pending: Dict[str, List[Tuple[Document, asyncio.Future]]] = {}
+        self._kb_flushers: Dict[str, asyncio.Task] = {}
+        
+        # Locks that keep a write or deletion from running while the same
+        # index is modified
+        self._store_locks: Dict[str, asyncio.Lock] = {}
+        
+    def _schema_to_texts(
+        self, schema: DatabaseSchema, database_id: str
+    ) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """
+        Convert a database schema to texts and metadata for indexing.
+        
+        Returned as parallel lists rather than Documents, since both go
+        straight to the embedding request and the vector store.
+        """
+        texts = []
+        metadatas = []
         
         for table in schema.tables:
-            # Create document for each table
-            table_text = self._format_table_info(table)
+            # Names and descriptions are sanitized once and shared by all documents of the table
+            cleaned = self._clean_table(table)
+            column_names = [col["name"] for col in table.columns]
             
-            metadata = {
+            # Create document for each table
+            texts.append(self._format_table_info(cleaned))
+            metadatas.append({
                 "database_id": database_id,
                 "table_name": table.name,
                 "type": "table",
-                "columns": [col["name"] for col in table.columns]
-            }
-            
-            doc = Document(
-                page_content=table_text,
-                metadata=metadata
-            )
-            documents.append(doc)
+                "columns": column_names
+            })
             
             # Create documents for each column with rich context
-            for col in table.columns:
-                col_text = self._format_column_info(table, col)
-                col_metadata = {
+            for col, column_name, cleaned_col in zip(table.columns, column_names, cleaned["columns"]):
+                texts.append(self._format_column_info(cleaned, cleaned_col))
+                metadatas.append({
                     "database_id": database_id,
                     "table_name": table.name,
-                    "column_name": col["name"],
+                    "column_name": column_name,
                     "column_type": col["type"],
                     "type": "column"
-                }
-                col_doc = Document(
-                    page_content=col_text,
-                    metadata=col_metadata
-                )
-                documents.append(col_doc)
+                })
         
         # Index relationships (foreign keys) for better JOIN generation
         if schema.relationships:
-            relationships_text = self._format_relationships_info(schema.relationships)
-            rel_doc = Document(
-                page_content=relationships_text,
-                metadata={
-                    "database_id": database_id,
-                    "type": "relationships"
-                }
-            )
-            documents.append(rel_doc)
+            texts.append(self._format_relationships_info(schema.relationships))
+            metadatas.append({
+                "database_id": database_id,
+                "type": "relationships"
+            })
                 
-        return documents
+        return texts, metadatas
     
-    def _format_table_info(self, table: TableSchema) -> str:
-        """Format table information as text."""
-        # Clean and sanitize text to avoid invalid tokens
-        table_name = clean_text(table.name, max_length=200)
-        description = clean_text(table.description, max_length=500) if table.description else ""
+    async def _create_store(self, texts: List[str], metadatas: List[Dict[str, Any]]) -> FAISS:
+        """
+        Create a vector store for a new index.
         
-        text = f"Table: {table_name}\n"
-        if description:
-            text += f"Description: {description}\n"
-        text += "Columns:\n"
-        for col in table.columns:
-            col_name = clean_text(col['name'], max_length=200)
-            col_type = clean_text(col['type'], max_length=100)
-            text += f"  - {col_name} ({col_type})"
-            
+        With vector_store_int8 enabled the embeddings are stored with 8-bit scalar
+        quantization (one byte per dimension instead of four), which shrinks the
+        index and the memory scanned per search without noticeably changing ranking.
+        With vector_store_index set to "hnsw" searches walk an HNSW graph instead
+        of scanning every vector, which pays off for indexes with many thousands
+        of documents. With "ivfpq" vectors are stored as product-quantized codes
+        (about 64 bytes each) in IVF clusters, for hosts holding many large
+        indexes; schemas too small to train the quantizer use the int8/flat index.
+        """
+        vectors = np.asarray(await self.embeddings.aembed_documents(texts), dtype=np.float32)
+        dim = vectors.shape[1]
+        
+        if settings.vector_store_index == "ivfpq":
+            index = self._ivfpq_index(vectors)
+            if index is not None:
+                store = FAISS(self.embeddings, index, InMemoryDocstore(), {})
+                store.add_embeddings(zip(texts, vectors), metadatas=metadatas)
+                return store
+            logger.info(f"Only {len(vectors)} documents, too few to train product quantization")
+        
+        # One value range shared by all dimensions, so documents added later
+        # (instructions, SQL pairs) aren't clipped by per-dimension ranges
+        # learned from a small schema
+        quantizer = faiss.ScalarQuantizer.QT_8bit_uniform
+        hnsw = settings.vector_store_index == "hnsw"
+        if hnsw and settings.vector_store_int8:
+            index = faiss.IndexHNSWSQ(dim, quantizer, self.HNSW_M)
+        elif hnsw:
+            index = faiss.IndexHNSWFlat(dim, self.HNSW_M)
+        elif settings.vector_store_int8:
+            index = faiss.IndexScalarQuantizer(dim, quantizer)
+        else:
+            index = faiss.IndexFlatL2(dim)
+        if hnsw:
+            index.hnsw.efSearch = self.HNSW_EF_SEARCH
+        if not index.is_trained:
+            index.train(vectors)
+        
+        store = FAISS(self.embeddings, index, InMemoryDocstore(), {})
+        store.add_embeddings(zip(texts, vectors), metadatas=metadatas)
+        return store
+    
+    def _ivfpq_index(self, vectors: np.ndarray) -> Optional[faiss.Index]:
+        """Train an IVF-PQ index on the schema's vectors, or None if there are too few."""
+        count, dim = vectors.shape
+        # k-means needs at least one training vector per PQ centroid
+        if count < 2 ** self.PQ_BITS:
+            return None
+        
+        subvectors = max(m for m in range(1, self.PQ_SUBVECTORS + 1) if dim % m == 0)
+        nlist = max(1, min(1024, int(np.sqrt(count))))
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, subvectors, self.PQ_BITS)
+        index.train(vectors)
+        index.nprobe = min(self.IVF_NPROBE, nlist)
+        return index
+    
+    def _clean_table(self, table: TableSchema) -> Dict[str, Any]:
+        """Clean and sanitize a table's names and descriptions to avoid invalid tokens."""
+        def description(col: Dict[str, str], max_length: int) -> str:
+            return clean_text(col['description'], max_length=max_length) if col.get('description') else ""
+        
+        return {
+            "name": clean_text(table.name, max_length=200),
+            "description": clean_text(table.description, max_length=500) if table.description else "",
+            "columns": [
+                {
+                    "name": clean_text(col['name'], max_length=200),
+                    "type": clean_text(col['type'], max_length=100),
+                    # Shorter in the table overview than in the column's own document
+                    "summary": description(col, 300),
+                    "description": description(col, 500)
+                }
+                for col in table.columns
+            ],
+            "primary_key": [clean_text(pk, max_length=200) for pk in table.primary_key or []]
+        }
+    
+    def _format_table_info(self, table: Dict[str, Any]) -> str:
+        """Format cleaned table information (see _clean_table) as text."""
+        parts = [f"Table: {table['name']}\n"]
+        if table['description']:
+            parts.append(f"Description: {table['description']}\n")
+        parts.append("Columns:\n")
+        for col in table['columns']:
             # Add column description/comment if available
-            if 'description' in col and col['description']:
-                col_desc = clean_text(col['description'], max_length=300)
-                text += f": {col_desc}"
-            
-            text += "\n"
+            if col['summary']:
+                parts.append(_TABLE_COLUMN_DESC_TMPL % (col['name'], col['type'], col['summary']))
+            else:
+                parts.append(_TABLE_COLUMN_TMPL % (col['name'], col['type']))
             
-        if table.primary_key:
-            pk_list = [clean_text(pk, max_length=200) for pk in table.primary_key]
-            text += f"Primary Key: {', '.join(pk_list)}\n"
-        return text
-    
-    def _format_column_info(self, table: TableSchema, column: Dict[str, str]) -> str:
-        """Format column information with table context."""
-        # Clean and sanitize text
-        col_name = clean_text(column['name'], max_length=200)
-        table_name = clean_text(table.name, max_length=200)
-        col_type = clean_text(column['type'], max_length=100)
-        
-        text = f"Column: {col_name}\n"
-        text += f"Table: {table_name}\n"
-        text += f"Type: {col_type}\n"
+        if table['primary_key']:
+            parts.append(f"Primary Key: {', '.join(table['primary_key'])}\n")
+        return "".join(parts)
+    
+    def _format_column_info(self, table: Dict[str, Any], column: Dict[str, str]) -> str:
+        """Format cleaned column information with table context."""
+        parts = [_COLUMN_TMPL % (column['name'], table['name'], column['type'])]
         
         # Add column description/comment if available
-        if 'description' in column and column['description']:
-            col_desc = clean_text(column['description'], max_length=500)
-            text += f"Column Description: {col_desc}\n"
+        if column['description']:
+            parts.append(f"Column Description: {column['description']}\n")
         
-        if table.description:
-            description = clean_text(table.description, max_length=500)
-            text += f"Table Description: {description}\n"
-        return text
+        if table['description']:
+            parts.append(f"Table Description: {table['description']}\n")
+        return "".join(parts)
     
     def _format_relationships_info(self, relationships: List[Dict[str, Any]]) -> str:
         """Format foreign key relationships for indexing."""
-        text = "DATABASE RELATIONSHIPS (Foreign Keys):\n\n"
-        text += "Use these relationships to JOIN tables correctly:\n\n"
+        parts = [
+            "DATABASE RELATIONSHIPS (Foreign Keys):\n\n",
+            "Use these relationships to JOIN tables correctly:\n\n"
+        ]
         
         for rel in relationships:
             from_table = clean_text(rel['from_table'], max_length=200)
@@ -183,37 +310,45 @@ class SchemaIndexer:
             to_table = clean_text(rel['to_table'], max_length=200)
             to_col = clean_text(rel['to_column'], max_length=200)
             
-            text += f"- {from_table}.{from_col} → {to_table}.{to_col}\n"
-            text += f"  JOIN {to_table} ON {from_table}.{from_col} = {to_table}.{to_col}\n\n"
+            parts.append(_REL_TMPL % (
+                from_table, from_col, to_table, to_col,
+                to_table, from_table, from_col, to_table, to_col
+            ))
         
-        return text
+        return "".join(parts)
     
     def _save_indexed_content_dump(
         self, 
         database_id: str, 
-        documents: List[Document],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
         schema: DatabaseSchema
     ) -> None:
         """
         Save indexed content to a human-readable JSON file.
         This allows inspection of what was actually indexed into the vector store.
         """
+        if not settings.indexed_dumps_enabled:
+            return
+        
         try:
             from datetime import datetime
             
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"{database_id}_{timestamp}.json"
+            if settings.indexed_dumps_gzip:
+                filename += ".gz"
             filepath = self.dumps_path / filename
             
-            # Prepare data structure
-            indexed_data = {
+            # Summary fields, then the documents written one at a time so the
+            # dump isn't built in memory next to the documents themselves
+            header = {
                 "database_id": database_id,
                 "indexed_at": datetime.now().isoformat(),
-                "total_documents": len(documents),
+                "total_documents": len(texts),
                 "total_tables": len(schema.tables),
                 "embedding_model": settings.embedding_model,
-                "tables_summary": [],
-                "indexed_documents": []
+                "tables_summary": []
             }
             
             # Add table summaries
@@ -239,25 +374,27 @@ class SchemaIndexer:
                         "description": col_data.get("description", "")
                     })
                 
-                indexed_data["tables_summary"].append(table_info)
-            
-            # Add all indexed documents with their content
-            for i, doc in enumerate(documents, 1):
-                doc_data = {
-                    "document_id": i,
-                    "content": doc.page_content,
-                    "content_length": len(doc.page_content),
-                    "metadata": doc.metadata
-                }
-                
-                indexed_data["indexed_documents"].append(doc_data)
-            
-            # Save to JSON file
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(indexed_data, f, indent=2, ensure_ascii=False)
+                header["tables_summary"].append(table_info)
+            
+            # Save to JSON file, one indexed document per line
+            # Fastest gzip level: dumps are large and written on every indexing run
+            opener = partial(gzip.open, compresslevel=1) if settings.indexed_dumps_gzip else open
+            with opener(filepath, 'wb') as f:
+                # Reopen the header object (drop its closing "\n}") to append the documents
+                f.write(orjson.dumps(header, option=orjson.OPT_INDENT_2)[:-2])
+                f.write(b',\n  "indexed_documents": [')
+                for i, (text, metadata) in enumerate(zip(texts, metadatas), 1):
+                    f.write(b"\n    " if i == 1 else b",\n    ")
+                    f.write(orjson.dumps({
+                        "document_id": i,
+                        "content": text,
+                        "content_length": len(text),
+                        "metadata": metadata
+                    }, default=str))
+                f.write(b"\n  ]\n}\n")
             
             logger.info(f"✅ Saved indexed content dump to: {filepath}")
-            logger.info(f"   📄 {len(documents)} documents indexed")
+            logger.info(f"   📄 {len(texts)} documents indexed")
             logger.info(f"   📊 {len(schema.tables)} tables")
             
         except Exception as e:
@@ -270,27 +407,28 @@ class SchemaIndexer:
             logger.info(f"Indexing schema for database: {request.database_id}")
             
             # Convert schema to documents
-            documents = self._schema_to_documents(request.db_schema, request.database_id)
+            texts, metadatas = self._schema_to_texts(request.db_schema, request.database_id)
             
             # Save indexed content to human-readable JSON file
-            self._save_indexed_content_dump(request.database_id, documents, request.db_schema)
+            await asyncio.to_thread(
+                self._save_indexed_content_dump, request.database_id, texts, metadatas, request.db_schema
+            )
             
-            # Create or update vector store
+            # Create or update vector store (an index evicted from memory is updated too)
+            if request.database_id not in self.stores:
+                await self.aload_index(request.database_id)
             if request.database_id in self.stores:
                 # Update existing store
-                self.stores[request.database_id].add_documents(documents)
+                await self.stores[request.database_id].aadd_texts(texts, metadatas=metadatas)
             else:
                 # Create new store
-                self.stores[request.database_id] = FAISS.from_documents(
-                    documents, 
-                    self.embeddings
-                )
+                self._add_store(request.database_id, await self._create_store(texts, metadatas))
             
-            # Persist to disk
-            store_path = self.vector_store_path / request.database_id
-            self.stores[request.database_id].save_local(str(store_path))
+            # Persist to disk without blocking the event loop
+            await self._persist(request.database_id)
+            self._invalidate_retrievals(request.database_id)
             
-            logger.info(f"Successfully indexed {len(documents)} documents for {request.database_id}")
+            logger.info(f"Successfully indexed {len(texts)} documents for {request.database_id}")
             
             return IndexingResult(
                 database_id=request.database_id,
@@ -307,57 +445,265 @@ class SchemaIndexer:
                 error=str(e)
             )
     
-    def load_index(self, database_id: str) -> bool:
-        """Load an existing index from disk."""
+    def _read_index(self, database_id: str) -> Optional[FAISS]:
+        """Read an existing index from disk (safe to run in a worker thread, touches no shared state)."""
         try:
             store_path = self.vector_store_path / database_id
             if store_path.exists():
-                self.stores[database_id] = FAISS.load_local(
+                return FAISS.load_local(
                     str(store_path),
                     self.embeddings,
                     allow_dangerous_deserialization=True
                 )
-                logger.info(f"Loaded index for database: {database_id}")
-                return True
-            return False
+            return None
         except Exception as e:
             logger.error(f"Error loading index: {str(e)}")
+            return None
+    
+    def load_index(self, database_id: str) -> bool:
+        """Load an existing index from disk."""
+        store = self._read_index(database_id)
+        if store is None:
+            return False
+        self._add_store(database_id, store)
+        logger.info(f"Loaded index for database: {database_id}")
+        return True
+    
+    async def aload_index(self, database_id: str) -> bool:
+        """
+        Load an existing index from disk without blocking the event loop.
+        
+        Only the read runs in a worker thread; the loaded index is added to
+        self.stores back on the event loop, where the stores are used.
+        """
+        store = await asyncio.to_thread(self._read_index, database_id)
+        if database_id in self.stores:
+            # Loaded (and possibly modified) by someone else meanwhile
+            self._get_store(database_id)
+            return True
+        if store is None:
             return False
+        self._add_store(database_id, store)
+        logger.info(f"Loaded index for database: {database_id}")
+        return True
+    
+    def _add_store(self, database_id: str, store: FAISS):
+        """
+        Keep a loaded index in memory, evicting the least recently used ones
+        beyond max_loaded_indexes. Evicted indexes are reloaded from disk on
+        their next use; indexes with unsaved knowledge base additions stay.
+        """
+        self.stores[database_id] = store
+        self.stores.move_to_end(database_id)
+        
+        limit = settings.max_loaded_indexes
+        if not limit:
+            return
+        for evicted_id in list(self.stores):
+            if len(self.stores) <= limit:
+                break
+            if evicted_id == database_id or evicted_id in self._kb_flushers:
+                continue
+            del self.stores[evicted_id]
+            logger.info(f"Evicted index for {evicted_id} from memory")
+    
+    def _get_store(self, database_id: str) -> Optional[FAISS]:
+        """Return a loaded index, marking it as recently used."""
+        store = self.stores.get(database_id)
+        if store is not None:
+            self.stores.move_to_end(database_id)
+        return store
+    
+    def load_all_indexes(self) -> int:
+        """
+        Load persisted indexes into memory, up to max_loaded_indexes.
+        
+        Called at startup so the first request for each database doesn't pay
+        the cost of deserializing its FAISS index.
+        
+        Returns:
+            Number of indexes loaded
+        """
+        loaded = 0
+        limit = settings.max_loaded_indexes
+        for store_path in self.vector_store_path.iterdir():
+            if limit and len(self.stores) >= limit:
+                break
+            if store_path.is_dir() and store_path.name not in self.stores:
+                if self.load_index(store_path.name):
+                    loaded += 1
+        return loaded
+    
+    def _index_version(self, database_id: str) -> str:
+        """
+        Version of a database's index, as retrievals are cached on.
+        
+        Taken from the index file on disk, so an index rewritten by another
+        process gets a new version, plus changes not yet saved by this one.
+        """
+        try:
+            stat = (self.vector_store_path / database_id / "index.faiss").stat()
+            version = f"{stat.st_mtime_ns}-{stat.st_size}"
+        except OSError:
+            version = "none"
+        generation = self._index_generations.get(database_id, 0)
+        return f"{version}-{self._instance_id}-{generation}" if generation else version
+    
+    def _cached_retrieval(self, database_id: str, query: str, k: int) -> Tuple[Optional[str], Optional[List[Document]]]:
+        """Current index version, and the documents retrieved earlier for the same query if cached."""
+        if self.retrieval_cache is None:
+            return None, None
+        version = self._index_version(database_id)
+        return version, self.retrieval_cache.get(database_id, version, query, k)
+    
+    def _cache_retrieval(self, database_id: str, version: Optional[str], query: str, k: int, docs: List[Document]):
+        """Remember documents retrieved from an index version (empty results aren't cached)."""
+        if self.retrieval_cache is not None and docs:
+            self.retrieval_cache.put(database_id, version, query, k, docs)
+    
+    def _invalidate_retrievals(self, database_id: str):
+        """Drop cached retrievals of a database whose index changed."""
+        self._index_generations[database_id] = self._index_generations.get(database_id, 0) + 1
+        if self.retrieval_cache is not None:
+            self.retrieval_cache.invalidate(database_id)
     
     def retrieve_context(self, database_id: str, query: str, k: int = 5) -> List[Document]:
         """Retrieve relevant schema context for a query."""
+        version, cached = self._cached_retrieval(database_id, query, k)
+        if cached:
+            return cached
+        
         if database_id not in self.stores:
             if not self.load_index(database_id):
                 return []
         
         try:
-            docs = self.stores[database_id].similarity_search(query, k=k)
+            docs = self._get_store(database_id).similarity_search(query, k=k)
+            self._cache_retrieval(database_id, version, query, k, docs)
             return docs
         except Exception as e:
             logger.error(f"Error retrieving context: {str(e)}")
             return []
     
-    def delete_index(self, database_id: str) -> bool:
+    async def aretrieve_context(self, database_id: str, query: str, k: int = 5) -> List[Document]:
+        """Retrieve relevant schema context for a query without blocking the event loop."""
+        version, cached = await asyncio.to_thread(self._cached_retrieval, database_id, query, k)
+        if cached:
+            return cached
+        
+        if database_id not in self.stores:
+            if not await self.aload_index(database_id):
+                return []
+        
+        try:
+            docs = await self._get_store(database_id).asimilarity_search(query, k=k)
+            await asyncio.to_thread(self._cache_retrieval, database_id, version, query, k, docs)
+            return docs
+        except Exception as e:
+            logger.error(f"Error retrieving context: {str(e)}")
+            return []
+    
+    async def delete_index(self, database_id: str) -> bool:
         """Delete an indexed database (remove from memory and disk)."""
         try:
-            # Remove from memory
-            if database_id in self.stores:
-                del self.stores[database_id]
-                logger.info(f"Removed {database_id} from memory")
+            # Waits for a write in progress, which would otherwise recreate the
+            # index files; later writes find the index gone from memory
+            async with self._store_lock(database_id):
+                # Remove from memory
+                if database_id in self.stores:
+                    del self.stores[database_id]
+                    logger.info(f"Removed {database_id} from memory")
+                
+                # Remove from disk
+                store_path = self.vector_store_path / database_id
+                if store_path.exists():
+                    import shutil
+                    await asyncio.to_thread(shutil.rmtree, store_path)
+                    logger.info(f"Deleted index files for database: {database_id}")
+            
+            self._invalidate_retrievals(database_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting index for {database_id}: {str(e)}")
+            return False
+    
+    async def _add_knowledge_base_document(self, database_id: str, doc: Document) -> bool:
+        """
+        Queue a knowledge base document for indexing and wait until it is indexed
+        and written to disk.
+        
+        Documents queued for the same database within KB_BATCH_DELAY seconds are
+        embedded in one request, added to the index in one call and persisted once.
+        """
+        # Ensure store is loaded
+        if database_id not in self.stores:
+            if not await self.aload_index(database_id):
+                logger.error(f"No index found for database: {database_id}")
+                return False
+        
+        future = asyncio.get_running_loop().create_future()
+        self._kb_pending.setdefault(database_id, []).append((doc, future))
+        if database_id not in self._kb_flushers:
+            self._kb_flushers[database_id] = asyncio.create_task(self._flush_knowledge_base(database_id))
+        
+        return await future
+    
+    async def _flush_knowledge_base(self, database_id: str):
+        """Index the queued knowledge base documents of a database in batches."""
+        try:
+            await asyncio.sleep(self.KB_BATCH_DELAY)
             
-            # Remove from disk
-            store_path = self.vector_store_path / database_id
-            if store_path.exists():
-                import shutil
-                shutil.rmtree(store_path)
-                logger.info(f"Deleted index files for database: {database_id}")
+            while self._kb_pending.get(database_id):
+                pending = self._kb_pending[database_id]
+                batch = pending[:self.KB_BATCH_SIZE]
+                self._kb_pending[database_id] = pending[self.KB_BATCH_SIZE:]
+                
+                success = await self._index_documents(database_id, [doc for doc, _ in batch])
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(success)
+        finally:
+            self._kb_flushers.pop(database_id, None)
+            for _, future in self._kb_pending.pop(database_id, []):
+                future.cancel()
+    
+    async def _index_documents(self, database_id: str, documents: List[Document]) -> bool:
+        """Embed documents in one request, add them to a database's index and persist it."""
+        try:
+            texts = [doc.page_content for doc in documents]
+            vectors = await self.embeddings.aembed_documents(texts)
+            
+            # Add to vector store and write it out before the additions are
+            # acknowledged, so they survive a crash
+            async with self._store_lock(database_id):
+                self.stores[database_id].add_embeddings(
+                    zip(texts, vectors),
+                    metadatas=[doc.metadata for doc in documents]
+                )
+                store_path = self.vector_store_path / database_id
+                await asyncio.to_thread(self.stores[database_id].save_local, str(store_path))
+            self._invalidate_retrievals(database_id)
             
+            logger.info(f"Indexed {len(documents)} knowledge base documents for {database_id}")
             return True
+            
         except Exception as e:
-            logger.error(f"Error deleting index for {database_id}: {str(e)}")
+            logger.error(f"Error indexing knowledge base documents: {str(e)}")
             return False
     
-    def index_knowledge_base_instruction(
+    def _store_lock(self, database_id: str) -> asyncio.Lock:
+        """Lock guarding a database's index against concurrent modification and writes."""
+        return self._store_locks.setdefault(database_id, asyncio.Lock())
+    
+    async def _persist(self, database_id: str):
+        """Write a database's index to disk."""
+        async with self._store_lock(database_id):
+            store = self.stores.get(database_id)
+            if store is not None:
+                store_path = self.vector_store_path / database_id
+                await asyncio.to_thread(store.save_local, str(store_path))
+    
+    async def index_knowledge_base_instruction(
         self,
         database_id: str,
         instruction_id: str,
@@ -365,40 +711,24 @@ class SchemaIndexer:
         content: str
     ) -> bool:
         """Add a knowledge base instruction to the vector store."""
-        try:
-            # Ensure store is loaded
-            if database_id not in self.stores:
-                if not self.load_index(database_id):
-                    logger.error(f"No index found for database: {database_id}")
-                    return False
-            
-            # Create document for the instruction
-            text = f"INSTRUCTION: {title}\n\n{content}"
-            
-            metadata = {
-                "database_id": database_id,
-                "type": "instruction",
-                "instruction_id": instruction_id,
-                "title": title
-            }
-            
-            doc = Document(page_content=text, metadata=metadata)
-            
-            # Add to vector store
-            self.stores[database_id].add_documents([doc])
-            
-            # Persist to disk
-            store_path = self.vector_store_path / database_id
-            self.stores[database_id].save_local(str(store_path))
-            
+        # Create document for the instruction
+        text = f"INSTRUCTION: {title}\n\n{content}"
+        
+        metadata = {
+            "database_id": database_id,
+            "type": "instruction",
+            "instruction_id": instruction_id,
+            "title": title
+        }
+        
+        doc = Document(page_content=text, metadata=metadata)
+        
+        success = await self._add_knowledge_base_document(database_id, doc)
+        if success:
             logger.info(f"Indexed instruction {instruction_id} for {database_id}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error indexing instruction: {str(e)}")
-            return False
+        return success
     
-    def index_knowledge_base_sql_pair(
+    async def index_knowledge_base_sql_pair(
         self,
         database_id: str,
         pair_id: str,
@@ -407,39 +737,22 @@ class SchemaIndexer:
         description: Optional[str] = None
     ) -> bool:
         """Add a knowledge base SQL pair to the vector store."""
-        try:
-            # Ensure store is loaded
-            if database_id not in self.stores:
-                if not self.load_index(database_id):
-                    logger.error(f"No index found for database: {database_id}")
-                    return False
-            
-            # Create document for the SQL pair
-            text = f"EXAMPLE QUERY:\nQuestion: {question}\nSQL: {sql}"
-            if description:
-                text += f"\nExplanation: {description}"
-            
-            metadata = {
-                "database_id": database_id,
-                "type": "sql_pair",
-                "pair_id": pair_id,
-                "question": question,
-                "sql": sql
-            }
-            
-            doc = Document(page_content=text, metadata=metadata)
-            
-            # Add to vector store
-            self.stores[database_id].add_documents([doc])
-            
-            # Persist to disk
-            store_path = self.vector_store_path / database_id
-            self.stores[database_id].save_local(str(store_path))
-            
+        # Create document for the SQL pair
+        text = f"EXAMPLE QUERY:\nQuestion: {question}\nSQL: {sql}"
+        if description:
+            text += f"\nExplanation: {description}"
+        
+        metadata = {
+            "database_id": database_id,
+            "type": "sql_pair",
+            "pair_id": pair_id,
+            "question": question,
+            "sql": sql
+        }
+        
+        doc = Document(page_content=text, metadata=metadata)
+        
+        success = await self._add_knowledge_base_document(database_id, doc)
+        if success:
             logger.info(f"Indexed SQL pair {pair_id} for {database_id}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error indexing SQL pair: {str(e)}")
-            return False
-
+        return success
@@ -0,0 +1,218 @@
+"""
+Deterministic SQL compiler - answers simple structural questions without the LLM.
+
+Questions are parsed into a small intermediate representation (QueryIR), their
+entities are grounded against the retrieved schema documents, lowered to a
+SELECT AST and rendered as SQL. Questions that don't match a known pattern, or
+whose tables/columns can't all be grounded unambiguously, return None so the
+caller falls back to the LLM pipeline.
+"""
+
+import re
+from enum import Enum
+from typing import Dict, List, Optional, Set
+
+from langchain_core.documents import Document
+from pydantic import BaseModel
+
+
+# Default row limit for "list all X" questions
+LIST_LIMIT = 100
+
+COUNT_PATTERN = re.compile(
+    r"^(?:how many|count(?: all)?(?: the)?|(?:what is )?the (?:total )?(?:number|count) of|(?:total )?number of)"
+    r"\s+(?P<table>[a-z0-9_ ]+?)"
+    r"(?:\s+(?:are there|do we have|exist|are in the database|in total))?$",
+    re.IGNORECASE
+)
+
+TOP_N_PATTERN = re.compile(
+    r"^(?:(?:show|list|get|give|find|display)(?: me)?\s+|what are\s+)?(?:the\s+)?"
+    r"(?P<direction>top|bottom|first|last|highest|lowest)\s+(?P<limit>\d{1,4})\s+"
+    r"(?P<table>[a-z0-9_ ]+?)\s+by\s+(?P<column>[a-z0-9_ ]+?)$",
+    re.IGNORECASE
+)
+
+LIST_PATTERN = re.compile(
+    r"^(?:show|list|display|get|give)(?: me)?(?:\s+all)?(?:\s+the)?\s+(?P<table>[a-z0-9_ ]+?)$",
+    re.IGNORECASE
+)
+
+DESCENDING_WORDS = {"top", "highest", "last"}
+
+
+class QueryIntent(str, Enum):
+    """Structural question patterns the compiler understands."""
+    COUNT = "count"
+    LIST = "list"
+    TOP_N = "top_n"
+
+
+class QueryIR(BaseModel):
+    """Intermediate representation of a parsed question, grounded to schema names."""
+    intent: QueryIntent
+    table: str
+    order_column: Optional[str] = None
+    descending: bool = True
+    limit: Optional[int] = None
+
+
+class SelectAST(BaseModel):
+    """Minimal SELECT statement tree."""
+    select: List[str]
+    from_table: str
+    order_by: Optional[str] = None
+    descending: bool = True
+    limit: Optional[int] = None
+
+
+class CompiledQuery(BaseModel):
+    """Result of a successful deterministic compilation."""
+    sql: str
+    explanation: str
+    reasoning: str
+    ir: QueryIR
+
+
+def _normalize(name: str) -> str:
+    """Normalize an identifier or phrase to lowercase snake_case."""
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+
+def _singular(name: str) -> str:
+    """Naively singularize the last word of a snake_case name."""
+    if name.endswith("ies") and len(name) > 3:
+        return name[:-3] + "y"
+    if name.endswith(("ses", "xes", "ches", "shes")):
+        return name[:-2]
+    if name.endswith("s") and not name.endswith("ss"):
+        return name[:-1]
+    return name
+
+
+def _ground(phrase: str, candidates) -> Optional[str]:
+    """Map a phrase from the question to exactly one schema name, or None."""
+    target = _normalize(phrase)
+    variants = {target, _singular(target)}
+    matches = [
+        name for name in candidates
+        if _normalize(name) in variants or _singular(_normalize(name)) in variants
+    ]
+    return matches[0] if len(matches) == 1 else None
+
+
+def schema_from_documents(docs: List[Document]) -> Dict[str, Set[str]]:
+    """Collect table -> column names from retrieved table and column documents."""
+    schema: Dict[str, Set[str]] = {}
+    for doc in docs:
+        doc_type = doc.metadata.get("type")
+        table_name = doc.metadata.get("table_name")
+        if not table_name or doc_type not in ("table", "column"):
+            continue
+
+        columns = schema.setdefault(table_name, set())
+        if doc_type == "table":
+            columns.update(doc.metadata.get("columns", []))
+        elif doc.metadata.get("column_name"):
+            columns.add(doc.metadata["column_name"])
+    return schema
+
+
+def parse_question(question: str, schema: Dict[str, Set[str]]) -> Optional[QueryIR]:
+    """Parse a question into a grounded QueryIR, or None if it isn't a known pattern."""
+    text = " ".join(question.strip().rstrip("?.!").split())
+
+    match = COUNT_PATTERN.match(text)
+    if match:
+        table = _ground(match.group("table"), schema)
+        return QueryIR(intent=QueryIntent.COUNT, table=table) if table else None
+
+    match = TOP_N_PATTERN.match(text)
+    if match:
+        table = _ground(match.group("table"), schema)
+        if not table:
+            return None
+        column = _ground(match.group("column"), schema[table])
+        if not column:
+            return None
+        return QueryIR(
+            intent=QueryIntent.TOP_N,
+            table=table,
+            order_column=column,
+            descending=match.group("direction").lower() in DESCENDING_WORDS,
+            limit=int(match.group("limit"))
+        )
+
+    match = LIST_PATTERN.match(text)
+    if match:
+        table = _ground(match.group("table"), schema)
+        return QueryIR(intent=QueryIntent.LIST, table=table, limit=LIST_LIMIT) if table else None
+
+    return None
+
+
+def ir_to_ast(ir: QueryIR) -> SelectAST:
+    """Lower a QueryIR to a SELECT AST."""
+    if ir.intent == QueryIntent.COUNT:
+        return SelectAST(select=["COUNT(*) AS `count`"], from_table=ir.table)
+    return SelectAST(
+        select=["*"],
+        from_table=ir.table,
+        order_by=ir.order_column,
+        descending=ir.descending,
+        limit=ir.limit
+    )
+
+
+def _quote(identifier: str) -> str:
+    """Quote a MySQL identifier."""
+    return "`" + identifier.replace("`", "``") + "`"
+
+
+def ast_to_sql(ast: SelectAST) -> str:
+    """Render a SELECT AST as MySQL."""
+    sql = f"SELECT {', '.join(ast.select)} FROM {_quote(ast.from_table)}"
+    if ast.order_by:
+        sql += f" ORDER BY {_quote(ast.order_by)} {'DESC' if ast.descending else 'ASC'}"
+    if ast.limit is not None:
+        sql += f" LIMIT {ast.limit}"
+    return sql + ";"
+
+
+def _describe(ir: QueryIR) -> str:
+    """Deterministic explanation of a compiled query."""
+    if ir.intent == QueryIntent.COUNT:
+        return f"This query counts all rows in the {ir.table} table and returns the total."
+    if ir.intent == QueryIntent.TOP_N:
+        order = "highest" if ir.descending else "lowest"
+        return (
+            f"This query returns the {ir.limit} rows of the {ir.table} table with the "
+            f"{order} {ir.order_column} values, sorted by {ir.order_column}."
+        )
+    return f"This query returns all columns of the {ir.table} table, limited to the first {ir.limit} rows."
+
+
+def compile_question(question: str, schema_docs: List[Document]) -> Optional[CompiledQuery]:
+    """
+    Try to compile a question to SQL without the LLM.
+
+    Args:
+        question: Natural language question
+        schema_docs: Schema documents retrieved for the question
+
+    Returns:
+        CompiledQuery, or None if the LLM pipeline should handle the question
+    """
+    ir = parse_question(question, schema_from_documents(schema_docs))
+    if ir is None:
+        return None
+
+    return CompiledQuery(
+        sql=ast_to_sql(ir_to_ast(ir)),
+        explanation=_describe(ir),
+        reasoning=(
+            f"Matched the '{ir.intent.value}' question pattern and grounded it to table "
+            f"'{ir.table}'. The SQL was compiled deterministically without the LLM."
+        ),
+        ir=ir
+    )
@@ -5,24 +5,81 @@ Stores MySQL connection credentials securely (password encrypted).
 
 import sqlite3
 import json
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import logging
+import base64
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 import os
 
 from models import DatabaseInfo
+from config import settings
 
 logger = logging.getLogger(__name__)
 
 
+# Statements are kept as constants so SQLite reuses their compiled plans
+# from each connection's statement cache
+INSERT_CREDENTIALS_SQL = """
+    INSERT OR REPLACE INTO credentials
+    (database_id, host, port, user, password_encrypted, database_name, selected_tables, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+"""
+SELECT_CREDENTIALS_SQL = """
+    SELECT host, port, user, password_encrypted, database_name, selected_tables
+    FROM credentials
+    WHERE database_id = ?
+"""
+PREFETCH_CREDENTIALS_SQL = """
+    SELECT database_id, host, port, user, password_encrypted, database_name, selected_tables
+    FROM credentials
+    ORDER BY updated_at DESC, rowid DESC
+    LIMIT ?
+"""
+LIST_DATABASES_SQL = """
+    SELECT database_id, host, port, user, database_name, created_at
+    FROM credentials
+    ORDER BY database_id
+"""
+DELETE_CREDENTIALS_SQL = "DELETE FROM credentials WHERE database_id = ?"
+DATABASE_EXISTS_SQL = "SELECT 1 FROM credentials WHERE database_id = ?"
+
+# Header byte of AES-GCM encrypted passwords. Older Fernet tokens are base64
+# text starting with "g", so they never start with this byte.
+AESGCM_VERSION = b"\x01"
+AESGCM_NONCE_SIZE = 12
+
+
 class CredentialsStore:
-    """Store and retrieve database credentials in SQLite."""
+    """
+    Store and retrieve database credentials in SQLite.
+    
+    Decrypted credentials are kept in a small TTL/LRU cache so repeated requests
+    against the same database skip the SQLite lookup and decryption. The cache is
+    invalidated whenever credentials are stored or deleted.
     
-    def __init__(self, db_path: str = "./data/credentials.db"):
+    Each thread reuses one autocommit SQLite connection in WAL mode instead of
+    opening a new one per call.
+    """
+    
+    def __init__(self, db_path: str = "./data/credentials.db", cache_ttl: float = 60.0, cache_size: int = 256):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        
+        # One SQLite connection per thread
+        self._local = threading.local()
+        
         # Initialize encryption key (store in env or generate once)
         self._init_encryption_key()
         
@@ -30,24 +87,45 @@ class CredentialsStore:
         self._init_db()
     
     def _init_encryption_key(self):
-        """Initialize or load encryption key."""
+        """Initialize or load encryption key (from the environment if configured)."""
         key_file = self.db_path.parent / ".encryption_key"
         
-        if key_file.exists():
+        if settings.credentials_encryption_key:
+            key = settings.credentials_encryption_key.encode()
+        elif key_file.exists():
             with open(key_file, 'rb') as f:
-                self.cipher = Fernet(f.read())
+                key = f.read()
         else:
             # Generate new key
             key = Fernet.generate_key()
-            with open(key_file, 'wb') as f:
+            # Readable by the owner only, it protects every stored password
+            with os.fdopen(os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as f:
                 f.write(key)
-            self.cipher = Fernet(key)
             logger.info("Generated new encryption key")
+        
+        # Fernet decrypts passwords stored before the switch to AES-GCM
+        self.legacy_cipher = Fernet(key)
+        aes_key = HKDF(
+            algorithm=hashes.SHA256(), length=32, salt=None, info=b"genbi-credentials-aesgcm"
+        ).derive(base64.urlsafe_b64decode(key))
+        self.cipher = AESGCM(aes_key)
+    
+    def _conn(self) -> sqlite3.Connection:
+        """Return this thread's SQLite connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            # WAL lets readers run alongside a writer; NORMAL syncs only at checkpoints
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            self._local.conn = conn
+        return conn
     
     def _init_db(self):
         """Initialize SQLite database with credentials table."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._conn().cursor()
         
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS credentials (
@@ -63,145 +141,225 @@ class CredentialsStore:
             )
         """)
         
-        conn.commit()
-        conn.close()
-        logger.info(f"Credentials database initialized at {self.db_path}")
+        logger.info("Credentials database initialized at %s", self.db_path)
     
     def _encrypt_password(self, password: str) -> bytes:
-        """Encrypt password."""
-        return self.cipher.encrypt(password.encode())
+        """Encrypt password (version byte + nonce + AES-GCM ciphertext)."""
+        nonce = os.urandom(AESGCM_NONCE_SIZE)
+        return AESGCM_VERSION + nonce + self.cipher.encrypt(nonce, password.encode(), None)
     
     def _decrypt_password(self, encrypted: bytes) -> str:
-        """Decrypt password."""
-        return self.cipher.decrypt(encrypted).decode()
+        """Decrypt password, including ones stored as Fernet tokens."""
+        encrypted = bytes(encrypted)
+        if not encrypted.startswith(AESGCM_VERSION):
+            return self.legacy_cipher.decrypt(encrypted).decode()
+        
+        nonce = encrypted[1:1 + AESGCM_NONCE_SIZE]
+        return self.cipher.decrypt(nonce, encrypted[1 + AESGCM_NONCE_SIZE:], None).decode()
+    
+    def _get_cached(self, database_id: str) -> Optional[Dict[str, Any]]:
+        """Return cached credentials if present and not expired."""
+        with self._cache_lock:
+            entry = self._cache.get(database_id)
+            if entry is None:
+                return None
+            
+            expires_at, credentials = entry
+            if expires_at < time.monotonic():
+                del self._cache[database_id]
+                return None
+            
+            self._cache.move_to_end(database_id)
+            return dict(credentials)
+    
+    def _set_cached(self, database_id: str, credentials: Dict[str, Any]):
+        """Cache credentials, evicting the least recently used entry when full."""
+        with self._cache_lock:
+            self._cache[database_id] = (time.monotonic() + self.cache_ttl, dict(credentials))
+            self._cache.move_to_end(database_id)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+    
+    def _invalidate_cached(self, database_id: str):
+        """Drop cached credentials for a database."""
+        with self._cache_lock:
+            self._cache.pop(database_id, None)
     
     def store_credentials(self, database_id: str, host: str, port: int, 
                          user: str, password: str, database_name: str,
                          selected_tables: Optional[List[str]] = None) -> bool:
         """Store database credentials and selected tables."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            cursor = self._conn().cursor()
             
             encrypted_password = self._encrypt_password(password)
             tables_json = json.dumps(selected_tables) if selected_tables else None
             
-            cursor.execute("""
-                INSERT OR REPLACE INTO credentials 
-                (database_id, host, port, user, password_encrypted, database_name, selected_tables, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            """, (database_id, host, port, user, encrypted_password, database_name, tables_json))
+            cursor.execute(
+                INSERT_CREDENTIALS_SQL,
+                (database_id, host, port, user, encrypted_password, database_name, tables_json)
+            )
+            # Only after the write, or a lookup in between would cache the old credentials again
+            self._invalidate_cached(database_id)
+            
+            logger.info("Stored credentials for database: %s", database_id)
+            return True
             
-            conn.commit()
-            conn.close()
+        except Exception as e:
+            logger.error("Error storing credentials: %s", e)
+            return False
+    
+    def store_credentials_bulk(self, entries: List[Dict[str, Any]]) -> bool:
+        """
+        Store many databases' credentials in one transaction.
+        
+        Args:
+            entries: Dicts with the arguments of store_credentials
             
-            logger.info(f"Stored credentials for database: {database_id}")
+        Returns:
+            True if all entries were stored
+        """
+        try:
+            rows = [
+                (
+                    entry['database_id'], entry['host'], entry['port'], entry['user'],
+                    self._encrypt_password(entry['password']), entry['database_name'],
+                    json.dumps(entry['selected_tables']) if entry.get('selected_tables') else None
+                )
+                for entry in entries
+            ]
+            
+            conn = self._conn()
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(INSERT_CREDENTIALS_SQL, rows)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            
+            for row in rows:
+                self._invalidate_cached(row[0])
+            
+            logger.info("Stored credentials for %s databases", len(rows))
             return True
             
         except Exception as e:
-            logger.error(f"Error storing credentials: {str(e)}")
+            logger.error("Error storing credentials: %s", e)
             return False
     
+    def _row_to_credentials(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """Build a credentials dict (with decrypted password) from a credentials row."""
+        return {
+            'host': row['host'],
+            'port': row['port'],
+            'user': row['user'],
+            'password': self._decrypt_password(row['password_encrypted']),
+            'database': row['database_name'],
+            'selected_tables': json.loads(row['selected_tables']) if row['selected_tables'] else None
+        }
+    
+    def prefetch(self) -> int:
+        """
+        Decrypt and cache the most recently updated credentials, up to the cache size.
+        
+        Called at startup so the first query against each database skips the
+        lookup and decryption.
+        
+        Returns:
+            Number of databases cached
+        """
+        try:
+            cursor = self._conn().cursor()
+            cursor.execute(PREFETCH_CREDENTIALS_SQL, (self.cache_size,))
+            rows = cursor.fetchall()
+        except Exception as e:
+            logger.error("Error prefetching credentials: %s", e)
+            return 0
+        
+        cached = 0
+        for row in reversed(rows):
+            database_id = row['database_id']
+            try:
+                self._set_cached(database_id, self._row_to_credentials(row))
+                cached += 1
+            except Exception as e:
+                logger.error("Error prefetching credentials for %s: %s", database_id, e)
+        return cached
+    
     def get_credentials(self, database_id: str) -> Optional[Dict[str, Any]]:
         """Retrieve database credentials (with decrypted password)."""
+        cached = self._get_cached(database_id)
+        if cached is not None:
+            return cached
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT host, port, user, password_encrypted, database_name, selected_tables
-                FROM credentials
-                WHERE database_id = ?
-            """, (database_id,))
-            
+            cursor = self._conn().cursor()
+            cursor.execute(SELECT_CREDENTIALS_SQL, (database_id,))
             row = cursor.fetchone()
-            conn.close()
             
             if not row:
                 return None
             
-            selected_tables = json.loads(row[5]) if row[5] else None
+            credentials = self._row_to_credentials(row)
+            self._set_cached(database_id, credentials)
             
-            return {
-                'host': row[0],
-                'port': row[1],
-                'user': row[2],
-                'password': self._decrypt_password(row[3]),
-                'database': row[4],
-                'selected_tables': selected_tables
-            }
+            return credentials
             
         except Exception as e:
-            logger.error(f"Error retrieving credentials: {str(e)}")
+            logger.error("Error retrieving credentials: %s", e)
             return None
     
     def list_databases(self) -> List[DatabaseInfo]:
         """List all stored databases (without passwords)."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT database_id, host, port, user, database_name, created_at
-                FROM credentials
-                ORDER BY database_id
-            """)
-            
+            cursor = self._conn().cursor()
+            cursor.execute(LIST_DATABASES_SQL)
             rows = cursor.fetchall()
-            conn.close()
             
             return [
                 DatabaseInfo(
-                    database_id=row[0],
-                    host=row[1],
-                    port=row[2],
-                    user=row[3],
-                    database_name=row[4],
-                    created_at=row[5]
+                    database_id=row['database_id'],
+                    host=row['host'],
+                    port=row['port'],
+                    user=row['user'],
+                    database_name=row['database_name'],
+                    created_at=row['created_at']
                 )
                 for row in rows
             ]
             
         except Exception as e:
-            logger.error(f"Error listing databases: {str(e)}")
+            logger.error("Error listing databases: %s", e)
             return []
     
     def delete_credentials(self, database_id: str) -> bool:
         """Delete database credentials."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("DELETE FROM credentials WHERE database_id = ?", (database_id,))
-            
-            conn.commit()
-            conn.close()
+            cursor = self._conn().cursor()
+            cursor.execute(DELETE_CREDENTIALS_SQL, (database_id,))
+            self._invalidate_cached(database_id)
             
-            logger.info(f"Deleted credentials for database: {database_id}")
+            logger.info("Deleted credentials for database: %s", database_id)
             return True
             
         except Exception as e:
-            logger.error(f"Error deleting credentials: {str(e)}")
+            logger.error("Error deleting credentials: %s", e)
             return False
     
     def database_exists(self, database_id: str) -> bool:
         """Check if database credentials exist."""
+        # Cached credentials are dropped on delete, so a hit means they still exist
+        if self._get_cached(database_id) is not None:
+            return True
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "SELECT 1 FROM credentials WHERE database_id = ?", 
-                (database_id,)
-            )
-            
-            exists = cursor.fetchone() is not None
-            conn.close()
-            
-            return exists
+            cursor = self._conn().cursor()
+            cursor.execute(DATABASE_EXISTS_SQL, (database_id,))
+            return cursor.fetchone() is not None
             
         except Exception as e:
-            logger.error(f"Error checking database existence: {str(e)}")
+            logger.error("Error checking database existence: %s", e)
             return False
 
 
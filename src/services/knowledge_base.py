@@ -2,9 +2,14 @@
 Knowledge Base service for storing and retrieving instructions and SQL pairs.
 """
 
+import atexit
 import sqlite3
 import json
 import logging
+import re
+import threading
+import time
+import uuid
 from pathlib import Path
 from typing import List, Optional, Dict, Any
 from datetime import datetime
@@ -18,50 +23,272 @@ from models import (
 logger = logging.getLogger(__name__)
 
 
+# created_at is stored as integer Unix microseconds; this computes it in SQLite
+NOW_MICROS_SQL = "CAST(round((julianday('now') - 2440587.5) * 86400000000) AS INTEGER)"
+
+# Statements are kept as constants so SQLite reuses their compiled plans
+# from each connection's statement cache. Single inserts take their
+# timestamp from SQLite.
+INSERT_INSTRUCTION_SQL = f"""
+    INSERT INTO instructions (id, database_id, title, content, created_at)
+    VALUES (?, ?, ?, ?, {NOW_MICROS_SQL})
+    RETURNING created_at
+"""
+INSERT_SQL_PAIR_SQL = f"""
+    INSERT INTO sql_pairs (id, database_id, question, sql, description, created_at)
+    VALUES (?, ?, ?, ?, ?, {NOW_MICROS_SQL})
+    RETURNING created_at
+"""
+BULK_INSERT_INSTRUCTION_SQL = """
+    INSERT INTO instructions (id, database_id, title, content, created_at)
+    VALUES (?, ?, ?, ?, ?)
+"""
+BULK_INSERT_SQL_PAIR_SQL = """
+    INSERT INTO sql_pairs (id, database_id, question, sql, description, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+SELECT_INSTRUCTIONS_SQL = """
+    SELECT id, database_id, title, content, created_at
+    FROM instructions
+    WHERE database_id = ?
+    ORDER BY created_at DESC
+"""
+SELECT_SQL_PAIRS_SQL = """
+    SELECT id, database_id, question, sql, description, created_at
+    FROM sql_pairs
+    WHERE database_id = ?
+    ORDER BY created_at DESC
+"""
+SEARCH_INSTRUCTIONS_SQL = """
+    SELECT i.id, i.database_id, i.title, i.content, i.created_at
+    FROM instructions_fts
+    JOIN instructions i ON i.rowid = instructions_fts.rowid
+    WHERE instructions_fts MATCH ? AND i.database_id = ?
+    ORDER BY bm25(instructions_fts)
+    LIMIT ?
+"""
+SEARCH_SQL_PAIRS_SQL = """
+    SELECT p.id, p.database_id, p.question, p.sql, p.description, p.created_at
+    FROM sql_pairs_fts
+    JOIN sql_pairs p ON p.rowid = sql_pairs_fts.rowid
+    WHERE sql_pairs_fts MATCH ? AND p.database_id = ?
+    ORDER BY bm25(sql_pairs_fts)
+    LIMIT ?
+"""
+DELETE_INSTRUCTION_SQL = "DELETE FROM instructions WHERE id = ?"
+DELETE_SQL_PAIR_SQL = "DELETE FROM sql_pairs WHERE id = ?"
+
+
+# Seconds between query planner statistics refreshes (PRAGMA optimize)
+OPTIMIZE_INTERVAL = 3 * 3600
+
+# Full-text indexed columns of each knowledge base table
+FTS_COLUMNS = {
+    "instructions": ("title", "content"),
+    "sql_pairs": ("question", "sql", "description"),
+}
+
+# Words of a search query; everything else would be FTS5 query syntax
+SEARCH_TERM_PATTERN = re.compile(r"\w+")
+
+
+def _from_micros(micros: int) -> datetime:
+    """Local datetime of a created_at value (Unix microseconds)."""
+    return datetime.fromtimestamp(micros / 1_000_000)
+
+
+def _fts_query(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 query matching any of its words."""
+    terms = SEARCH_TERM_PATTERN.findall(query)
+    return " OR ".join(f'"{term}"' for term in terms) if terms else None
+
+
 class KnowledgeBaseStore:
-    """Store and retrieve knowledge base entries in SQLite."""
+    """
+    Store and retrieve knowledge base entries in SQLite.
+    
+    Writes share one long-lived connection and reads a second, read-only one,
+    each guarded by a lock, so no call pays for opening a connection. Under WAL
+    reads don't wait for writes.
+    """
     
     def __init__(self, db_path: str = "./data/knowledge_base.db"):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        self._lock = threading.RLock()
+        self._conn = self._connect()
         self._init_db()
+        
+        self._read_lock = threading.Lock()
+        self._read_conn = self._connect(read_only=True)
+        
+        self._optimize_timer: Optional[threading.Timer] = None
+        self._schedule_optimize()
+        
+        atexit.register(self.close)
+    
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        """
+        Open a connection tuned for many small writes.
+        
+        WAL (persistent per database) lets readers run alongside a writer and,
+        with synchronous=NORMAL, commits no longer wait for an fsync.
+        """
+        if read_only:
+            conn = sqlite3.connect(
+                f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False, cached_statements=256
+            )
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+        conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA cache_size=-64000;
+            PRAGMA busy_timeout=5000;
+            PRAGMA mmap_size=2147483648;
+        """)
+        return conn
+    
+    def optimize(self):
+        """Refresh the query planner statistics of tables whose contents changed."""
+        try:
+            with self._lock:
+                self._conn.executescript("PRAGMA analysis_limit=400; PRAGMA optimize;")
+        except Exception as e:
+            logger.error(f"Error optimizing knowledge base: {str(e)}")
+    
+    def _schedule_optimize(self):
+        """Run optimize every OPTIMIZE_INTERVAL seconds while the process lives."""
+        def run():
+            self.optimize()
+            self._schedule_optimize()
+        
+        self._optimize_timer = threading.Timer(OPTIMIZE_INTERVAL, run)
+        self._optimize_timer.daemon = True
+        self._optimize_timer.start()
+    
+    def close(self):
+        """Optimize once more and close both connections."""
+        atexit.unregister(self.close)
+        if self._optimize_timer:
+            self._optimize_timer.cancel()
+            self._optimize_timer = None
+        self.optimize()
+        self._conn.close()
+        self._read_conn.close()
     
     def _init_db(self):
         """Initialize SQLite database with knowledge base tables."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._conn
         cursor = conn.cursor()
         
         # Instructions table
-        cursor.execute("""
+        cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS instructions (
                 id TEXT PRIMARY KEY,
                 database_id TEXT NOT NULL,
                 title TEXT NOT NULL,
                 content TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at INTEGER DEFAULT ({NOW_MICROS_SQL})
             )
         """)
         
         # SQL Pairs table
-        cursor.execute("""
+        cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS sql_pairs (
                 id TEXT PRIMARY KEY,
                 database_id TEXT NOT NULL,
                 question TEXT NOT NULL,
                 sql TEXT NOT NULL,
                 description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at INTEGER DEFAULT ({NOW_MICROS_SQL})
             )
         """)
         
-        # Create indexes
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_instructions_db ON instructions(database_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sql_pairs_db ON sql_pairs(database_id)")
+        # Covering indexes, so listing a database's entries newest first reads
+        # only the index (they replace the plain database_id indexes)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_instructions_cover
+            ON instructions(database_id, created_at DESC, id, title, content)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sql_pairs_cover
+            ON sql_pairs(database_id, created_at DESC, id, question, sql, description)
+        """)
+        cursor.execute("DROP INDEX IF EXISTS idx_instructions_db")
+        cursor.execute("DROP INDEX IF EXISTS idx_sql_pairs_db")
+        
+        # Full-text indexes, kept in sync with their tables by triggers
+        for table, columns in FTS_COLUMNS.items():
+            self._init_fts(cursor, table, columns)
+        
+        # Timestamps used to be stored as ISO text in local time
+        for table in FTS_COLUMNS:
+            rows = cursor.execute(
+                f"SELECT rowid, created_at FROM {table} WHERE typeof(created_at) = 'text'"
+            ).fetchall()
+            cursor.executemany(
+                f"UPDATE {table} SET created_at = ? WHERE rowid = ?",
+                [(round(datetime.fromisoformat(text).timestamp() * 1_000_000), rowid) for rowid, text in rows]
+            )
         
         conn.commit()
-        conn.close()
         logger.info(f"Knowledge base database initialized at {self.db_path}")
     
+    @staticmethod
+    def _init_fts(cursor: sqlite3.Cursor, table: str, columns: tuple):
+        """Create the FTS5 index of a table and its sync triggers, indexing existing rows once."""
+        fts = f"{table}_fts"
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)
+        ).fetchone()
+        
+        column_list = ", ".join(columns)
+        new_values = ", ".join(f"new.{column}" for column in columns)
+        old_values = ", ".join(f"old.{column}" for column in columns)
+        cursor.executescript(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {column_list}, content='{table}', content_rowid='rowid', tokenize='unicode61'
+            );
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts}(rowid, {column_list}) VALUES (new.rowid, {new_values});
+            END;
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values});
+            END;
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values});
+                INSERT INTO {fts}(rowid, {column_list}) VALUES (new.rowid, {new_values});
+            END;
+        """)
+        if not exists:
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    
+    @staticmethod
+    def _row_to_instruction(row: tuple) -> KnowledgeBaseInstruction:
+        """Build an instruction from (id, database_id, title, content, created_at)."""
+        return KnowledgeBaseInstruction(
+            id=row[0],
+            database_id=row[1],
+            title=row[2],
+            content=row[3],
+            created_at=_from_micros(row[4])
+        )
+    
+    @staticmethod
+    def _row_to_sql_pair(row: tuple) -> KnowledgeBaseSQLPair:
+        """Build a SQL pair from (id, database_id, question, sql, description, created_at)."""
+        return KnowledgeBaseSQLPair(
+            id=row[0],
+            database_id=row[1],
+            question=row[2],
+            sql=row[3],
+            description=row[4],
+            created_at=_from_micros(row[5])
+        )
+    
     def add_instruction(
         self, 
         database_id: str, 
@@ -70,19 +297,13 @@ class KnowledgeBaseStore:
     ) -> KnowledgeBaseInstruction:
         """Add a new instruction."""
         try:
-            instruction_id = f"inst_{datetime.now().timestamp()}"
-            created_at = datetime.now()
+            instruction_id = f"inst_{uuid.uuid4().hex}"
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO instructions (id, database_id, title, content, created_at)
-                VALUES (?, ?, ?, ?, ?)
-            """, (instruction_id, database_id, title, content, created_at.isoformat()))
-            
-            conn.commit()
-            conn.close()
+            with self._lock:
+                (created_at,) = self._conn.execute(
+                    INSERT_INSTRUCTION_SQL, (instruction_id, database_id, title, content)
+                ).fetchone()
+                self._conn.commit()
             
             logger.info(f"Added instruction {instruction_id} for database {database_id}")
             
@@ -91,7 +312,7 @@ class KnowledgeBaseStore:
                 database_id=database_id,
                 title=title,
                 content=content,
-                created_at=created_at
+                created_at=_from_micros(created_at)
             )
             
         except Exception as e:
@@ -107,19 +328,13 @@ class KnowledgeBaseStore:
     ) -> KnowledgeBaseSQLPair:
         """Add a new SQL pair."""
         try:
-            pair_id = f"pair_{datetime.now().timestamp()}"
-            created_at = datetime.now()
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            pair_id = f"pair_{uuid.uuid4().hex}"
             
-            cursor.execute("""
-                INSERT INTO sql_pairs (id, database_id, question, sql, description, created_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (pair_id, database_id, question, sql, description, created_at.isoformat()))
-            
-            conn.commit()
-            conn.close()
+            with self._lock:
+                (created_at,) = self._conn.execute(
+                    INSERT_SQL_PAIR_SQL, (pair_id, database_id, question, sql, description)
+                ).fetchone()
+                self._conn.commit()
             
             logger.info(f"Added SQL pair {pair_id} for database {database_id}")
             
@@ -129,40 +344,103 @@ class KnowledgeBaseStore:
                 question=question,
                 sql=sql,
                 description=description,
-                created_at=created_at
+                created_at=_from_micros(created_at)
             )
             
         except Exception as e:
             logger.error(f"Error adding SQL pair: {str(e)}")
             raise
     
+    def add_instructions_bulk(
+        self,
+        database_id: str,
+        entries: List[Dict[str, str]]
+    ) -> List[KnowledgeBaseInstruction]:
+        """
+        Add many instructions in one transaction.
+        
+        Args:
+            database_id: Database the instructions apply to
+            entries: Dicts with the title and content of each instruction
+            
+        Returns:
+            The added instructions
+        """
+        try:
+            created_at = time.time_ns() // 1000
+            instructions = [
+                KnowledgeBaseInstruction(
+                    id=f"inst_{uuid.uuid4().hex}",
+                    database_id=database_id,
+                    title=entry["title"],
+                    content=entry["content"],
+                    created_at=_from_micros(created_at)
+                )
+                for entry in entries
+            ]
+            
+            with self._lock, self._conn:
+                self._conn.executemany(BULK_INSERT_INSTRUCTION_SQL, [
+                    (inst.id, database_id, inst.title, inst.content, created_at)
+                    for inst in instructions
+                ])
+            
+            logger.info(f"Added {len(instructions)} instructions for database {database_id}")
+            return instructions
+            
+        except Exception as e:
+            logger.error(f"Error adding instructions: {str(e)}")
+            raise
+    
+    def add_sql_pairs_bulk(
+        self,
+        database_id: str,
+        entries: List[Dict[str, Optional[str]]]
+    ) -> List[KnowledgeBaseSQLPair]:
+        """
+        Add many SQL pairs in one transaction.
+        
+        Args:
+            database_id: Database the pairs apply to
+            entries: Dicts with the question, sql and optional description of each pair
+            
+        Returns:
+            The added SQL pairs
+        """
+        try:
+            created_at = time.time_ns() // 1000
+            pairs = [
+                KnowledgeBaseSQLPair(
+                    id=f"pair_{uuid.uuid4().hex}",
+                    database_id=database_id,
+                    question=entry["question"],
+                    sql=entry["sql"],
+                    description=entry.get("description"),
+                    created_at=_from_micros(created_at)
+                )
+                for entry in entries
+            ]
+            
+            with self._lock, self._conn:
+                self._conn.executemany(BULK_INSERT_SQL_PAIR_SQL, [
+                    (pair.id, database_id, pair.question, pair.sql, pair.description, created_at)
+                    for pair in pairs
+                ])
+            
+            logger.info(f"Added {len(pairs)} SQL pairs for database {database_id}")
+            return pairs
+            
+        except Exception as e:
+            logger.error(f"Error adding SQL pairs: {str(e)}")
+            raise
+    
     def get_instructions(self, database_id: str) -> List[KnowledgeBaseInstruction]:
         """Get all instructions for a database."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT id, database_id, title, content, created_at
-                FROM instructions
-                WHERE database_id = ?
-                ORDER BY created_at DESC
-            """, (database_id,))
-            
-            rows = cursor.fetchall()
-            conn.close()
-            
-            instructions = []
-            for row in rows:
-                instructions.append(KnowledgeBaseInstruction(
-                    id=row[0],
-                    database_id=row[1],
-                    title=row[2],
-                    content=row[3],
-                    created_at=datetime.fromisoformat(row[4])
-                ))
+            with self._read_lock:
+                rows = self._read_conn.execute(SELECT_INSTRUCTIONS_SQL, (database_id,)).fetchall()
             
-            return instructions
+            return [self._row_to_instruction(row) for row in rows]
             
         except Exception as e:
             logger.error(f"Error getting instructions: {str(e)}")
@@ -171,47 +449,74 @@ class KnowledgeBaseStore:
     def get_sql_pairs(self, database_id: str) -> List[KnowledgeBaseSQLPair]:
         """Get all SQL pairs for a database."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT id, database_id, question, sql, description, created_at
-                FROM sql_pairs
-                WHERE database_id = ?
-                ORDER BY created_at DESC
-            """, (database_id,))
-            
-            rows = cursor.fetchall()
-            conn.close()
-            
-            pairs = []
-            for row in rows:
-                pairs.append(KnowledgeBaseSQLPair(
-                    id=row[0],
-                    database_id=row[1],
-                    question=row[2],
-                    sql=row[3],
-                    description=row[4],
-                    created_at=datetime.fromisoformat(row[5])
-                ))
+            with self._read_lock:
+                rows = self._read_conn.execute(SELECT_SQL_PAIRS_SQL, (database_id,)).fetchall()
             
-            return pairs
+            return [self._row_to_sql_pair(row) for row in rows]
             
         except Exception as e:
             logger.error(f"Error getting SQL pairs: {str(e)}")
             return []
     
-    def delete_instruction(self, instruction_id: str) -> bool:
-        """Delete an instruction."""
+    def search_instructions(self, database_id: str, query: str, limit: int = 5) -> List[KnowledgeBaseInstruction]:
+        """
+        Find a database's instructions by keywords, best BM25 match first.
+        
+        Args:
+            database_id: Database to search
+            query: Free text; instructions containing any of its words match
+            limit: Maximum number of instructions
+            
+        Returns:
+            Matching instructions
+        """
+        fts_query = _fts_query(query)
+        if not fts_query:
+            return []
+        
+        try:
+            with self._read_lock:
+                rows = self._read_conn.execute(SEARCH_INSTRUCTIONS_SQL, (fts_query, database_id, limit)).fetchall()
+            
+            return [self._row_to_instruction(row) for row in rows]
+            
+        except Exception as e:
+            logger.error(f"Error searching instructions: {str(e)}")
+            return []
+    
+    def search_sql_pairs(self, database_id: str, query: str, limit: int = 5) -> List[KnowledgeBaseSQLPair]:
+        """
+        Find a database's SQL pairs by keywords, best BM25 match first.
+        
+        Args:
+            database_id: Database to search
+            query: Free text; pairs whose question, SQL or description contain any of its words match
+            limit: Maximum number of pairs
+            
+        Returns:
+            Matching SQL pairs
+        """
+        fts_query = _fts_query(query)
+        if not fts_query:
+            return []
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with self._read_lock:
+                rows = self._read_conn.execute(SEARCH_SQL_PAIRS_SQL, (fts_query, database_id, limit)).fetchall()
             
-            cursor.execute("DELETE FROM instructions WHERE id = ?", (instruction_id,))
+            return [self._row_to_sql_pair(row) for row in rows]
             
-            conn.commit()
-            deleted = cursor.rowcount > 0
-            conn.close()
+        except Exception as e:
+            logger.error(f"Error searching SQL pairs: {str(e)}")
+            return []
+    
+    def delete_instruction(self, instruction_id: str) -> bool:
+        """Delete an instruction."""
+        try:
+            with self._lock:
+                cursor = self._conn.execute(DELETE_INSTRUCTION_SQL, (instruction_id,))
+                self._conn.commit()
+                deleted = cursor.rowcount > 0
             
             if deleted:
                 logger.info(f"Deleted instruction {instruction_id}")
@@ -225,14 +530,10 @@ class KnowledgeBaseStore:
     def delete_sql_pair(self, pair_id: str) -> bool:
         """Delete a SQL pair."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("DELETE FROM sql_pairs WHERE id = ?", (pair_id,))
-            
-            conn.commit()
-            deleted = cursor.rowcount > 0
-            conn.close()
+            with self._lock:
+                cursor = self._conn.execute(DELETE_SQL_PAIR_SQL, (pair_id,))
+                self._conn.commit()
+                deleted = cursor.rowcount > 0
             
             if deleted:
                 logger.info(f"Deleted SQL pair {pair_id}")
@@ -0,0 +1,71 @@
+"""
+Shared HTTP clients for the LLM and embedding providers.
+Every OpenAI-compatible wrapper in the process uses the same connection pool,
+so TCP/TLS connections are kept alive and reused across requests.
+"""
+
+import logging
+from typing import Optional
+
+import httpx
+from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Retries for failed connection attempts (request retries are left to the OpenAI client)
+CONNECT_RETRIES = 2
+
+_async_client: Optional[httpx.AsyncClient] = None
+_sync_client: Optional[httpx.Client] = None
+
+
+def _limits() -> httpx.Limits:
+    """Connection pool limits shared by both clients."""
+    return httpx.Limits(
+        max_connections=settings.llm_http_max_connections,
+        max_keepalive_connections=settings.llm_http_max_keepalive,
+        # Longer than httpx's 5s default, so connections survive gaps between asks
+        keepalive_expiry=settings.llm_http_keepalive_expiry
+    )
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Get the process-wide async HTTP client, creating it on first use."""
+    global _async_client
+    if _async_client is None:
+        _async_client = DefaultAsyncHttpxClient(
+            transport=httpx.AsyncHTTPTransport(
+                http2=settings.llm_http2,
+                limits=_limits(),
+                retries=CONNECT_RETRIES
+            )
+        )
+        logger.info("Created shared LLM HTTP client (http2=%s)", settings.llm_http2)
+    return _async_client
+
+
+def get_sync_client() -> httpx.Client:
+    """Get the process-wide sync HTTP client (used by sync embedding calls)."""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = DefaultHttpxClient(
+            transport=httpx.HTTPTransport(
+                http2=settings.llm_http2,
+                limits=_limits(),
+                retries=CONNECT_RETRIES
+            )
+        )
+    return _sync_client
+
+
+async def close_clients():
+    """Close the shared clients on shutdown."""
+    global _async_client, _sync_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _sync_client is not None:
+        _sync_client.close()
+        _sync_client = None
@@ -3,9 +3,14 @@ MySQL schema discovery service.
 Connects to MySQL database and extracts schema automatically.
 """
 
+import asyncio
+import copy
 import logging
-from typing import Dict, List, Any, Optional
-import mysql.connector
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Tuple
 from mysql.connector import Error
 
 from models import (
@@ -16,15 +21,20 @@ from models import (
     IndexingResult
 )
 from pipelines.indexing import SchemaIndexer
+from services.query_executor import MySQLQueryExecutor
 
 logger = logging.getLogger(__name__)
 
 
-# Query to extract schema from MySQL INFORMATION_SCHEMA
-SCHEMA_DISCOVERY_QUERY = """
+# Column rows of the schema from MySQL INFORMATION_SCHEMA. Foreign key rows
+# share its columns so both can come back from one query (see
+# build_schema_query); row_kind tells them apart.
+COLUMNS_QUERY = """
 SELECT
+  'column'                               AS row_kind,
   c.TABLE_NAME                           AS table_name,
   t.TABLE_COMMENT                        AS table_comment,
+  CASE WHEN kcu.COLUMN_NAME IS NOT NULL THEN 1 ELSE 0 END AS is_primary_key,
   c.COLUMN_NAME                          AS column_name,
   c.DATA_TYPE                            AS data_type,
   c.COLUMN_TYPE                          AS column_type,
@@ -32,7 +42,10 @@ SELECT
   c.COLUMN_DEFAULT                       AS column_default,
   c.EXTRA                                AS extra,
   c.COLUMN_COMMENT                       AS column_comment,
-  CASE WHEN kcu.COLUMN_NAME IS NOT NULL THEN 1 ELSE 0 END AS is_primary_key
+  c.ORDINAL_POSITION                     AS ordinal_position,
+  NULL                                   AS referenced_table,
+  NULL                                   AS referenced_column,
+  NULL                                   AS constraint_name
 FROM INFORMATION_SCHEMA.COLUMNS AS c
 JOIN INFORMATION_SCHEMA.TABLES  AS t
   ON  t.TABLE_SCHEMA = c.TABLE_SCHEMA
@@ -47,146 +60,253 @@ LEFT JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE AS kcu
   AND kcu.TABLE_NAME        = tc.TABLE_NAME
   AND kcu.COLUMN_NAME       = c.COLUMN_NAME
 WHERE c.TABLE_SCHEMA = DATABASE()
-  AND t.TABLE_TYPE = 'BASE TABLE'
-ORDER BY c.TABLE_SCHEMA, c.TABLE_NAME, c.ORDINAL_POSITION
+  AND t.TABLE_TYPE IN ({table_types})
+  {table_filter}
 """
 
-# Query for views
-SCHEMA_DISCOVERY_QUERY_WITH_VIEWS = """
-SELECT
-  c.TABLE_NAME                           AS table_name,
-  t.TABLE_COMMENT                        AS table_comment,
-  c.COLUMN_NAME                          AS column_name,
-  c.DATA_TYPE                            AS data_type,
-  c.COLUMN_TYPE                          AS column_type,
-  c.IS_NULLABLE                          AS is_nullable,
-  c.COLUMN_DEFAULT                       AS column_default,
-  c.EXTRA                                AS extra,
-  c.COLUMN_COMMENT                       AS column_comment,
-  CASE WHEN kcu.COLUMN_NAME IS NOT NULL THEN 1 ELSE 0 END AS is_primary_key
-FROM INFORMATION_SCHEMA.COLUMNS AS c
-JOIN INFORMATION_SCHEMA.TABLES  AS t
-  ON  t.TABLE_SCHEMA = c.TABLE_SCHEMA
-  AND t.TABLE_NAME   = c.TABLE_NAME
-LEFT JOIN INFORMATION_SCHEMA.TABLE_CONSTRAINTS AS tc
-  ON  tc.TABLE_SCHEMA    = c.TABLE_SCHEMA
-  AND tc.TABLE_NAME      = c.TABLE_NAME
-  AND tc.CONSTRAINT_TYPE = 'PRIMARY KEY'
-LEFT JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE AS kcu
-  ON  kcu.CONSTRAINT_SCHEMA = tc.CONSTRAINT_SCHEMA
-  AND kcu.CONSTRAINT_NAME   = tc.CONSTRAINT_NAME
-  AND kcu.TABLE_NAME        = tc.TABLE_NAME
-  AND kcu.COLUMN_NAME       = c.COLUMN_NAME
-WHERE c.TABLE_SCHEMA = DATABASE()
-ORDER BY c.TABLE_SCHEMA, c.TABLE_NAME, c.ORDINAL_POSITION
-"""
-
-# Query to get foreign key relationships
+# Foreign key rows: source in table_name/column_name, target in
+# referenced_table/referenced_column
 FOREIGN_KEYS_QUERY = """
+UNION ALL
 SELECT
-  kcu.TABLE_NAME              AS from_table,
-  kcu.COLUMN_NAME             AS from_column,
-  kcu.REFERENCED_TABLE_NAME   AS to_table,
-  kcu.REFERENCED_COLUMN_NAME  AS to_column,
-  kcu.CONSTRAINT_NAME         AS constraint_name
+  'foreign_key', kcu.TABLE_NAME, NULL, 0, kcu.COLUMN_NAME, NULL, NULL, NULL, NULL, NULL, NULL,
+  kcu.ORDINAL_POSITION, kcu.REFERENCED_TABLE_NAME, kcu.REFERENCED_COLUMN_NAME, kcu.CONSTRAINT_NAME
 FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE AS kcu
 WHERE kcu.TABLE_SCHEMA = DATABASE()
   AND kcu.REFERENCED_TABLE_NAME IS NOT NULL
-ORDER BY kcu.TABLE_NAME, kcu.ORDINAL_POSITION
 """
 
+SCHEMA_ORDER_BY = "ORDER BY row_kind, table_name, ordinal_position"
+
+
+@lru_cache(maxsize=64)
+def _schema_sql(include_views: bool, num_selected: int, foreign_keys: bool) -> str:
+    """Render the discovery query text once per shape, so repeated discoveries send identical SQL."""
+    num_types = 2 if include_views else 1
+    table_filter = f"AND c.TABLE_NAME IN ({', '.join(['%s'] * num_selected)})" if num_selected else ""
+    query = COLUMNS_QUERY.format(table_types=", ".join(["%s"] * num_types), table_filter=table_filter)
+    if foreign_keys:
+        query += FOREIGN_KEYS_QUERY
+    return query + SCHEMA_ORDER_BY
+
+
+def build_schema_query(
+    include_views: bool = False,
+    selected_tables: Optional[List[str]] = None,
+    foreign_keys: bool = False
+) -> Tuple[str, List[str]]:
+    """
+    Build the schema discovery query, filtering rows on the server.
+    
+    Args:
+        include_views: Also return the columns of views
+        selected_tables: Only return columns of these tables (None = all tables)
+        foreign_keys: Append all foreign key rows of the database
+        
+    Returns:
+        The query and its parameters
+    """
+    params = ["BASE TABLE", "VIEW"] if include_views else ["BASE TABLE"]
+    if selected_tables:
+        params.extend(selected_tables)
+    query = _schema_sql(include_views, len(selected_tables) if selected_tables else 0, foreign_keys)
+    return query, params
+
+
+# Database name, server version and table count in one round trip
+CONNECTION_INFO_QUERY = """
+SELECT
+  DATABASE(),
+  VERSION(),
+  (SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES
+   WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE')
+"""
+
+# Cheap summary of the schema that changes when tables are created, altered,
+# dropped or written to, so a cached discovery can be reused while it matches.
+# The checksums cover table and column names, types and comments, and the key
+# and foreign key columns, which renames, comment changes and new constraints
+# leave the counts and times of untouched. Each INFORMATION_SCHEMA view is read once
+SCHEMA_FINGERPRINT_QUERY = """
+SELECT
+  t.table_count, t.last_created, t.last_updated, t.table_checksum,
+  c.column_count, c.column_checksum,
+  k.key_count, k.key_checksum
+FROM (
+  SELECT
+    COUNT(*)          AS table_count,
+    MAX(CREATE_TIME)  AS last_created,
+    MAX(UPDATE_TIME)  AS last_updated,
+    SUM(CRC32(CONCAT_WS('|', TABLE_NAME, TABLE_TYPE, TABLE_COMMENT))) AS table_checksum
+  FROM INFORMATION_SCHEMA.TABLES
+  WHERE TABLE_SCHEMA = DATABASE()
+) AS t
+CROSS JOIN (
+  SELECT
+    COUNT(*) AS column_count,
+    SUM(CRC32(CONCAT_WS('|', TABLE_NAME, ORDINAL_POSITION, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY, COLUMN_COMMENT))) AS column_checksum
+  FROM INFORMATION_SCHEMA.COLUMNS
+  WHERE TABLE_SCHEMA = DATABASE()
+) AS c
+CROSS JOIN (
+  SELECT
+    COUNT(*) AS key_count,
+    SUM(CRC32(CONCAT_WS('|', CONSTRAINT_NAME, TABLE_NAME, COLUMN_NAME, ORDINAL_POSITION,
+                        REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME))) AS key_checksum
+  FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
+  WHERE TABLE_SCHEMA = DATABASE()
+) AS k
+"""
+
+# Discovery results kept per database before the least recently used is dropped
+SCHEMA_CACHE_SIZE = 32
+
 
 class MySQLSchemaDiscovery:
     """
     Discovers database schema from MySQL using INFORMATION_SCHEMA.
+    
+    Connections come from the query executor's per-credentials pools, so
+    discovering, indexing and querying a database share its connections.
+    Results are cached for `cache_ttl` seconds and reused while the schema
+    fingerprint (see SCHEMA_FINGERPRINT_QUERY) is unchanged.
     """
     
-    def __init__(self, indexer: SchemaIndexer):
+    def __init__(
+        self,
+        indexer: SchemaIndexer,
+        query_executor: Optional[MySQLQueryExecutor] = None,
+        cache_ttl: float = 300.0
+    ):
         self.indexer = indexer
+        self.query_executor = query_executor or MySQLQueryExecutor()
+        self.cache_ttl = cache_ttl
+        
+        # (kind, host, port, user, database, include_views, selected tables) -> (fingerprint, cached at, result)
+        self._cache: "OrderedDict[Tuple, Tuple[Tuple, float, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
     
     def _connect(self, credentials: MySQLCredentials):
-        """Create MySQL connection."""
+        """Get a pooled MySQL connection (closing it returns it to the pool)."""
+        connection = self.query_executor.connect(credentials)
+        logger.info(f"Successfully connected to MySQL database: {credentials.database}")
+        return connection
+    
+    def _fingerprint(self, connection) -> Optional[Tuple]:
+        """Fingerprint of the connected database's schema, or None when caching is off."""
+        if self.cache_ttl <= 0:
+            return None
+        cursor = connection.cursor(buffered=True)
         try:
-            connection = mysql.connector.connect(
-                host=credentials.host,
-                port=credentials.port,
-                user=credentials.user,
-                password=credentials.password,
-                database=credentials.database,
-                charset='utf8mb4',
-                use_unicode=True
-            )
-            
-            if connection.is_connected():
-                logger.info(f"Successfully connected to MySQL database: {credentials.database}")
-                return connection
-            else:
-                raise Error("Failed to connect to MySQL")
-                
-        except Error as e:
-            logger.error(f"Error connecting to MySQL: {e}")
-            raise
+            cursor.execute(SCHEMA_FINGERPRINT_QUERY)
+            return tuple(cursor.fetchone())
+        finally:
+            cursor.close()
     
-    def _extract_schema(self, credentials: MySQLCredentials, include_views: bool = False) -> DatabaseSchema:
-        """Extract schema from MySQL database."""
+    @staticmethod
+    def _cache_key(
+        kind: str,
+        credentials: MySQLCredentials,
+        include_views: bool,
+        selected_tables: Optional[List[str]]
+    ) -> Tuple:
+        """Key of a cached discovery result."""
+        tables = tuple(sorted(selected_tables)) if selected_tables else None
+        return (kind, credentials.host, credentials.port, credentials.user, credentials.database, include_views, tables)
+    
+    def _get_cached(self, key: Tuple, fingerprint: Optional[Tuple]) -> Optional[Any]:
+        """Copy of a cached result if it is fresh and the schema fingerprint still matches."""
+        if fingerprint is None:
+            return None
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None or entry[0] != fingerprint or time.time() - entry[1] > self.cache_ttl:
+                return None
+            self._cache.move_to_end(key)
+            result = entry[2]
+        logger.info(f"Reusing cached schema discovery for database: {key[4]}")
+        return copy.deepcopy(result)
+    
+    def _put_cached(self, key: Tuple, fingerprint: Optional[Tuple], result: Any):
+        """Cache a copy of a discovery result, dropping the least recently used beyond SCHEMA_CACHE_SIZE."""
+        if fingerprint is None:
+            return
+        with self._cache_lock:
+            self._cache[key] = (fingerprint, time.time(), copy.deepcopy(result))
+            self._cache.move_to_end(key)
+            if len(self._cache) > SCHEMA_CACHE_SIZE:
+                self._cache.popitem(last=False)
+    
+    def _extract_schema(
+        self,
+        credentials: MySQLCredentials,
+        include_views: bool = False,
+        selected_tables: Optional[List[str]] = None
+    ) -> DatabaseSchema:
+        """Extract schema from MySQL database, optionally only of the selected tables."""
         connection = None
+        cursor = None
+        cache_key = self._cache_key("schema", credentials, include_views, selected_tables)
         
         try:
             connection = self._connect(credentials)
-            cursor = connection.cursor(dictionary=True)
+            fingerprint = self._fingerprint(connection)
+            cached = self._get_cached(cache_key, fingerprint)
+            if cached is not None:
+                return cached
             
-            # Execute schema discovery query
-            query = SCHEMA_DISCOVERY_QUERY_WITH_VIEWS if include_views else SCHEMA_DISCOVERY_QUERY
-            cursor.execute(query)
-            rows = cursor.fetchall()
+            # Unbuffered, so rows are grouped as they stream in instead of being materialized first
+            cursor = connection.cursor(buffered=False)
             
-            logger.info(f"Retrieved {len(rows)} column records from database")
+            # Columns and foreign keys come back from a single query
+            query, params = build_schema_query(include_views, selected_tables, foreign_keys=True)
+            cursor.execute(query, params)
             
             # Group columns by table
             tables_data: Dict[str, Dict[str, Any]] = {}
+            relationships = []
             
-            for row in rows:
-                table_name = row['table_name']
+            # Positional rows in the column order of COLUMNS_QUERY
+            for (
+                row_kind, table_name, table_comment, is_primary_key, column_name, data_type, column_type,
+                is_nullable, column_default, extra, column_comment, _, referenced_table,
+                referenced_column, constraint_name
+            ) in cursor:
+                if row_kind == 'foreign_key':
+                    relationships.append({
+                        'from_table': table_name,
+                        'from_column': column_name,
+                        'to_table': referenced_table,
+                        'to_column': referenced_column,
+                        'constraint_name': constraint_name
+                    })
+                    continue
                 
-                if table_name not in tables_data:
-                    tables_data[table_name] = {
+                table_data = tables_data.get(table_name)
+                if table_data is None:
+                    table_data = tables_data[table_name] = {
                         'name': table_name,
-                        'description': row['table_comment'] or None,
-                        'table_comment': row['table_comment'] or None,
+                        'description': table_comment or None,
+                        'table_comment': table_comment or None,
                         'columns': [],
                         'primary_key': []
                     }
                 
                 # Add column info
-                column_info = {
-                    'name': row['column_name'],
-                    'type': row['column_type'] or row['data_type'],
-                    'nullable': row['is_nullable'] == 'YES',
-                    'default': row['column_default'],
-                    'extra': row['extra'],
-                    'comment': row['column_comment']
-                }
-                
-                tables_data[table_name]['columns'].append(column_info)
+                table_data['columns'].append({
+                    'name': column_name,
+                    'type': column_type or data_type,
+                    'nullable': is_nullable == 'YES',
+                    'default': column_default,
+                    'extra': extra,
+                    'comment': column_comment
+                })
                 
                 # Track primary keys
-                if row['is_primary_key'] == 1:
-                    tables_data[table_name]['primary_key'].append(row['column_name'])
-            
-            # Extract foreign key relationships
-            cursor.execute(FOREIGN_KEYS_QUERY)
-            fk_rows = cursor.fetchall()
-            
-            relationships = []
-            for fk in fk_rows:
-                relationships.append({
-                    'from_table': fk['from_table'],
-                    'from_column': fk['from_column'],
-                    'to_table': fk['to_table'],
-                    'to_column': fk['to_column'],
-                    'constraint_name': fk['constraint_name']
-                })
+                if is_primary_key == 1:
+                    table_data['primary_key'].append(column_name)
             
+            logger.info(f"Retrieved {cursor.rowcount} column and foreign key records from database")
             logger.info(f"Found {len(relationships)} foreign key relationships")
             
             # Convert to TableSchema objects
@@ -208,17 +328,17 @@ class MySQLSchemaDiscovery:
                 # Add column information to description for better context
                 col_details = []
                 for col in table_data['columns']:
-                    col_detail = f"  - {col['name']} ({col['type']})"
+                    parts = [f"  - {col['name']} ({col['type']})"]
                     if col['comment']:
-                        col_detail += f": {col['comment']}"
+                        parts.append(f": {col['comment']}")
                     if not col['nullable']:
-                        col_detail += " [NOT NULL]"
+                        parts.append(" [NOT NULL]")
                     if col['extra']:
-                        col_detail += f" [{col['extra']}]"
-                    col_details.append(col_detail)
+                        parts.append(f" [{col['extra']}]")
+                    col_details.append("".join(parts))
                 
                 if col_details:
-                    description += "\nColumns:\n" + "\n".join(col_details)
+                    description = "\n".join([description, "Columns:", *col_details])
                 
                 table = TableSchema(
                     name=table_data['name'],
@@ -237,6 +357,7 @@ class MySQLSchemaDiscovery:
                 relationships=relationships if relationships else None
             )
             
+            self._put_cached(cache_key, fingerprint, schema)
             return schema
             
         except Error as e:
@@ -244,9 +365,10 @@ class MySQLSchemaDiscovery:
             raise
         finally:
             if connection and connection.is_connected():
-                cursor.close()
+                if cursor:
+                    cursor.close()
                 connection.close()
-                logger.info("MySQL connection closed")
+                logger.info("MySQL connection returned to pool")
     
     def discover_tables(self, credentials: MySQLCredentials, include_views: bool = False) -> Dict[str, Any]:
         """
@@ -254,61 +376,70 @@ class MySQLSchemaDiscovery:
         Returns table information for user selection.
         """
         connection = None
+        cursor = None
+        cache_key = self._cache_key("tables", credentials, include_views, None)
         
         try:
             connection = self._connect(credentials)
-            cursor = connection.cursor(dictionary=True)
+            fingerprint = self._fingerprint(connection)
+            cached = self._get_cached(cache_key, fingerprint)
+            if cached is not None:
+                return cached
             
-            # Execute schema discovery query
-            query = SCHEMA_DISCOVERY_QUERY_WITH_VIEWS if include_views else SCHEMA_DISCOVERY_QUERY
-            cursor.execute(query)
-            rows = cursor.fetchall()
+            # Unbuffered, so rows are counted as they stream in instead of being materialized first
+            cursor = connection.cursor(buffered=False)
             
-            logger.info(f"Retrieved {len(rows)} column records from database")
+            # Execute schema discovery query
+            query, params = build_schema_query(include_views)
+            cursor.execute(query, params)
             
             # Group columns by table
             tables_data: Dict[str, Dict[str, Any]] = {}
             
-            for row in rows:
-                table_name = row['table_name']
-                
-                if table_name not in tables_data:
-                    tables_data[table_name] = {
+            # Positional rows in the column order of COLUMNS_QUERY
+            for _, table_name, table_comment, is_primary_key, *_ in cursor:
+                table_data = tables_data.get(table_name)
+                if table_data is None:
+                    table_data = tables_data[table_name] = {
                         'name': table_name,
-                        'comment': row['table_comment'] or None,
+                        'comment': table_comment or None,
                         'column_count': 0,
                         'has_primary_key': False
                     }
                 
-                tables_data[table_name]['column_count'] += 1
+                table_data['column_count'] += 1
                 
                 # Track primary keys
-                if row['is_primary_key'] == 1:
-                    tables_data[table_name]['has_primary_key'] = True
+                if is_primary_key == 1:
+                    table_data['has_primary_key'] = True
+            
+            logger.info(f"Retrieved {cursor.rowcount} column records from database")
             
-            # Get database name
-            cursor.execute("SELECT DATABASE()")
-            db_name = cursor.fetchone()['DATABASE()']
+            # The connection's default database, i.e. what DATABASE() would return
+            db_name = credentials.database
             
             # Convert to list
             tables = list(tables_data.values())
             
             logger.info(f"Discovered {len(tables)} tables in database {db_name}")
             
-            return {
+            result = {
                 "database_name": db_name,
                 "tables": tables,
                 "total_tables": len(tables)
             }
+            self._put_cached(cache_key, fingerprint, result)
+            return result
             
         except Error as e:
             logger.error(f"Error discovering tables: {e}")
             raise
         finally:
             if connection and connection.is_connected():
-                cursor.close()
+                if cursor:
+                    cursor.close()
                 connection.close()
-                logger.info("MySQL connection closed")
+                logger.info("MySQL connection returned to pool")
     
     async def discover_and_index(self, request: MySQLAutoIndexRequest) -> IndexingResult:
         """
@@ -318,20 +449,16 @@ class MySQLSchemaDiscovery:
         try:
             logger.info(f"Starting auto-discovery for database: {request.database_id}")
             
-            # Extract schema from MySQL
-            schema = self._extract_schema(request.credentials, request.include_views)
+            # Extract schema from MySQL in a worker thread so the event loop isn't blocked.
+            # A table selection is applied by the discovery query itself.
+            if request.selected_tables:
+                logger.info(f"Discovering {len(request.selected_tables)} selected tables")
+            schema = await asyncio.to_thread(
+                self._extract_schema, request.credentials, request.include_views, request.selected_tables
+            )
             
             logger.info(f"Discovered {len(schema.tables)} tables")
             
-            # Filter tables if selection is provided
-            if request.selected_tables:
-                logger.info(f"Filtering to {len(request.selected_tables)} selected tables")
-                schema.tables = [
-                    table for table in schema.tables 
-                    if table.name in request.selected_tables
-                ]
-                logger.info(f"Filtered to {len(schema.tables)} tables")
-            
             # Create indexing request
             from models import IndexingRequest
             index_request = IndexingRequest(
@@ -355,22 +482,16 @@ class MySQLSchemaDiscovery:
     
     def test_connection(self, credentials: MySQLCredentials) -> Dict[str, Any]:
         """Test MySQL connection."""
+        connection = None
+        cursor = None
+        
         try:
             connection = self._connect(credentials)
             cursor = connection.cursor()
             
             # Get database info
-            cursor.execute("SELECT DATABASE()")
-            db_name = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT VERSION()")
-            version = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'")
-            table_count = cursor.fetchone()[0]
-            
-            cursor.close()
-            connection.close()
+            cursor.execute(CONNECTION_INFO_QUERY)
+            db_name, version, table_count = cursor.fetchone()
             
             return {
                 "success": True,
@@ -385,3 +506,8 @@ class MySQLSchemaDiscovery:
                 "success": False,
                 "error": str(e)
             }
+        finally:
+            if connection and connection.is_connected():
+                if cursor:
+                    cursor.close()
+                connection.close()
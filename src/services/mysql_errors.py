@@ -0,0 +1,56 @@
+"""
+MySQL error classification.
+Decides whether a failed query is worth sending to the LLM for fixing.
+"""
+
+import re
+from typing import Optional
+
+
+# Errors caused by the query itself - rewriting the SQL can fix them
+FIXABLE_ERROR_PATTERN = re.compile(
+    r"Unknown column"
+    r"|Table .* doesn't exist"
+    r"|ambiguous"
+    r"|error in your SQL syntax"
+    r"|syntax error"
+    r"|Invalid use of group function"
+    r"|isn't in GROUP BY"
+    r"|Query validation failed",
+    re.IGNORECASE
+)
+
+# Errors caused by the connection, permissions or server - no SQL rewrite can fix them
+UNFIXABLE_ERROR_PATTERN = re.compile(
+    r"Access denied"
+    r"|Can't connect"
+    r"|MySQL server has gone away"
+    r"|Lost connection"
+    r"|Unknown database"
+    r"|Too many connections"
+    r"|timed? ?out",
+    re.IGNORECASE
+)
+
+
+def is_fixable_error(error_message: Optional[str]) -> bool:
+    """
+    Check whether a query error could be fixed by regenerating the SQL.
+
+    Known query errors (unknown column, missing table, syntax...) are fixable;
+    connection, permission and server errors are not. Unrecognized errors are
+    treated as fixable so the auto-fix still gets a chance.
+
+    Args:
+        error_message: Error message returned by the query executor
+
+    Returns:
+        True if an LLM fix attempt is worthwhile, False otherwise
+    """
+    if not error_message:
+        return True
+
+    if FIXABLE_ERROR_PATTERN.search(error_message):
+        return True
+
+    return UNFIXABLE_ERROR_PATTERN.search(error_message) is None
@@ -3,13 +3,25 @@ MySQL query execution service.
 Executes SQL queries and formats results.
 """
 
+import asyncio
+import io
+import itertools
 import logging
+import threading
 import time
-from typing import List, Dict, Any
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from decimal import Decimal
 from datetime import datetime, date
-import mysql.connector
 from mysql.connector import Error
+from mysql.connector.constants import FieldFlag, FieldType
+from mysql.connector.errors import PoolError
+from mysql.connector.pooling import MySQLConnectionPool
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.tokens import TokenType
 
 from models import MySQLCredentials, QueryExecutionResult
 from services.sql_validator import SQLValidator, SQLValidationError
@@ -17,28 +29,186 @@ from services.sql_validator import SQLValidator, SQLValidationError
 logger = logging.getLogger(__name__)
 
 
+# MySQL result types and how they are made JSON-serializable. Dates and
+# datetimes are left to orjson, which renders them as ISO 8601 itself.
+_CONVERTERS: Dict[type, Callable[[Any], Any]] = {
+    Decimal: float,
+    bytes: lambda value: value.decode('utf-8', errors='replace'),
+}
+
+# Types returned as they are
+_PLAIN_TYPES = frozenset({type(None), int, float, str, bool, datetime, date})
+
+# Column types whose values come back as int, float, date, datetime or None and
+# need no conversion
+_JSON_SAFE_FIELD_TYPES = frozenset({
+    FieldType.TINY, FieldType.SHORT, FieldType.LONG, FieldType.LONGLONG, FieldType.INT24,
+    FieldType.FLOAT, FieldType.DOUBLE, FieldType.YEAR, FieldType.NULL,
+    FieldType.DATE, FieldType.NEWDATE, FieldType.DATETIME, FieldType.TIMESTAMP,
+})
+_DECIMAL_FIELD_TYPES = frozenset({FieldType.DECIMAL, FieldType.NEWDECIMAL})
+
+# Text column types, decoded to str unless the column is binary or a SET. Most
+# metadata results (SHOW, DESCRIBE) consist of these and integers only, so they
+# need no conversion pass at all.
+_TEXT_FIELD_TYPES = frozenset({
+    FieldType.VARCHAR, FieldType.VAR_STRING, FieldType.STRING, FieldType.ENUM,
+    FieldType.TINY_BLOB, FieldType.MEDIUM_BLOB, FieldType.LONG_BLOB, FieldType.BLOB,
+})
+_BINARY_CHARSET = 63
+
+
+@lru_cache(maxsize=None)
+def _subclass_converter(value_type: type) -> Optional[Callable[[Any], Any]]:
+    """Converter for a subclass of a converted type (resolved once per type)."""
+    for base, converter in _CONVERTERS.items():
+        if issubclass(value_type, base):
+            return converter
+    return None
+
+
 class MySQLQueryExecutor:
     """
     Executes SQL queries on MySQL database and formats results.
+    
+    Connections are reused through one connection pool per set of credentials.
+    Pools are kept in LRU order and the least recently used one is closed when
+    more than `max_pools` databases are in use. At most `pool_size` connections
+    are open per database: when all are in use, callers wait up to
+    `pool_timeout` seconds for one to be returned.
     """
     
-    def __init__(self):
-        pass
+    # Bounds of the wait between attempts to take a connection from an exhausted pool
+    POOL_RETRY_MIN_DELAY = 0.01
+    POOL_RETRY_MAX_DELAY = 0.1
     
-    def _connect(self, credentials: MySQLCredentials):
-        """Create MySQL connection."""
+    def __init__(self, pool_size: int = 8, max_pools: int = 16, pool_timeout: float = 10.0):
+        self.pool_size = pool_size
+        self.max_pools = max_pools
+        self.pool_timeout = pool_timeout
+        
+        self._pools: "OrderedDict[Tuple, MySQLConnectionPool]" = OrderedDict()
+        self._pools_lock = threading.Lock()
+        self._pool_counter = 0
+    
+    def _connection_config(self, credentials: MySQLCredentials) -> Dict[str, Any]:
+        """Build MySQL connection arguments from credentials."""
+        return {
+            "host": credentials.host,
+            "port": credentials.port,
+            "user": credentials.user,
+            "password": credentials.password,
+            "database": credentials.database,
+            "charset": 'utf8mb4',
+            "use_unicode": True,
+            "autocommit": True,  # Enable autocommit for read queries
+            "buffered": True,    # Use buffered connection to avoid unread results
+            "consume_results": True,  # Unbuffered cursors discard unread rows on close
+            # Sent on connect and again after each pool session reset, so
+            # MySQL can skip undo and locking work for every query
+            "init_command": "SET SESSION TRANSACTION READ ONLY"
+        }
+    
+    def _get_pool(self, credentials: MySQLCredentials) -> MySQLConnectionPool:
+        """Get (or create) the connection pool for the given credentials."""
+        key = (credentials.host, credentials.port, credentials.user, credentials.password, credentials.database)
+        
+        with self._pools_lock:
+            pool = self._pools.get(key)
+            if pool is not None:
+                self._pools.move_to_end(key)
+                return pool
+            self._pool_counter += 1
+            pool_name = f"genbi_executor_{self._pool_counter}"
+        
+        # Creating a pool opens its connections, so don't hold up the other databases meanwhile
+        pool = MySQLConnectionPool(
+            pool_name=pool_name,
+            pool_size=self.pool_size,
+            # Reset sessions on return, so no session state (user variables,
+            # sql_mode, charset...) carries over between requests
+            pool_reset_session=True,
+            **self._connection_config(credentials)
+        )
+        
+        evicted = None
+        with self._pools_lock:
+            existing = self._pools.get(key)
+            if existing is None:
+                self._pools[key] = pool
+                # Evict the least recently used pool
+                if len(self._pools) > self.max_pools:
+                    _, evicted = self._pools.popitem(last=False)
+            else:
+                # Another thread created a pool for these credentials first
+                self._pools.move_to_end(key)
+                evicted, pool = pool, existing
+        
+        if existing is None:
+            logger.info("Created MySQL connection pool for database: %s", credentials.database)
+        if evicted is not None:
+            self._close_pool(evicted)
+            logger.info("Closed MySQL connection pool: %s", evicted.pool_name)
+        
+        return pool
+    
+    def _get_pooled_connection(self, credentials: MySQLCredentials):
+        """Take a connection from the credentials' pool, retrying with backoff while it is exhausted."""
         try:
-            connection = mysql.connector.connect(
-                host=credentials.host,
-                port=credentials.port,
-                user=credentials.user,
-                password=credentials.password,
-                database=credentials.database,
-                charset='utf8mb4',
-                use_unicode=True,
-                autocommit=True,  # Enable autocommit for read queries
-                buffered=True     # Use buffered connection to avoid unread results
-            )
+            return self._get_pool(credentials).get_connection()
+        except PoolError:
+            pass
+        
+        # mysql-connector's pool doesn't block, so poll until a connection is returned
+        logger.warning(
+            "All %s connections to %s are in use, waiting up to %ss for one",
+            self.pool_size, credentials.database, self.pool_timeout
+        )
+        deadline = time.monotonic() + self.pool_timeout
+        delay = self.POOL_RETRY_MIN_DELAY
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PoolError(
+                    f"All {self.pool_size} connections to {credentials.database} are in use "
+                    f"(none returned within {self.pool_timeout}s); raise MYSQL_POOL_SIZE or retry later"
+                )
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, self.POOL_RETRY_MAX_DELAY)
+            try:
+                # Looked up again, in case the pool was evicted meanwhile
+                return self._get_pool(credentials).get_connection()
+            except PoolError:
+                continue
+    
+    @staticmethod
+    def _close_pool(pool: MySQLConnectionPool):
+        """Close the idle connections of a pool."""
+        # mysql-connector has no public way to close a pool, _remove_connections
+        # is what it offers for this (it disconnects every queued connection)
+        pool._remove_connections()
+    
+    def close(self):
+        """Close all pooled connections."""
+        with self._pools_lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            self._close_pool(pool)
+        logger.info("Closed all MySQL connection pools")
+    
+    def connect(self, credentials: MySQLCredentials):
+        """
+        Get a pooled MySQL connection, waiting up to pool_timeout for one if all are in use.
+        
+        Closing the connection returns it to its pool. Blocks, so call it from a
+        worker thread in async code.
+        
+        Raises:
+            PoolError: If no connection was returned to the pool in time
+        """
+        try:
+            connection = self._get_pooled_connection(credentials)
             
             if connection.is_connected():
                 return connection
@@ -46,23 +216,36 @@ class MySQLQueryExecutor:
                 raise Error("Failed to connect to MySQL")
                 
         except Error as e:
-            logger.error(f"Error connecting to MySQL: {e}")
+            logger.error("Error connecting to MySQL: %s", e)
             raise
     
-    def _convert_value(self, value: Any) -> Any:
+    @staticmethod
+    def _convert_value(value: Any) -> Any:
         """Convert MySQL types to JSON-serializable types."""
-        if value is None:
-            return None
-        elif isinstance(value, (datetime, date)):
-            return value.isoformat()
-        elif isinstance(value, Decimal):
-            return float(value)
-        elif isinstance(value, bytes):
-            return value.decode('utf-8', errors='replace')
-        else:
+        value_type = type(value)
+        if value_type in _PLAIN_TYPES:
             return value
+        converter = _CONVERTERS.get(value_type) or _subclass_converter(value_type)
+        return converter(value) if converter else value
+    
+    @classmethod
+    def _column_converter(cls, description: Tuple) -> Optional[Callable[[Any], Any]]:
+        """Converter for the values of a result column, or None if they are already JSON-safe."""
+        field_type = description[1]
+        if field_type in _JSON_SAFE_FIELD_TYPES:
+            return None
+        if field_type in _DECIMAL_FIELD_TYPES:
+            return float
+        if (
+            field_type in _TEXT_FIELD_TYPES
+            and len(description) > 8
+            and description[8] != _BINARY_CHARSET
+            and not description[7] & FieldFlag.SET
+        ):
+            return None
+        return cls._convert_value
     
-    def execute_query(
+    async def execute_query(
         self, 
         credentials: MySQLCredentials, 
         sql: str, 
@@ -71,6 +254,8 @@ class MySQLQueryExecutor:
         """
         Execute SQL query and return results.
         
+        The blocking MySQL work runs in a worker thread so the event loop stays free.
+        
         Args:
             credentials: MySQL connection credentials
             sql: SQL query to execute
@@ -79,85 +264,159 @@ class MySQLQueryExecutor:
         Returns:
             QueryExecutionResult with data or error
         """
+        return await asyncio.to_thread(self._execute_query, credentials, sql, max_rows)
+    
+    async def execute_queries(
+        self,
+        credentials: MySQLCredentials,
+        sqls: List[str],
+        max_rows: int = 100
+    ) -> List[QueryExecutionResult]:
+        """
+        Execute several SQL queries on one connection and return their results.
+        
+        Bursts of small queries (schema, samples, counts) then pay for one
+        connection checkout instead of one per query.
+        
+        Args:
+            credentials: MySQL connection credentials
+            sqls: SQL queries to execute, in order
+            max_rows: Maximum number of rows to return per query
+            
+        Returns:
+            One QueryExecutionResult per query, in the same order
+        """
+        return await asyncio.to_thread(self._execute_queries, credentials, sqls, max_rows)
+    
+    def _execute_query(
+        self, 
+        credentials: MySQLCredentials, 
+        sql: str, 
+        max_rows: int = 100
+    ) -> QueryExecutionResult:
+        """
+        Execute SQL query synchronously and return results.
+        
+        Args:
+            credentials: MySQL connection credentials
+            sql: SQL query to execute
+            max_rows: Maximum number of rows to return
+            
+        Returns:
+            QueryExecutionResult with data or error
+        """
+        return self._execute_queries(credentials, [sql], max_rows)[0]
+    
+    def _execute_queries(
+        self,
+        credentials: MySQLCredentials,
+        sqls: List[str],
+        max_rows: int = 100
+    ) -> List[QueryExecutionResult]:
+        """Execute SQL queries synchronously on one connection (see execute_queries)."""
+        # Validate SQL using SQLValidator; invalid queries never reach the server
+        results: List[Optional[QueryExecutionResult]] = []
+        for sql in sqls:
+            is_valid, error_message = SQLValidator.validate(sql)
+            results.append(None if is_valid else QueryExecutionResult(
+                success=False,
+                error=f"Query validation failed: {error_message}"
+            ))
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+        
         connection = None
-        cursor = None
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
         
         try:
-            # Validate SQL using SQLValidator
-            is_valid, error_message = SQLValidator.validate(sql)
-            if not is_valid:
-                return QueryExecutionResult(
-                    success=False,
-                    error=f"Query validation failed: {error_message}"
-                )
-            
             # Connect to database
-            connection = self._connect(credentials)
-            cursor = connection.cursor(dictionary=True, buffered=True)  # Use buffered cursor
+            connection = self.connect(credentials)
+            for i in pending:
+                results[i] = self._run_query(connection, sqls[i], max_rows)
+        except Exception as e:
+            failed = self._error_result(e, start_ns)
+            for i in pending:
+                if results[i] is None:
+                    results[i] = failed
+        finally:
+            if connection and connection.is_connected():
+                connection.close()  # Returns pooled connections to their pool
+        
+        return results
+    
+    def _run_query(self, connection, sql: str, max_rows: int) -> QueryExecutionResult:
+        """Run one validated query on an open connection."""
+        cursor = None
+        start_ns = time.perf_counter_ns()
+        
+        try:
+            # Unbuffered, so only the rows returned are read into memory
+            cursor = connection.cursor(buffered=False)
             
-            # Execute query
-            cursor.execute(sql)
+            # Execute query, letting the server stop after max_rows. One extra
+            # row is requested to tell whether the result was truncated.
+            cursor.execute(_with_row_limit(sql, max_rows + 1))
             
             # Fetch results
-            rows = cursor.fetchmany(max_rows)
+            rows = list(itertools.islice(cursor, max_rows + 1))
+            truncated = len(rows) > max_rows
+            del rows[max_rows:]
             
-            # Consume any remaining results to prevent "Unread result found" error
-            # This is important when fetchmany doesn't fetch all results
-            try:
-                while cursor.nextset():
-                    pass  # Move to next result set if any
-                # Also consume any remaining rows in current set
-                while cursor.fetchone():
-                    pass  # Consume remaining rows
-            except Exception:
-                pass  # No more rows or result sets
+            # Get column names, and how to convert each column once
+            columns, converted = _result_layout(tuple(cursor.description or ()))
             
-            # Get column names
-            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+            # Done with the cursor: closing it discards any rows left unread
+            # (consume_results), no need to drain them here
+            cursor.close()
+            cursor = None
             
-            # Convert rows to JSON-serializable format
-            converted_rows = []
-            for row in rows:
-                converted_row = {
-                    key: self._convert_value(value)
-                    for key, value in row.items()
-                }
-                converted_rows.append(converted_row)
+            # Convert rows to JSON-serializable format. Rows stay tuples until the
+            # columns that need it are converted, then become dicts in one step.
+            if converted:
+                rows = [list(row) for row in rows]
+                for row in rows:
+                    for i, convert in converted:
+                        if row[i] is not None:
+                            row[i] = convert(row[i])
+            converted_rows = [dict(zip(columns, row)) for row in rows]
             
-            execution_time = (time.time() - start_time) * 1000  # Convert to ms
+            execution_time = (time.perf_counter_ns() - start_ns) / 1e6  # Convert to ms
             
-            logger.info(f"Query executed successfully: {len(converted_rows)} rows in {execution_time:.2f}ms")
+            logger.info("Query executed successfully: %s rows in %.2fms", len(converted_rows), execution_time)
             
             return QueryExecutionResult(
                 success=True,
                 rows=converted_rows,
                 row_count=len(converted_rows),
-                columns=columns,
-                execution_time_ms=round(execution_time, 2)
+                columns=list(columns),
+                execution_time_ms=round(execution_time, 2),
+                truncated=truncated
             )
             
-        except Error as e:
-            execution_time = (time.time() - start_time) * 1000
-            logger.error(f"Error executing query: {e}")
-            return QueryExecutionResult(
-                success=False,
-                error=str(e),
-                execution_time_ms=round(execution_time, 2)
-            )
         except Exception as e:
-            execution_time = (time.time() - start_time) * 1000
-            logger.error(f"Unexpected error: {e}")
-            return QueryExecutionResult(
-                success=False,
-                error=f"Unexpected error: {str(e)}",
-                execution_time_ms=round(execution_time, 2)
-            )
+            return self._error_result(e, start_ns)
         finally:
-            if connection and connection.is_connected():
-                if cursor:
+            if cursor:
+                try:
                     cursor.close()
-                connection.close()
+                except Error as e:
+                    logger.debug("Error closing cursor: %s", e)
+    
+    def _error_result(self, error: Exception, start_ns: int) -> QueryExecutionResult:
+        """Failed QueryExecutionResult for an exception raised while executing."""
+        execution_time = (time.perf_counter_ns() - start_ns) / 1e6
+        if isinstance(error, Error):
+            logger.error("Error executing query: %s", error)
+            message = str(error)
+        else:
+            logger.error("Unexpected error: %s", error)
+            message = f"Unexpected error: {str(error)}"
+        return QueryExecutionResult(
+            success=False,
+            error=message,
+            execution_time_ms=round(execution_time, 2)
+        )
     
     def format_table(self, result: QueryExecutionResult, max_width: int = 100) -> str:
         """
@@ -170,48 +429,128 @@ class MySQLQueryExecutor:
         Returns:
             Formatted ASCII table string
         """
-        if not result.success or not result.rows:
+        columns = tuple(result.columns or ())
+        if not result.success or not result.rows or not columns:
             return "No results"
         
-        columns = result.columns or []
-        rows = result.rows or []
-        
-        # Calculate column widths
-        col_widths = {}
-        for col in columns:
-            col_widths[col] = min(max(len(str(col)), 10), max_width)
-        
-        for row in rows:
-            for col in columns:
-                value_len = len(str(row.get(col, '')))
-                col_widths[col] = min(max(col_widths[col], value_len), max_width)
-        
-        # Build table
-        lines = []
-        
-        # Header separator
-        separator = "+" + "+".join(["-" * (col_widths[col] + 2) for col in columns]) + "+"
-        lines.append(separator)
-        
-        # Header
-        header = "|" + "|".join([f" {col:<{col_widths[col]}} " for col in columns]) + "|"
-        lines.append(header)
-        lines.append(separator)
-        
-        # Rows
-        for row in rows:
-            values = []
-            for col in columns:
-                value = str(row.get(col, ''))
-                if len(value) > max_width:
-                    value = value[:max_width-3] + "..."
-                values.append(f" {value:<{col_widths[col]}} ")
-            
-            row_line = "|" + "|".join(values) + "|"
-            lines.append(row_line)
+        rows = tuple(tuple(_cell_text(row.get(col, '')) for col in columns) for row in result.rows)
         
-        # Footer
-        lines.append(separator)
-        lines.append(f"Total rows: {result.row_count}")
-        
-        return "\n".join(lines)
+        return _render_table(columns, rows, result.row_count, max_width)
+
+
+# The same queries come back often (dashboard refreshes), so the layout of each
+# result shape is worked out once. Keyed by the result metadata rather than the
+# SQL, so a changed table schema can't serve stale column names.
+@lru_cache(maxsize=1024)
+def _result_layout(description: Tuple[Tuple, ...]) -> Tuple[Tuple[str, ...], Tuple[Tuple[int, Callable[[Any], Any]], ...]]:
+    """Column names of a result, and (index, converter) for each column that needs converting."""
+    converters = (MySQLQueryExecutor._column_converter(desc) for desc in description)
+    return (
+        tuple(desc[0] for desc in description),
+        tuple((i, convert) for i, convert in enumerate(converters) if convert is not None),
+    )
+
+
+@lru_cache(maxsize=1024)
+def _with_row_limit(sql: str, max_rows: int) -> str:
+    """Cap a SELECT at max_rows: append a LIMIT, or lower a larger literal LIMIT."""
+    try:
+        tree = sqlglot.parse_one(sql, read="mysql")
+    except SqlglotError:
+        return sql
+    
+    if not isinstance(tree, (exp.Select, exp.Union)):
+        return sql
+    if any(tree.args.get(arg) for arg in ("locks", "into")):
+        return sql
+    
+    limit = tree.args.get("limit")
+    if limit is None:
+        # On its own line, after any trailing line comment
+        return f"{sql.rstrip().rstrip(';').rstrip()}\nLIMIT {max_rows}"
+    
+    # Rows past max_rows would only be discarded, so the server needn't produce them
+    value = limit.expression if isinstance(limit, exp.Limit) else None
+    if isinstance(value, exp.Literal) and value.is_int and int(value.this) > max_rows:
+        return _replace_row_count(sql, int(value.this), max_rows)
+    return sql
+
+
+def _replace_row_count(sql: str, row_count: int, max_rows: int) -> str:
+    """
+    Replace the row count of the query's top-level LIMIT in the SQL text.
+    
+    Only that number changes, so the query that runs is still the one the
+    validator checked. Returns the SQL unchanged if the LIMIT can't be located.
+    """
+    try:
+        tokens = sqlglot.tokenize(sql, read="mysql")
+    except SqlglotError:
+        return sql
+    
+    # The last LIMIT outside parentheses is the query's own
+    depth = 0
+    limit_at = None
+    for i, token in enumerate(tokens):
+        if token.token_type == TokenType.L_PAREN:
+            depth += 1
+        elif token.token_type == TokenType.R_PAREN:
+            depth -= 1
+        elif token.token_type == TokenType.LIMIT and depth == 0:
+            limit_at = i
+    if limit_at is None:
+        return sql
+    
+    # LIMIT count, or LIMIT offset, count
+    numbers = tokens[limit_at + 1:limit_at + 4]
+    if len(numbers) == 3 and numbers[1].token_type == TokenType.COMMA:
+        count = numbers[2]
+    else:
+        count = numbers[0] if numbers else None
+    if count is None or count.token_type != TokenType.NUMBER or count.text != str(row_count):
+        return sql
+    return f"{sql[:count.start]}{max_rows}{sql[count.end + 1:]}"
+
+
+def _cell_text(value: Any) -> str:
+    """Text of a table cell; dates and datetimes in ISO 8601, as in the JSON results."""
+    return value.isoformat() if isinstance(value, date) else str(value)
+
+
+def _render_table(columns: Tuple[str, ...], rows: Tuple[Tuple[str, ...], ...], row_count: int, max_width: int) -> str:
+    """Render stringified rows as an ASCII table."""
+    # Calculate column widths, one pass over each column
+    cells_by_column = list(zip(*rows)) if rows else [()] * len(columns)
+    col_widths = tuple(
+        min(max(len(str(col)), 10, *map(len, cells)), max_width)
+        for col, cells in zip(columns, cells_by_column)
+    )
+    
+    # Build table in one buffer
+    buf = io.StringIO()
+    write = buf.write
+    separator = "+" + "+".join(["-" * (width + 2) for width in col_widths]) + "+\n"
+    
+    # Header
+    write(separator)
+    for col, width in zip(columns, col_widths):
+        write("| ")
+        write(str(col).ljust(width))
+        write(" ")
+    write("|\n")
+    write(separator)
+    
+    # Rows
+    truncated_width = max_width - 3
+    for row in rows:
+        for value, width in zip(row, col_widths):
+            write("| ")
+            write((value[:truncated_width] + "..." if len(value) > max_width else value).ljust(width))
+            write(" ")
+        write("|\n")
+    
+    # Footer
+    write(separator)
+    write(f"Total rows: {row_count}")
+    
+    return buf.getvalue()
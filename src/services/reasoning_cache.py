@@ -0,0 +1,82 @@
+"""
+Reasoning cache for generated query plans.
+Stores only the reasoning step keyed on (database_id, question embedding), so a
+paraphrased question can skip planning even when its SQL is generated anew.
+"""
+
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ReasoningCache:
+    """
+    Cache query plans by question similarity.
+
+    A paraphrase usually needs the same plan even when it isn't similar enough
+    to reuse the final SQL, so plans can be matched at a lower similarity than
+    the semantic SQL cache. The SQL is still generated for the actual question.
+    Entries live in memory for `ttl` seconds. Embeddings must be normalized
+    (see SemanticCache.embed).
+    """
+
+    def __init__(self, threshold: float = 0.9, ttl: float = 3600.0, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        # database_id -> (normalized embedding matrix, plans, creation times)
+        self._entries: Dict[str, Tuple[np.ndarray, List[str], List[float]]] = {}
+
+    def get(self, database_id: str, embedding: np.ndarray) -> Optional[str]:
+        """Return the plan of the most similar cached question, if above threshold and not expired."""
+        hit = None
+        if database_id in self._entries:
+            matrix, plans, created = self._entries[database_id]
+            scores = matrix @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold and time.time() - created[best] <= self.ttl:
+                hit = plans[best]
+                logger.info("Reasoning cache hit for %s (similarity %.3f)", database_id, scores[best])
+
+        if hit is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return hit
+
+    def put(self, database_id: str, embedding: np.ndarray, reasoning: str):
+        """Store a plan, dropping expired entries and the oldest ones beyond max_entries."""
+        now = time.time()
+        if database_id in self._entries:
+            matrix, plans, created = self._entries[database_id]
+            keep = [i for i, t in enumerate(created) if now - t <= self.ttl]
+            keep = keep[max(0, len(keep) - self.max_entries + 1):]
+            matrix = np.vstack([matrix[keep], embedding]) if keep else embedding.reshape(1, -1)
+            plans = [plans[i] for i in keep] + [reasoning]
+            created = [created[i] for i in keep] + [now]
+        else:
+            matrix, plans, created = embedding.reshape(1, -1), [reasoning], [now]
+
+        self._entries[database_id] = (matrix, plans, created)
+
+    def invalidate(self, database_id: str):
+        """Drop all cached plans for a database (e.g. after re-indexing)."""
+        self._entries.pop(database_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": sum(len(plans) for _, plans, _ in self._entries.values()),
+            "threshold": self.threshold,
+            "ttl": self.ttl
+        }
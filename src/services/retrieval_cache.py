@@ -0,0 +1,142 @@
+"""
+Persistent cache of schema retrievals.
+Stores the schema documents retrieved for (database_id, index version, question,
+k) in SQLite, so repeated questions skip the embedding request and vector
+search, also after a restart.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalCache:
+    """
+    Cache retrieved schema documents by exact question.
+
+    Entries are keyed on the version of the index they were retrieved from, so
+    an index rewritten by any process (re-indexing, knowledge base additions)
+    never serves entries of its previous contents. The indexer also drops a
+    database's entries when it changes its index itself.
+
+    At most `max_entries` entries are kept on disk, the oldest written are
+    dropped first. The most recently used MEMORY_ENTRIES are also kept in memory.
+    Methods block on SQLite, call them from a worker thread in async code.
+    """
+
+    MEMORY_ENTRIES = 1024
+
+    def __init__(self, db_path: str = "./data/retrieval_cache.db", max_entries: int = 10000):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+
+        # (database_id, retrieval key) -> documents, least recently used first
+        self._entries: "OrderedDict[Tuple[str, bytes], List[Document]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._init_db()
+
+    def _init_db(self):
+        """Initialize SQLite database with retrieval cache table."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        # Entries of the earlier layout weren't keyed on the index version
+        cursor.execute("DROP TABLE IF EXISTS retrieval_cache")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS retrievals (
+                key BLOB PRIMARY KEY,
+                database_id TEXT NOT NULL,
+                documents TEXT NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_retrievals_db ON retrievals(database_id)")
+
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def _key(database_id: str, version: str, question: str, k: int) -> bytes:
+        """Key of a retrieval."""
+        return hashlib.blake2b(f"{database_id}\0{version}\0{k}\0{question}".encode(), digest_size=16).digest()
+
+    def _remember(self, entry: Tuple[str, bytes], docs: List[Document]):
+        """Keep an entry in memory, dropping the least recently used beyond MEMORY_ENTRIES."""
+        with self._lock:
+            self._entries[entry] = docs
+            self._entries.move_to_end(entry)
+            while len(self._entries) > self.MEMORY_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def get(self, database_id: str, version: str, question: str, k: int) -> Optional[List[Document]]:
+        """Return the documents retrieved earlier for the same question and index version, if any."""
+        entry = (database_id, self._key(database_id, version, question, k))
+        with self._lock:
+            docs = self._entries.get(entry)
+            if docs is not None:
+                self._entries.move_to_end(entry)
+                return list(docs)
+
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute("SELECT documents FROM retrievals WHERE key = ?", (entry[1],))
+            row = cursor.fetchone()
+            conn.close()
+        except Exception as e:
+            logger.error("Error reading retrieval cache: %s", e)
+            return None
+
+        if not row:
+            return None
+        docs = [Document(page_content=doc["page_content"], metadata=doc["metadata"]) for doc in json.loads(row[0])]
+        self._remember(entry, docs)
+        return list(docs)
+
+    def put(self, database_id: str, version: str, question: str, k: int, docs: List[Document]):
+        """Store the documents retrieved for a question, dropping the oldest entries beyond max_entries."""
+        entry = (database_id, self._key(database_id, version, question, k))
+        try:
+            serialized = json.dumps([{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs])
+
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT OR REPLACE INTO retrievals (key, database_id, documents) VALUES (?, ?, ?)",
+                (entry[1], database_id, serialized)
+            )
+            # Replaced rows get a new rowid, so the lowest rowids are the oldest writes
+            cursor.execute(
+                "DELETE FROM retrievals WHERE rowid <= (SELECT MAX(rowid) FROM retrievals) - ?",
+                (self.max_entries,)
+            )
+            conn.commit()
+            conn.close()
+
+            self._remember(entry, list(docs))
+        except Exception as e:
+            logger.error("Error writing retrieval cache: %s", e)
+
+    def invalidate(self, database_id: str):
+        """Drop all cached retrievals for a database (its index changed)."""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM retrievals WHERE database_id = ?", (database_id,))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error("Error invalidating retrieval cache: %s", e)
+        with self._lock:
+            for entry in [entry for entry in self._entries if entry[0] == database_id]:
+                del self._entries[entry]
@@ -0,0 +1,377 @@
+"""
+Semantic cache for generated SQL.
+Stores SQL generation results keyed on (database_id, question embedding) so that
+paraphrased questions against the same database can skip the LLM pipeline.
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from models import SQLResult
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """
+    Cache SQL generation results by question similarity.
+
+    Embeddings are kept in memory per database (normalized, so cosine similarity
+    is a dot product) and persisted in SQLite together with the cached result.
+    Each database has its own similarity threshold, starting at `threshold`.
+    It is tuned on near misses: questions at least `min_threshold` similar to a
+    cached one that missed anyway. When the SQL generated for a near miss
+    matches the cached SQL, a lower threshold would have served the right
+    result. While the database's hit rate is below `target_hit_rate`, the
+    threshold is lowered by `adjust_step`. When the SQL differs, a hit would
+    have been a false positive. The threshold then goes back to `threshold`
+    and stays there for that database. Repeats of a cached question
+    (ignoring case, whitespace and trailing punctuation) are found by an exact
+    lookup that needs no embedding. Entries older than `ttl` seconds are ignored,
+    and beyond `max_entries` per database the oldest are dropped.
+
+    Lookups, puts and invalidation may block on SQLite, so async code calls
+    them from a worker thread; embed() runs on the event loop.
+    """
+
+    # Max questions sent in one embedding request
+    EMBED_BATCH_SIZE = 64
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        db_path: str = "./data/semantic_cache.db",
+        threshold: float = 0.95,
+        min_threshold: float = 0.85,
+        target_hit_rate: float = 0.8,
+        adjust_step: float = 0.01,
+        ttl: Optional[float] = None,
+        max_entries: int = 1000
+    ):
+        self.embeddings = embeddings
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.max_threshold = threshold
+        self.min_threshold = min_threshold
+        self.target_hit_rate = target_hit_rate
+        self.adjust_step = adjust_step
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.lookups = 0
+        self.hits = 0
+
+        # database_id -> similarity threshold, (semantic lookups, hits)
+        self._thresholds: Dict[str, float] = {}
+        self._counts: Dict[str, Tuple[int, int]] = {}
+        # Databases where a lower threshold would have served wrong SQL
+        self._false_positives: Set[str] = set()
+
+        # database_id -> (normalized embedding matrix, cached results)
+        self._vectors: Dict[str, Tuple[np.ndarray, List[SQLResult]]] = {}
+        # database_id -> creation time (epoch seconds) of each cached result
+        self._created: Dict[str, List[float]] = {}
+        # database_id -> SQLite row id of each cached result
+        self._ids: Dict[str, List[int]] = {}
+        # database_id -> question key -> index of its cached result
+        self._exact: Dict[str, Dict[bytes, int]] = {}
+
+        # Guards the in-memory maps and counters; the SQLite work runs in worker threads
+        self._lock = threading.Lock()
+
+        # Questions waiting to be embedded, and the task embedding them
+        self._embed_pending: List[Tuple[str, asyncio.Future]] = []
+        self._embed_flusher: Optional[asyncio.Task] = None
+
+        self._init_db()
+
+    def _init_db(self):
+        """Initialize SQLite database with semantic cache table."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS semantic_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                database_id TEXT NOT NULL,
+                question TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                result TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_semantic_cache_db ON semantic_cache(database_id)")
+
+        conn.commit()
+        conn.close()
+        logger.info("Semantic cache initialized at %s", self.db_path)
+
+    @staticmethod
+    def _normalize(vectors: List[List[float]]) -> np.ndarray:
+        """Convert a batch of embeddings to unit-length float32 rows."""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+        return matrix
+
+    @staticmethod
+    def _question_key(question: str) -> bytes:
+        """Key for exact lookups, ignoring case, whitespace and trailing punctuation."""
+        normalized = " ".join(question.lower().split()).rstrip("?.! ")
+        return hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+
+    def _expired(self, database_id: str, index: int) -> bool:
+        """Check whether a cached result is older than the TTL."""
+        return self.ttl is not None and time.time() - self._created[database_id][index] > self.ttl
+
+    def _load(self, database_id: str) -> Tuple[np.ndarray, List[SQLResult]]:
+        """Load cached entries for a database from SQLite into memory."""
+        if database_id in self._vectors:
+            return self._vectors[database_id]
+
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT embedding, result, question, CAST(strftime('%s', created_at) AS REAL), id
+            FROM semantic_cache
+            WHERE database_id = ?
+            ORDER BY id
+        """, (database_id,))
+        rows = cursor.fetchall()
+        if len(rows) > self.max_entries:
+            cursor.executemany("DELETE FROM semantic_cache WHERE id = ?", [(row[4],) for row in rows[:-self.max_entries]])
+            conn.commit()
+            rows = rows[-self.max_entries:]
+        conn.close()
+
+        if rows:
+            matrix = np.vstack([np.frombuffer(row[0], dtype=np.float32) for row in rows])
+            results = [SQLResult.model_validate_json(row[1]) for row in rows]
+        else:
+            matrix = np.empty((0, 0), dtype=np.float32)
+            results = []
+
+        self._vectors[database_id] = (matrix, results)
+        self._created[database_id] = [row[3] for row in rows]
+        self._ids[database_id] = [row[4] for row in rows]
+        self._exact[database_id] = {self._question_key(row[2]): i for i, row in enumerate(rows)}
+        return self._vectors[database_id]
+
+    def _threshold(self, database_id: str) -> float:
+        """Current similarity threshold of a database."""
+        return self._thresholds.get(database_id, self.max_threshold)
+
+    @staticmethod
+    def _same_sql(a: Optional[str], b: Optional[str]) -> bool:
+        """Whether two generated queries are the same, ignoring whitespace and a trailing semicolon."""
+        return " ".join((a or "").split()).rstrip("; ") == " ".join((b or "").split()).rstrip("; ")
+
+    def _tune_threshold(self, database_id: str, similarity: float, same_sql: bool):
+        """Adjust a database's threshold from a new result whose closest cached question is `similarity` similar."""
+        if not same_sql:
+            if database_id not in self._false_positives:
+                logger.info(
+                    "Semantic cache near miss for %s (similarity %.3f) had different SQL, keeping threshold at %.2f",
+                    database_id, similarity, self.max_threshold
+                )
+            self._false_positives.add(database_id)
+            self._thresholds[database_id] = self.max_threshold
+            return
+
+        lookups, hits = self._counts.get(database_id, (0, 0))
+        if similarity >= self._threshold(database_id) or database_id in self._false_positives:
+            return
+        if not lookups or hits / lookups >= self.target_hit_rate:
+            return
+        self._thresholds[database_id] = max(self.min_threshold, self._threshold(database_id) - self.adjust_step)
+
+    async def embed(self, question: str) -> np.ndarray:
+        """
+        Compute the normalized embedding for a question.
+
+        Questions from concurrent requests are embedded together: those queued
+        in the same event loop iteration, or while a previous embedding request
+        is in flight, are sent as one request.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._embed_pending.append((question, future))
+        if self._embed_flusher is None:
+            self._embed_flusher = asyncio.create_task(self._flush_embeddings())
+        return await future
+
+    async def _flush_embeddings(self):
+        """Embed the queued questions in batches until none are left."""
+        try:
+            while self._embed_pending:
+                batch = self._embed_pending[:self.EMBED_BATCH_SIZE]
+                self._embed_pending = self._embed_pending[self.EMBED_BATCH_SIZE:]
+
+                try:
+                    vectors = await self.embeddings.aembed_documents([question for question, _ in batch])
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+
+                for (_, future), vector in zip(batch, self._normalize(vectors)):
+                    if not future.done():
+                        future.set_result(vector)
+        finally:
+            self._embed_flusher = None
+            for _, future in self._embed_pending:
+                future.cancel()
+            self._embed_pending = []
+
+    def get_exact(self, database_id: str, question: str) -> Optional[SQLResult]:
+        """Return the cached result for a repeat of a cached question, without embedding it."""
+        with self._lock:
+            try:
+                _, results = self._load(database_id)
+                index = self._exact[database_id].get(self._question_key(question))
+                if index is None or self._expired(database_id, index):
+                    return None
+
+                logger.info("Semantic cache exact hit for %s", database_id)
+                return results[index].model_copy(deep=True)
+
+            except Exception as e:
+                logger.error("Error reading semantic cache: %s", e)
+                return None
+
+    def get(self, database_id: str, embedding: np.ndarray) -> Optional[SQLResult]:
+        """Return the cached result most similar to the embedding, if above the database's threshold."""
+        with self._lock:
+            try:
+                matrix, results = self._load(database_id)
+                if not results:
+                    return None
+
+                self.lookups += 1
+                lookups, hits = self._counts.get(database_id, (0, 0))
+
+                hit = None
+                scores = matrix @ embedding
+                best = int(np.argmax(scores))
+                if scores[best] >= self._threshold(database_id) and not self._expired(database_id, best):
+                    self.hits += 1
+                    hits += 1
+                    hit = results[best]
+                    logger.info("Semantic cache hit for %s (similarity %.3f)", database_id, scores[best])
+
+                self._counts[database_id] = (lookups + 1, hits)
+                return hit.model_copy(deep=True) if hit else None
+
+            except Exception as e:
+                logger.error("Error reading semantic cache: %s", e)
+                return None
+
+    def put(self, database_id: str, question: str, embedding: np.ndarray, result: SQLResult) -> bool:
+        """
+        Store a successful result for a question embedding.
+
+        Replaces any cached result for the same question, and drops the oldest
+        entries beyond max_entries.
+        """
+        with self._lock:
+            try:
+                matrix, results = self._load(database_id)
+                key = self._question_key(question)
+                index = self._exact[database_id].get(key)
+
+                # The closest other cached question shows whether a hit on it would have served this result
+                if results:
+                    scores = matrix @ embedding
+                    if index is not None:
+                        scores[index] = -1.0
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.min_threshold and not self._expired(database_id, best):
+                        self._tune_threshold(database_id, float(scores[best]), self._same_sql(results[best].sql, result.sql))
+
+                # Concurrent misses on the same question keep a single entry, the latest;
+                # beyond max_entries the oldest are dropped
+                ids = self._ids[database_id]
+                keep = [i for i in range(len(results)) if i != index]
+                excess = max(0, len(keep) - self.max_entries + 1)
+                drop = keep[:excess] + ([] if index is None else [index])
+                keep = keep[excess:]
+
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+
+                cursor.executemany("DELETE FROM semantic_cache WHERE id = ?", [(ids[i],) for i in drop])
+                cursor.execute("""
+                    INSERT INTO semantic_cache (database_id, question, embedding, result)
+                    VALUES (?, ?, ?, ?)
+                """, (database_id, question, embedding.astype(np.float32).tobytes(), result.model_dump_json()))
+                row_id = cursor.lastrowid
+
+                conn.commit()
+                conn.close()
+
+                exact = self._exact[database_id]
+                created = self._created[database_id]
+                if drop:
+                    position = {old: new for new, old in enumerate(keep)}
+                    exact = {question_key: position[i] for question_key, i in exact.items() if i in position}
+                    matrix, results = matrix[keep], [results[i] for i in keep]
+                    created, ids = [created[i] for i in keep], [ids[i] for i in keep]
+
+                matrix = np.vstack([matrix, embedding]) if results else embedding.reshape(1, -1)
+                exact[key] = len(results)
+                self._vectors[database_id] = (matrix, results + [result.model_copy(deep=True)])
+                self._created[database_id] = created + [time.time()]
+                self._ids[database_id] = ids + [row_id]
+                self._exact[database_id] = exact
+
+                logger.info("Cached SQL result for database: %s", database_id)
+                return True
+
+            except Exception as e:
+                logger.error("Error writing semantic cache: %s", e)
+                return False
+
+    def stats(self) -> Dict[str, Any]:
+        """Lookup counters (semantic lookups only) and the thresholds tuned per database."""
+        # Without the lock, so it never waits for a write; the values are a snapshot
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "threshold": self.max_threshold,
+            "thresholds": dict(self._thresholds),
+            "entries": sum(len(results) for _, results in list(self._vectors.values()))
+        }
+
+    def invalidate(self, database_id: str) -> bool:
+        """Drop all cached results for a database (e.g. after re-indexing)."""
+        with self._lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+
+                cursor.execute("DELETE FROM semantic_cache WHERE database_id = ?", (database_id,))
+
+                conn.commit()
+                conn.close()
+
+                self._vectors.pop(database_id, None)
+                self._created.pop(database_id, None)
+                self._ids.pop(database_id, None)
+                self._exact.pop(database_id, None)
+                logger.info("Invalidated semantic cache for database: %s", database_id)
+                return True
+
+            except Exception as e:
+                logger.error("Error invalidating semantic cache: %s", e)
+                return False
@@ -0,0 +1,184 @@
+"""
+Rule-based SQL repair.
+Fixes shallow query errors (misspelled table or column names, ambiguous
+columns) against the known schema, so they don't need an LLM fix round-trip.
+"""
+
+import difflib
+import logging
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.scope import traverse_scope
+
+from services.sql_validator import SQLValidator
+
+logger = logging.getLogger(__name__)
+
+
+# Minimum similarity for a schema name to replace a misspelled one
+MATCH_CUTOFF = 0.8
+
+UNKNOWN_COLUMN_PATTERN = re.compile(r"Unknown column '([^']+)' in", re.IGNORECASE)
+UNKNOWN_TABLE_PATTERN = re.compile(r"Table '([^']+)' doesn't exist", re.IGNORECASE)
+AMBIGUOUS_COLUMN_PATTERN = re.compile(r"Column '([^']+)' in .* is ambiguous", re.IGNORECASE)
+
+
+def _closest(name: str, candidates: Set[str]) -> Optional[str]:
+    """Find the schema name closest to a misspelled one (case-insensitive)."""
+    by_lower = {candidate.lower(): candidate for candidate in candidates}
+    matches = difflib.get_close_matches(name.lower(), by_lower, n=1, cutoff=MATCH_CUTOFF)
+    return by_lower[matches[0]] if matches else None
+
+
+def _rename(identifier_owner: exp.Expression, new_name: str):
+    """Rename a column or table node, keeping its quoting."""
+    identifier = identifier_owner.this
+    quoted = isinstance(identifier, exp.Identifier) and identifier.quoted
+    identifier_owner.set("this", exp.Identifier(this=new_name, quoted=quoted))
+
+
+def _scopes(tree: exp.Expression) -> List[Tuple[Dict[str, str], List[exp.Column]]]:
+    """
+    Split a query into its scopes (main query, subqueries, CTEs, union branches).
+
+    Each scope comes with its table references (alias or name -> table name, in
+    query order) and the columns written directly in it, so a fix never
+    qualifies an inner column with an outer table or the other way around.
+    """
+    scopes = []
+    for scope in traverse_scope(tree):
+        tables = {
+            reference: source.name for reference, source in scope.sources.items()
+            if isinstance(source, exp.Table)
+        }
+        columns = [column for column in scope.columns if column.find_ancestor(exp.Select) is scope.expression]
+        columns += _order_columns(scope.expression, columns)
+        scopes.append((tables, columns))
+    return scopes
+
+
+def _order_columns(select: exp.Expression, known: List[exp.Column]) -> List[exp.Column]:
+    """
+    ORDER BY columns of a SELECT that the scope leaves out.
+
+    Scope columns skip ORDER BY names that match a projection, but unless that
+    projection is an alias they still name a table column and need the same fix.
+    """
+    order = select.args.get("order") if isinstance(select, exp.Select) else None
+    if order is None:
+        return []
+    aliases = {projection.alias for projection in select.selects if isinstance(projection, exp.Alias)}
+    known_ids = {id(column) for column in known}
+    return [
+        column for column in order.find_all(exp.Column)
+        if id(column) not in known_ids
+        and column.find_ancestor(exp.Select) is select
+        and (column.table or column.name not in aliases)
+    ]
+
+
+def _fix_unknown_column(tree: exp.Expression, bad_name: str, schema: Dict[str, Set[str]]) -> bool:
+    """Replace a misspelled column with the closest column of its table, scope by scope."""
+    qualifier, _, column_name = bad_name.rpartition(".")
+    fixed = False
+    for tables, columns in _scopes(tree):
+        columns = [
+            column for column in columns
+            if column.name == column_name and (not qualifier or column.table == qualifier)
+        ]
+        if not columns:
+            continue
+
+        if qualifier:
+            candidates = schema.get(tables.get(qualifier, qualifier), set())
+        else:
+            candidates = set().union(*(schema.get(table, set()) for table in tables.values()))
+
+        replacement = _closest(column_name, candidates)
+        if not replacement or replacement == column_name:
+            continue
+        for column in columns:
+            _rename(column, replacement)
+        fixed = True
+    return fixed
+
+
+def _fix_unknown_table(tree: exp.Expression, bad_name: str, schema: Dict[str, Set[str]]) -> bool:
+    """Replace a misspelled table with the closest known table."""
+    table_name = bad_name.rpartition(".")[2]
+    replacement = _closest(table_name, set(schema))
+    if not replacement or replacement == table_name:
+        return False
+
+    tables = [table for table in tree.find_all(exp.Table) if table.name == table_name]
+    for table in tables:
+        _rename(table, replacement)
+    return bool(tables)
+
+
+def _fix_ambiguous_column(tree: exp.Expression, column_name: str, schema: Dict[str, Set[str]]) -> bool:
+    """Qualify an ambiguous column with the first table of its scope that has it."""
+    fixed = False
+    for tables, columns in _scopes(tree):
+        columns = [column for column in columns if column.name == column_name and not column.table]
+        owner = next(
+            (reference for reference, table in tables.items() if column_name in schema.get(table, set())),
+            None
+        )
+        if not columns or owner is None:
+            continue
+        for column in columns:
+            column.set("table", exp.Identifier(this=owner, quoted=False))
+        fixed = True
+    return fixed
+
+
+# (error pattern, handler) in the order they are tried
+_HANDLERS = [
+    (UNKNOWN_COLUMN_PATTERN, _fix_unknown_column),
+    (UNKNOWN_TABLE_PATTERN, _fix_unknown_table),
+    (AMBIGUOUS_COLUMN_PATTERN, _fix_ambiguous_column),
+]
+
+
+def autofix(failed_sql: str, error_message: str, schema: Dict[str, Set[str]]) -> Optional[str]:
+    """
+    Repair a failed query without the LLM.
+
+    Args:
+        failed_sql: The SQL query that failed
+        error_message: The error message from the database
+        schema: Known table -> column names (see sql_compiler.schema_from_documents)
+
+    Returns:
+        The repaired SQL, or None if no rule applies
+    """
+    if not schema or not error_message:
+        return None
+
+    for pattern, handler in _HANDLERS:
+        match = pattern.search(error_message)
+        if not match:
+            continue
+
+        try:
+            tree = sqlglot.parse_one(failed_sql, read="mysql")
+            if not handler(tree, match.group(1), schema):
+                return None
+            fixed_sql = tree.sql(dialect="mysql") + ";"
+        except SqlglotError as e:
+            logger.debug("SQL autofix could not parse query: %s", e)
+            return None
+
+        is_valid, _ = SQLValidator.validate(fixed_sql)
+        if not is_valid or fixed_sql == failed_sql:
+            return None
+
+        logger.info("Repaired SQL without the LLM: %.100s...", fixed_sql)
+        return fixed_sql
+
+    return None
@@ -0,0 +1,161 @@
+"""
+Deterministic SQL explanations.
+Describes simple SELECT queries from their syntax tree, so the explanation step
+only needs the LLM for complex queries.
+"""
+
+import logging
+from typing import List, Optional
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+logger = logging.getLogger(__name__)
+
+
+# Queries with more joins or filter conditions than this are left to the LLM
+MAX_JOINS = 3
+MAX_CONDITIONS = 4
+
+# Constructs whose meaning a template can't describe well
+COMPLEX_NODES = (exp.Subquery, exp.Window, exp.Case, exp.Union, exp.Intersect, exp.Except, exp.With)
+
+# Query and join parts the explanation covers; anything else is left to the LLM
+DESCRIBED_ARGS = frozenset({
+    "expressions", "from", "from_", "joins", "where", "group", "having", "order", "limit", "offset", "distinct"
+})
+DESCRIBED_JOIN_ARGS = frozenset({"this", "side", "kind", "on", "using"})
+
+
+def _unquote(node: exp.Expression) -> exp.Expression:
+    """Drop identifier quoting so rendered names read naturally."""
+    if isinstance(node, exp.Identifier) and node.quoted:
+        return exp.Identifier(this=node.this, quoted=False)
+    return node
+
+
+def _render(node: exp.Expression) -> str:
+    """Render an expression as MySQL text."""
+    return node.sql(dialect="mysql")
+
+
+def _join_list(items: List[str]) -> str:
+    """Join items as 'a', 'a and b' or 'a, b and c'."""
+    if len(items) <= 1:
+        return "".join(items)
+    return ", ".join(items[:-1]) + " and " + items[-1]
+
+
+def _conditions(predicate: exp.Expression) -> List[exp.Expression]:
+    """Split a predicate into its top-level AND conditions."""
+    if isinstance(predicate, exp.And):
+        return _conditions(predicate.this) + _conditions(predicate.expression)
+    return [predicate]
+
+
+def explain_sql(sql: str) -> Optional[str]:
+    """
+    Explain a simple SELECT query without the LLM.
+
+    Args:
+        sql: SQL query to explain
+
+    Returns:
+        Explanation of what the query selects, filters, groups, sorts and
+        limits, or None if the query can't be parsed or is too complex
+    """
+    try:
+        tree = sqlglot.parse_one(sql, read="mysql")
+    except SqlglotError as e:
+        logger.debug("SQL explainer could not parse query: %s", e)
+        return None
+
+    if not isinstance(tree, exp.Select) or tree.find(*COMPLEX_NODES):
+        return None
+    if any(value for arg, value in tree.args.items() if arg not in DESCRIBED_ARGS):
+        return None
+    if tree.args.get("distinct") and tree.args["distinct"].args.get("on"):
+        return None
+    if any(select is not tree for select in tree.find_all(exp.Select)):
+        return None
+
+    tree = tree.transform(_unquote)
+    from_clause = tree.args.get("from_") or tree.args.get("from")
+    joins = tree.args.get("joins") or []
+    where = tree.args.get("where")
+    if not isinstance(from_clause and from_clause.this, exp.Table) or len(joins) > MAX_JOINS:
+        return None
+    if where and len(_conditions(where.this)) > MAX_CONDITIONS:
+        return None
+
+    # What is selected, from where
+    columns = [
+        "all columns" if isinstance(column, exp.Star)
+        else f"{_render(column.this)} (as {column.alias})" if isinstance(column, exp.Alias)
+        else _render(column)
+        for column in tree.expressions
+    ]
+    distinct = "the distinct values of " if tree.args.get("distinct") else ""
+    sentence = f"This query selects {distinct}{_join_list(columns)} from the {from_clause.this.name} table"
+
+    linked = []
+    for join in joins:
+        if not isinstance(join.this, exp.Table):
+            return None
+        if any(value for arg, value in join.args.items() if arg not in DESCRIBED_JOIN_ARGS):
+            return None
+        join_type = " ".join(part.lower() for part in (join.args.get("side"), join.args.get("kind")) if part)
+        details = [f"{join_type} join"] if join_type else []
+        if join.args.get("on"):
+            details.append(f"on {_render(join.args['on'])}")
+        if join.args.get("using"):
+            details.append(f"using {_join_list([_render(column) for column in join.args['using']])}")
+        link = f"{join.this.name}"
+        if details:
+            link += f" ({' '.join(details)})"
+        linked.append(link)
+    if linked:
+        sentence += f", joined with {_join_list(linked)}"
+    sentences = [sentence + "."]
+
+    # Which rows are kept
+    if where:
+        sentences.append(f"It only includes rows where {_join_list([_render(c) for c in _conditions(where.this)])}.")
+
+    group = tree.args.get("group")
+    having = tree.args.get("having")
+    if group:
+        sentence = f"Results are grouped by {_join_list([_render(e) for e in group.expressions])}"
+        if having:
+            sentence += f", keeping only groups where {_render(having.this)}"
+        sentences.append(sentence + ".")
+    elif having:
+        sentences.append(f"Only results where {_render(having.this)} are kept.")
+
+    # How rows are returned
+    order = tree.args.get("order")
+    limit = tree.args.get("limit")
+    limit_value = limit and (limit.args.get("expression") or limit.this)
+    offset = tree.args.get("offset")
+    offset_value = offset and (offset.args.get("expression") or offset.this)
+    skipped = f" after skipping the first {_render(offset_value)}" if offset_value else ""
+    if order:
+        keys = [
+            f"{_render(key.this)} {'descending' if key.args.get('desc') else 'ascending'}"
+            for key in order.expressions
+        ]
+        sentence = f"The results are sorted by {_join_list(keys)}"
+        if limit_value and skipped:
+            sentence += f" and limited to {_render(limit_value)} rows{skipped}"
+        elif limit_value:
+            sentence += f" and limited to the first {_render(limit_value)} rows"
+        elif skipped:
+            sentence += f", skipping the first {_render(offset_value)} rows"
+        sentences.append(sentence + ".")
+    elif limit_value:
+        sentences.append(f"At most {_render(limit_value)} rows are returned{skipped}.")
+    elif skipped:
+        sentences.append(f"The first {_render(offset_value)} rows are skipped.")
+
+    return " ".join(sentences)
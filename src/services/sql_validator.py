@@ -6,7 +6,8 @@ It blocks any destructive operations like INSERT, UPDATE, DELETE, DROP, etc.
 """
 
 import re
-from typing import Tuple, List
+from functools import lru_cache
+from typing import Tuple, List, Optional
 from enum import Enum
 
 
@@ -31,17 +32,17 @@ class SQLValidator:
     """
     
     # Allowed query types (read-only operations)
-    ALLOWED_STATEMENTS = {
+    ALLOWED_STATEMENTS = frozenset({
         'SELECT',
         'SHOW',
         'DESCRIBE',
         'DESC',
         'EXPLAIN',
         'WITH'  # Common Table Expressions with SELECT
-    }
+    })
     
     # Forbidden query types (write/destructive operations)
-    FORBIDDEN_STATEMENTS = {
+    FORBIDDEN_STATEMENTS = frozenset({
         'INSERT',
         'UPDATE',
         'DELETE',
@@ -64,7 +65,7 @@ class SQLValidator:
         'ROLLBACK',
         'SAVEPOINT',
         'USE'
-    }
+    })
     
     # Dangerous SQL patterns that might bypass basic checks
     DANGEROUS_PATTERNS = [
@@ -76,6 +77,37 @@ class SQLValidator:
         r'/\*.*?\*/',  # Block comments
     ]
     
+    # All dangerous patterns as one alternation, so the query is scanned once;
+    # the name of the matching group (p<index>) tells which pattern matched
+    DANGEROUS_PATTERN = re.compile(
+        '|'.join(f'(?P<p{i}>{pattern})' for i, pattern in enumerate(DANGEROUS_PATTERNS)),
+        re.IGNORECASE | re.DOTALL
+    )
+    
+    # First whitespace-delimited word, read without copying the whole query
+    FIRST_WORD_PATTERN = re.compile(r'\s*(\S*)')
+    
+    # Checks of WITH queries
+    SELECT_PATTERN = re.compile(r'\bSELECT\b', re.IGNORECASE)
+    FORBIDDEN_WORD_PATTERN = re.compile(r'\b(' + '|'.join(sorted(FORBIDDEN_STATEMENTS)) + r')\b', re.IGNORECASE)
+    
+    # Comments removed by sanitize_query
+    LINE_COMMENT_PATTERN = re.compile(r'--.*$', re.MULTILINE)
+    BLOCK_COMMENT_PATTERN = re.compile(r'/\*.*?\*/', re.DOTALL)
+    
+    # Write statements that abort SQL generation as soon as they are streamed
+    STREAMING_FORBIDDEN_PATTERN = re.compile(r'\b(INSERT|UPDATE|DELETE|DROP|TRUNCATE|ALTER)\b', re.IGNORECASE)
+    
+    # Markdown code fences around generated SQL
+    MARKDOWN_FENCE_PATTERN = re.compile(r'```(?:sql)?', re.IGNORECASE)
+    
+    # Quoted strings and identifiers, which may contain these words harmlessly
+    QUOTED_PATTERN = re.compile(r"'[^']*'|\"[^\"]*\"|`[^`]*`")
+    
+    # Start of a quoted string left open by a partial query, and its last word
+    OPEN_QUOTE_PATTERN = re.compile(r"['\"`]")
+    TRAILING_WORD_PATTERN = re.compile(r'\w+$')
+    
     @classmethod
     def validate(cls, query: str) -> Tuple[bool, str]:
         """
@@ -92,20 +124,16 @@ class SQLValidator:
         Raises:
             SQLValidationError: If the query is not safe to execute
         """
-        if not query or not query.strip():
+        return _validate_cached(query)
+    
+    @classmethod
+    def _validate(cls, query: str) -> Tuple[bool, str]:
+        """Validate a query (uncached, see validate)."""
+        if not query or query.isspace():
             return False, "Empty query provided"
         
-        # Normalize query: remove extra whitespace and convert to uppercase for checking
-        normalized_query = ' '.join(query.strip().split()).upper()
-        
-        # Check for dangerous patterns
-        for pattern in cls.DANGEROUS_PATTERNS:
-            if re.search(pattern, query, re.IGNORECASE | re.DOTALL):
-                error = f"Query contains forbidden pattern: {pattern}"
-                return False, error
-        
         # Extract the first statement type
-        first_word = normalized_query.split()[0] if normalized_query else ""
+        first_word = cls._first_word(query)
         
         # Check if it's a forbidden statement
         if first_word in cls.FORBIDDEN_STATEMENTS:
@@ -117,24 +145,59 @@ class SQLValidator:
             error = f"Unknown or unsupported query type '{first_word}'. Only SELECT and discovery queries are permitted."
             return False, error
         
+        # Check for multiple statements (basic check)
+        if ';' in query.rstrip(';'):  # Allow single trailing semicolon
+            error = "Multiple statements are not allowed"
+            return False, error
+        
+        # Check for dangerous patterns (only once the cheap checks passed)
+        match = cls.DANGEROUS_PATTERN.search(query)
+        if match:
+            pattern = cls.DANGEROUS_PATTERNS[int(match.lastgroup[1:])]
+            error = f"Query contains forbidden pattern: {pattern}"
+            return False, error
+        
         # Additional check: if it's a WITH clause, ensure it's followed by SELECT
         if first_word == 'WITH':
-            if not re.search(r'\bSELECT\b', normalized_query):
+            if not cls.SELECT_PATTERN.search(query):
                 error = "WITH clause must be followed by a SELECT statement"
                 return False, error
             # Check that no forbidden statements appear after WITH
-            for forbidden in cls.FORBIDDEN_STATEMENTS:
-                if re.search(rf'\b{forbidden}\b', normalized_query):
-                    error = f"WITH clause contains forbidden statement: {forbidden}"
-                    return False, error
-        
-        # Check for multiple statements (basic check)
-        if ';' in query.rstrip(';'):  # Allow single trailing semicolon
-            error = "Multiple statements are not allowed"
-            return False, error
+            match = cls.FORBIDDEN_WORD_PATTERN.search(query)
+            if match:
+                error = f"WITH clause contains forbidden statement: {match.group(1).upper()}"
+                return False, error
         
         return True, ""
     
+    @classmethod
+    def _first_word(cls, query: str) -> str:
+        """First word of a query, uppercased."""
+        return cls.FIRST_WORD_PATTERN.match(query).group(1).upper()
+    
+    @classmethod
+    def find_forbidden_keyword(cls, partial_query: str) -> Optional[str]:
+        """
+        Scan a partially generated query for write statements.
+        
+        Cheap enough to run on every streamed chunk; the full validation still
+        runs once the query is complete.
+        
+        Args:
+            partial_query: Query text generated so far
+            
+        Returns:
+            The first forbidden keyword outside quotes, or None
+        """
+        unquoted = cls.MARKDOWN_FENCE_PATTERN.sub(" ", partial_query)
+        unquoted = cls.QUOTED_PATTERN.sub(" ", unquoted)
+        # Drop a quoted string still open at the end of the stream, and the last
+        # word, which may continue in the next chunk
+        unquoted = cls.OPEN_QUOTE_PATTERN.split(unquoted, maxsplit=1)[0]
+        unquoted = cls.TRAILING_WORD_PATTERN.sub('', unquoted)
+        match = cls.STREAMING_FORBIDDEN_PATTERN.search(unquoted)
+        return match.group(1).upper() if match else None
+    
     @classmethod
     def validate_and_raise(cls, query: str) -> None:
         """
@@ -161,11 +224,15 @@ class SQLValidator:
         Returns:
             QueryType enum value
         """
+        return _get_query_type_cached(query)
+    
+    @classmethod
+    def _get_query_type(cls, query: str) -> QueryType:
+        """Determine the type of a query (uncached, see get_query_type)."""
         if not query or not query.strip():
             return QueryType.UNSAFE
         
-        normalized_query = query.strip().upper()
-        first_word = normalized_query.split()[0] if normalized_query else ""
+        first_word = cls._first_word(query)
         
         if first_word in cls.FORBIDDEN_STATEMENTS:
             return QueryType.UNSAFE
@@ -192,8 +259,8 @@ class SQLValidator:
             Sanitized query string
         """
         # Remove SQL comments
-        query = re.sub(r'--.*$', '', query, flags=re.MULTILINE)
-        query = re.sub(r'/\*.*?\*/', '', query, flags=re.DOTALL)
+        query = cls.LINE_COMMENT_PATTERN.sub('', query)
+        query = cls.BLOCK_COMMENT_PATTERN.sub('', query)
         
         # Remove extra whitespace
         query = ' '.join(query.split())
@@ -215,6 +282,18 @@ class SQLValidator:
         return is_valid
 
 
+# Validation is pure, and the same queries come back often (dashboard
+# refreshes, retried generations), so results are cached per query
+@lru_cache(maxsize=2048)
+def _validate_cached(query: str) -> Tuple[bool, str]:
+    return SQLValidator._validate(query)
+
+
+@lru_cache(maxsize=2048)
+def _get_query_type_cached(query: str) -> QueryType:
+    return SQLValidator._get_query_type(query)
+
+
 # Convenience function for quick validation
 def validate_sql_query(query: str) -> Tuple[bool, str]:
     """
@@ -0,0 +1,124 @@
+"""
+Tests for the rule-based SQL repair (services.sql_autofix).
+Run from the repository root: python -m unittest discover -s tests
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+# The services import each other as top-level modules, as when run from src/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from services.sql_autofix import autofix  # noqa: E402
+
+
+SCHEMA = {
+    "users": {"id", "name", "email", "team_id"},
+    "teams": {"id", "name"},
+    "orders": {"id", "user_id", "total"},
+}
+
+
+class UnknownColumnTest(unittest.TestCase):
+    def test_renames_misspelled_column(self):
+        self.assertEqual(
+            autofix("SELECT emial FROM users", "Unknown column 'emial' in 'field list'", SCHEMA),
+            "SELECT email FROM users;"
+        )
+
+    def test_renames_order_by_reference_to_projection(self):
+        self.assertEqual(
+            autofix(
+                "SELECT nme FROM users WHERE nme = 'x' ORDER BY nme",
+                "Unknown column 'nme' in 'field list'",
+                SCHEMA
+            ),
+            "SELECT name FROM users WHERE name = 'x' ORDER BY name;"
+        )
+
+    def test_renames_order_by_reference_with_group_by(self):
+        self.assertEqual(
+            autofix(
+                "SELECT nme, COUNT(*) AS c FROM users GROUP BY nme ORDER BY nme",
+                "Unknown column 'nme' in 'field list'",
+                SCHEMA
+            ),
+            "SELECT name, COUNT(*) AS c FROM users GROUP BY name ORDER BY name;"
+        )
+
+    def test_keeps_order_by_alias(self):
+        self.assertIsNone(
+            autofix("SELECT name AS nme FROM users ORDER BY nme", "Unknown column 'nme' in 'order clause'", SCHEMA)
+        )
+
+    def test_uses_qualifier_table(self):
+        self.assertEqual(
+            autofix(
+                "SELECT u.nme FROM users AS u JOIN orders AS o ON o.user_id = u.id",
+                "Unknown column 'u.nme' in 'field list'",
+                SCHEMA
+            ),
+            "SELECT u.name FROM users AS u JOIN orders AS o ON o.user_id = u.id;"
+        )
+
+    def test_resolves_subquery_columns_in_their_own_scope(self):
+        # totl is only fixable against orders, the subquery's table, not users
+        self.assertEqual(
+            autofix(
+                "SELECT name FROM users WHERE id IN (SELECT user_id FROM orders WHERE totl > 10)",
+                "Unknown column 'totl' in 'where clause'",
+                SCHEMA
+            ),
+            "SELECT name FROM users WHERE id IN (SELECT user_id FROM orders WHERE total > 10);"
+        )
+
+    def test_no_close_match(self):
+        self.assertIsNone(autofix("SELECT zzz FROM users", "Unknown column 'zzz' in 'field list'", SCHEMA))
+
+
+class UnknownTableTest(unittest.TestCase):
+    def test_renames_misspelled_table(self):
+        self.assertEqual(
+            autofix("SELECT id FROM usres", "Table 'shop.usres' doesn't exist", SCHEMA),
+            "SELECT id FROM users;"
+        )
+
+    def test_no_close_match(self):
+        self.assertIsNone(autofix("SELECT id FROM invoices", "Table 'shop.invoices' doesn't exist", SCHEMA))
+
+
+class AmbiguousColumnTest(unittest.TestCase):
+    def test_qualifies_with_first_table_of_scope(self):
+        self.assertEqual(
+            autofix(
+                "SELECT name FROM users AS u JOIN teams AS t ON u.team_id = t.id ORDER BY name",
+                "Column 'name' in field list is ambiguous",
+                SCHEMA
+            ),
+            "SELECT u.name FROM users AS u JOIN teams AS t ON u.team_id = t.id ORDER BY u.name;"
+        )
+
+    def test_leaves_subquery_columns_to_their_scope(self):
+        self.assertEqual(
+            autofix(
+                "SELECT name FROM users AS u JOIN teams AS t ON u.team_id = t.id "
+                "WHERE u.id IN (SELECT user_id FROM orders WHERE id > 1)",
+                "Column 'name' in field list is ambiguous",
+                SCHEMA
+            ),
+            "SELECT u.name FROM users AS u JOIN teams AS t ON u.team_id = t.id "
+            "WHERE u.id IN (SELECT user_id FROM orders WHERE id > 1);"
+        )
+
+
+class AutofixTest(unittest.TestCase):
+    def test_unrelated_error(self):
+        self.assertIsNone(autofix("SELECT id FROM users", "Lock wait timeout exceeded", SCHEMA))
+
+    def test_without_schema(self):
+        self.assertIsNone(autofix("SELECT emial FROM users", "Unknown column 'emial' in 'field list'", {}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,6 +6,13 @@ import { vscDarkPlus } from 'react-syntax-highlighter/dist/esm/styles/prism'
 import ReactMarkdown from 'react-markdown'
 import './QueryInterface.css'
 
+// Decode a complete_z event payload (base64 gzipped JSON)
+const inflateEvent = async (encoded) => {
+  const bytes = Uint8Array.from(atob(encoded), c => c.charCodeAt(0))
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'))
+  return JSON.parse(await new Response(stream).text())
+}
+
 function QueryInterface({ apiConfig }) {
   const [question, setQuestion] = useState('')
   const [databaseId, setDatabaseId] = useState('')
@@ -97,10 +104,30 @@ function QueryInterface({ apiConfig }) {
           
           if (line.startsWith('data:')) {
             try {
-              const data = JSON.parse(line.substring(5).trim())
+              let data = JSON.parse(line.substring(5).trim())
+              if (currentEvent === 'complete_z') {
+                // Large final result, sent compressed
+                data = await inflateEvent(data)
+              }
             
               // Handle different event types
-              if (data.step) {
+              if (currentEvent === 'sql_chunk') {
+                // Streaming SQL (replaced by the cleaned query on sql_generated)
+                setResult(prev => ({ ...(prev || {}), sql: (prev?.sql || '') + data.chunk }))
+              } else if (currentEvent === 'explanation_chunk') {
+                // Streaming query explanation (replaced by the full text on explanation_complete)
+                setResult(prev => ({
+                  ...(prev || {}),
+                  sql_explanation: (prev?.sql_explanation || '') + data.chunk
+                }))
+              } else if (currentEvent === 'answer_chunk') {
+                // Streaming natural language answer
+                setResult(prev => ({
+                  ...(prev || {}),
+                  natural_language_answer: (prev?.natural_language_answer || '') + data.chunk
+                }))
+                setCurrentStep('')
+              } else if (data.step) {
                 setCurrentStep(data.message || data.step)
               } else if (data.chunk) {
                 // Streaming reasoning